@@ -0,0 +1,495 @@
+"""
+Offline micro-benchmarks for VehicleDetector and sumo_parser.
+
+Runs on synthetic inputs (frames with a controllable number of boxes and
+generated SUMO networks of controllable size) and prints a JSON report with
+throughput, p50/p95/p99 latency and peak traced memory per case.
+
+    python benchmark.py                       # default suite
+    python benchmark.py --boxes 10 80 --grid 5 20 --output run.json
+    python benchmark.py --compare baseline.json --tolerance 0.15
+    python benchmark.py --real-model          # use yolov8n.pt instead of synthetic boxes
+    python benchmark.py --only backends --backends torch onnx onnx-int8 openvino-int8
+                                              # fps + accuracy drift of each runtime vs torch
+    python benchmark.py --only processes --processes 1 8 16 32
+                                              # fps of the multi-process inference pool per size
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import sumo_parser
+from detector import VehicleDetector
+from traffic_logic import TrafficController
+from spatial import pairwise_iou
+
+COCO_VEHICLES = {2: "car", 3: "motorcycle", 5: "bus", 7: "truck", 9: "traffic light", 0: "person"}
+
+
+# =========================
+# Synthetic inputs
+# =========================
+
+class SyntheticEngine:
+    """
+    Stands in for InferenceEngine: returns `box_count` boxes per frame that
+    drift a few pixels each call, so tracking sees stable, moving vehicles.
+    """
+
+    def __init__(self, box_count, width=1280, height=720, seed=0):
+        rng = np.random.default_rng(seed)
+        self.names = {i: COCO_VEHICLES.get(i, f"class_{i}") for i in range(80)}
+        self.workers = 1
+        w = rng.integers(40, 220, box_count)
+        h = rng.integers(40, 160, box_count)
+        x = rng.integers(0, max(1, width - 220), box_count)
+        y = rng.integers(height // 3, max(height // 3 + 1, height - 160), box_count)
+        self.boxes = np.stack([x, y, x + w, y + h], axis=1).astype(np.float32)
+        self.velocity = rng.normal(0, 3, (box_count, 2)).astype(np.float32)
+        self.conf = rng.uniform(0.5, 0.95, box_count).astype(np.float32)
+        self.cls = rng.choice([2, 2, 2, 3, 5, 7], box_count).astype(np.float32)
+        self.width, self.height = width, height
+
+    def predict(self, frame, conf=0.45, imgsz=None):
+        xs, ys = self.boxes[:, 0::2], self.boxes[:, 1::2]  # views on x1/x2 and y1/y2
+        xs += self.velocity[:, :1]
+        ys += self.velocity[:, 1:]
+        np.clip(xs, 0, self.width - 1, out=xs)
+        np.clip(ys, 0, self.height - 1, out=ys)
+        return np.hstack([self.boxes, self.conf[:, None], self.cls[:, None]])
+
+
+def synthetic_frame(width=1280, height=720, seed=0):
+    """Road-like frame: smooth gradient + noise + a few bright/orange blobs."""
+    rng = np.random.default_rng(seed)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame[:] = np.linspace(60, 140, height, dtype=np.uint8)[:, None, None]
+    noise = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    frame = cv2.add(frame, noise)
+    for _ in range(6):
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.circle(frame, (cx, cy), int(rng.integers(10, 60)), (0, 140, 255), -1)
+    return frame
+
+
+def synthetic_detections(box_count, width=1280, height=720, seed=0):
+    engine = SyntheticEngine(box_count, width, height, seed)
+    dets = []
+    rng = np.random.default_rng(seed + 1)
+    for k, (box, cls) in enumerate(zip(engine.boxes, engine.cls)):
+        dets.append({
+            "bbox": [int(v) for v in box],
+            "class": engine.names[int(cls)],
+            "confidence": 0.8,
+            "cls_id": int(cls),
+            "track_id": k,
+            "speed": float(rng.uniform(0, 12)),
+            "damage_checked": None,
+        })
+    return dets
+
+
+def generate_sumo_network(out_dir, grid, flows_per_junction=2, vehicles=200):
+    """
+    Writes a grid x grid traffic-light network plus a route file; returns (net_path, rou_path).
+    """
+    spacing = 100.0
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<net>",
+             f'  <location convBoundary="0.00,0.00,{spacing * (grid - 1):.2f},{spacing * (grid - 1):.2f}"/>']
+    edges = []
+    for i in range(grid):
+        for j in range(grid):
+            for di, dj, tag in ((1, 0, "E"), (0, 1, "N")):
+                ni, nj = i + di, j + dj
+                if ni >= grid or nj >= grid:
+                    continue
+                eid = f"e{i}_{j}_{tag}"
+                x1, y1, x2, y2 = i * spacing, j * spacing, ni * spacing, nj * spacing
+                edges.append((eid, f"J{ni}_{nj}"))
+                lines.append(f'  <edge id="{eid}" from="J{i}_{j}" to="J{ni}_{nj}">')
+                lines.append(f'    <lane id="{eid}_0" index="0" speed="13.89" length="{spacing}" '
+                             f'shape="{x1:.2f},{y1:.2f} {x2:.2f},{y2:.2f}"/>')
+                lines.append("  </edge>")
+    incoming = {}
+    for eid, to in edges:
+        incoming.setdefault(to, []).append(f"{eid}_0")
+    for i in range(grid):
+        for j in range(grid):
+            jid = f"J{i}_{j}"
+            inc = " ".join(incoming.get(jid, []))
+            lines.append(f'  <junction id="{jid}" type="traffic_light" x="{i * spacing:.2f}" '
+                         f'y="{j * spacing:.2f}" incLanes="{inc}"/>')
+    lines.append("</net>")
+    net_path = os.path.join(out_dir, "bench.net.xml")
+    with open(net_path, "w") as f:
+        f.write("\n".join(lines))
+
+    rng = np.random.default_rng(grid)
+    rou = ['<?xml version="1.0" encoding="UTF-8"?>', "<routes>"]
+    edge_ids = [e for e, _ in edges] or ["e0"]
+    for k in range(grid * grid * flows_per_junction):
+        route = " ".join(rng.choice(edge_ids, 2))
+        vtype = rng.choice(["car", "car", "bus", "truck", "motorcycle"])
+        rou.append(f'  <route id="r{k}" edges="{route}"/>')
+        rou.append(f'  <flow id="f{k}" type="{vtype}" route="r{k}" begin="0" end="3600" number="{int(rng.integers(10, 200))}"/>')
+    for k in range(vehicles):
+        rou.append(f'  <vehicle id="v{k}" type="car" depart="{k * 1.5:.1f}" route="r{k % max(1, grid * grid)}"/>')
+    rou.append("</routes>")
+    rou_path = os.path.join(out_dir, "bench.rou.xml")
+    with open(rou_path, "w") as f:
+        f.write("\n".join(rou))
+    return net_path, rou_path
+
+
+# =========================
+# Measurement
+# =========================
+
+def measure(name, fn, iterations, warmup=3, params=None):
+    """Runs fn() `iterations` times and returns latency percentiles, throughput and peak memory."""
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    # Separate traced run: tracemalloc would otherwise distort the latencies
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = np.array(samples) * 1000.0
+    return {
+        "name": name,
+        "params": params or {},
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / elapsed, 2) if elapsed > 0 else None,
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "peak_mem_kb": round(peak / 1024.0, 1),
+    }
+
+
+def bench_detect(box_counts, iterations, real_model=False):
+    results = []
+    engine_cache = None
+    for n in box_counts:
+        for mode in ("static", "tracking"):
+            if real_model:
+                if engine_cache is None:
+                    from inference_engine import InferenceEngine
+                    engine_cache = InferenceEngine()
+                engine = engine_cache
+            else:
+                engine = SyntheticEngine(n)
+            det = VehicleDetector(engine=engine)
+            frame = synthetic_frame()
+            is_static = mode == "static"
+            # Consume the first-call static override so tracking mode really tracks
+            det.detect(frame.copy(), is_static=True)
+            results.append(measure(
+                f"detect[{mode}]", lambda: det.detect(frame.copy(), is_static=is_static),
+                iterations, params={"boxes": n, "real_model": real_model},
+            ))
+    return results
+
+
+def bench_collisions(box_counts, iterations):
+    results = []
+    det = VehicleDetector(engine=SyntheticEngine(1))
+    frame = synthetic_frame()
+    for n in box_counts:
+        for is_static in (False, True):
+            dets = synthetic_detections(n)
+            ids = np.array([d["track_id"] for d in dets])
+            rows, _ = det.tracks.slots_for(ids)
+            det.tracks.accel[rows] = np.where(ids % 7 == 0, -9.0, 0.0)
+
+            def run():
+                for d in dets:
+                    d["damage_checked"] = None
+                det.check_collisions(dets, frame, is_static=is_static)
+
+            results.append(measure(
+                f"check_collisions[{'static' if is_static else 'video'}]", run, iterations, params={"boxes": n},
+            ))
+    return results
+
+
+def bench_damage(iterations):
+    det = VehicleDetector(engine=SyntheticEngine(1))
+    frame = synthetic_frame()
+    results = []
+    for size in (64, 160, 400):
+        bbox = (200, 200, 200 + size, 200 + int(size * 0.7))
+        for label in ("car", "truck"):
+            results.append(measure(
+                f"is_damaged_or_rollover[{label}]",
+                lambda: det.is_damaged_or_rollover(frame, bbox, label, speed=0, is_static=True),
+                iterations, params={"roi_px": size},
+            ))
+    return results
+
+
+def bench_sumo(grids, iterations):
+    results = []
+    tmp = tempfile.mkdtemp(prefix="sumo_bench_")
+    try:
+        for g in grids:
+            net_path, rou_path = generate_sumo_network(tmp, g, vehicles=g * g * 4)
+            params = {"grid": g, "junctions": g * g}
+            results.append(measure("parse_sumo_network", lambda: sumo_parser.parse_sumo_network(net_path),
+                                   iterations, warmup=1, params=params))
+            results.append(measure("parse_sumo_routes", lambda: sumo_parser.parse_sumo_routes(rou_path),
+                                   iterations, warmup=1, params=params))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def bench_controller(junction_counts, iterations, approaches=4):
+    """
+    Signal planning over J junctions: one TrafficController.plan_batch control
+    tick, and Webster plans (single demand and a 5-scenario sweep).
+    """
+    controller = TrafficController()
+    rng = np.random.default_rng(0)
+    results = []
+    for n in junction_counts:
+        params = {"junctions": n, "approaches": approaches}
+        densities = rng.poisson(6, (n, approaches))
+        emergency = rng.random((n, approaches)) < 0.001
+        current = rng.integers(-1, approaches, n)
+        results.append(measure(
+            "plan_batch", lambda: controller.plan_batch(densities, emergency, current), iterations, params=params,
+        ))
+        demand = rng.uniform(100, 900, (n, approaches))
+        results.append(measure(
+            "webster_plan", lambda: sumo_parser.webster_plan(demand, 3600.0), iterations, params=params,
+        ))
+        results.append(measure(
+            "webster_sweep", lambda: sumo_parser.webster_sweep(demand, [0.5, 0.75, 1.0, 1.25, 1.5], 3600.0),
+            iterations, params=params,
+        ))
+    return results
+
+
+def match_boxes(reference, candidate, min_iou=0.5):
+    """
+    Greedy same-class IoU matching of two (N, 6) prediction arrays.
+    Returns (matched_pairs, ious, conf_deltas).
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, [], []
+    iou = pairwise_iou(np.vstack([reference[:, :4], candidate[:, :4]]))[:len(reference), len(reference):]
+    iou = np.where(reference[:, 5:6] == candidate[None, :, 5], iou, 0.0)
+    ious, deltas = [], []
+    for flat in np.argsort(-iou, axis=None):
+        r, c = np.unravel_index(flat, iou.shape)
+        if iou[r, c] < min_iou:
+            break
+        ious.append(float(iou[r, c]))
+        deltas.append(float(candidate[c, 4] - reference[r, 4]))
+        iou[r, :] = 0.0
+        iou[:, c] = 0.0
+    return len(ious), ious, deltas
+
+
+def bench_backends(specs, iterations, calibration_dir=None):
+    """
+    Runs the same stored frames through each backend ("torch", "onnx",
+    "onnx-int8", "openvino", "openvino-int8") and reports throughput plus
+    detection drift against the torch outputs.
+    """
+    from inference_backends import load_calibration_frames
+    from inference_engine import InferenceEngine
+
+    try:
+        frames = load_calibration_frames(calibration_dir, limit=max(iterations, 20))
+    except RuntimeError:
+        frames = [synthetic_frame(seed=i) for i in range(20)]
+
+    results = []
+    reference = None
+    for spec in ["torch"] + [s for s in specs if s != "torch"]:
+        backend, _, variant = spec.partition("-")
+        engine = InferenceEngine(backend=backend, int8=variant == "int8", workers=1, batch_window_ms=0)
+        if engine.backend != spec:
+            print(f"WARNING: {spec} unavailable (got {engine.backend}), skipping", flush=True)
+            engine.shutdown()
+            continue
+        outputs = [engine.predict(f) for f in frames]
+        stream = itertools.cycle(frames)
+        case = measure(f"predict[{spec}]", lambda: engine.predict(next(stream)),
+                       iterations, params={"backend": spec, "imgsz": engine.imgsz, "frames": len(frames)})
+        engine.shutdown()
+
+        if reference is None:
+            reference = (outputs, case)
+        else:
+            ref_outputs, ref_case = reference
+            matched, ious, deltas = 0, [], []
+            ref_total = sum(len(o) for o in ref_outputs)
+            total = sum(len(o) for o in outputs)
+            for ref, out in zip(ref_outputs, outputs):
+                m, i, d = match_boxes(ref, out)
+                matched += m
+                ious += i
+                deltas += d
+            case["speedup_vs_torch"] = round(ref_case["p50_ms"] / case["p50_ms"], 3) if case["p50_ms"] else None
+            case["drift"] = {
+                "recall_vs_torch": round(matched / ref_total, 4) if ref_total else None,
+                "precision_vs_torch": round(matched / total, 4) if total else None,
+                "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+                "mean_conf_delta": round(float(np.mean(deltas)), 4) if deltas else None,
+                "boxes": total,
+                "torch_boxes": ref_total,
+            }
+        if spec in specs:
+            results.append(case)
+    return results
+
+
+def bench_processes(process_counts, iterations, calibration_dir=None):
+    """
+    Frames/s of ProcessInferenceEngine for each pool size, with every process
+    kept busy, and the scaling efficiency relative to the smallest pool.
+    """
+    from inference_backends import load_calibration_frames
+    from process_engine import ProcessInferenceEngine
+
+    try:
+        frames = load_calibration_frames(calibration_dir, limit=20)
+    except RuntimeError:
+        frames = [synthetic_frame(seed=i) for i in range(20)]
+
+    results = []
+    base = None
+    for n in sorted(process_counts):
+        engine = ProcessInferenceEngine(processes=n)
+        stream = itertools.cycle(frames)
+        wave = 4 * n
+
+        def run():
+            for fut in [engine.submit(next(stream)) for _ in range(wave)]:
+                fut.result()
+
+        case = measure(f"predict_pool[{n}]", run, iterations, params={"processes": n, "imgsz": engine.imgsz})
+        engine.shutdown()
+        fps = case["throughput_per_s"] * wave
+        case["frames_per_s"] = round(fps, 2)
+        if base is None:
+            base = (n, fps)
+        case["scaling_efficiency"] = round(fps / (base[1] * n / base[0]), 3)
+        results.append(case)
+    return results
+
+
+# =========================
+# Reporting
+# =========================
+
+def case_key(case):
+    return case["name"] + json.dumps(case["params"], sort_keys=True)
+
+
+def compare(report, baseline_path, tolerance):
+    """Flags cases whose p50 regressed by more than `tolerance` vs a previous report."""
+    with open(baseline_path) as f:
+        baseline = {case_key(c): c for c in json.load(f)["results"]}
+    regressions = []
+    for case in report["results"]:
+        old = baseline.get(case_key(case))
+        if not old or not old["p50_ms"]:
+            continue
+        change = (case["p50_ms"] - old["p50_ms"]) / old["p50_ms"]
+        case["p50_change"] = round(change, 4)
+        if change > tolerance:
+            regressions.append({"case": case["name"], "params": case["params"],
+                                "baseline_p50_ms": old["p50_ms"], "p50_ms": case["p50_ms"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartWay AI engine micro-benchmarks")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[5, 20, 80], help="boxes per synthetic frame")
+    parser.add_argument("--grid", type=int, nargs="+", default=[4, 10, 20], help="SUMO grid side lengths")
+    parser.add_argument("--junctions", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="junction counts for the controller suite")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--only", nargs="+",
+                        choices=["detect", "collisions", "damage", "sumo", "controller", "backends", "processes"])
+    parser.add_argument("--real-model", action="store_true", help="run detect() through yolov8n.pt")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        help="runtimes compared by the backends suite")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4],
+                        help="inference pool sizes compared by the processes suite")
+    parser.add_argument("--frames-dir", help="stored frames for the backends suite (default: backend/uploads)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    # Keep OpenCV single-threaded so runs are comparable across machines
+    cv2.setNumThreads(1)
+    suites = set(args.only or ["detect", "collisions", "damage", "sumo", "controller"])
+
+    results = []
+    if "detect" in suites:
+        results += bench_detect(args.boxes, args.iterations, real_model=args.real_model)
+    if "collisions" in suites:
+        results += bench_collisions(args.boxes, args.iterations)
+    if "damage" in suites:
+        results += bench_damage(args.iterations)
+    if "sumo" in suites:
+        results += bench_sumo(args.grid, max(3, args.iterations // 10))
+    if "controller" in suites:
+        results += bench_controller(args.junctions, args.iterations)
+    # Needs the model weights and optional runtimes, so only runs when asked for
+    if args.only and "backends" in suites:
+        results += bench_backends(args.backends, args.iterations, args.frames_dir)
+    if args.only and "processes" in suites:
+        results += bench_processes(args.processes, args.iterations, args.frames_dir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    exit_code = 0
+    if args.compare:
+        report["regressions"] = compare(report, args.compare, args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy as np
+
+from spatial import points_in_polygon
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cameras.json")
+
+DEFAULT_LANES = ("Left Lane", "Center Lane", "Right Lane")
+
+
+class CameraConfig:
+    """
+    Per-camera analysis settings:
+      imgsz  - model input size for this camera (None: engine default)
+      roi    - polygon [[x, y], ...]; only this area is sent to the model and
+               detections whose ground point lies outside it are ignored
+      lanes  - [{"name": ..., "polygon": [[x, y], ...]}, ...] replacing the
+               default three vertical thirds
+    Coordinates are pixels, or fractions of the frame size when every value is <= 1.
+
+    For continuous ingest (see ingest.py):
+      source   - RTSP / HTTP URL, device index or local video file to read
+      junction - traffic_state junction the camera's counts feed
+      loop     - replay a file source forever (default: true for files)
+    """
+
+    def __init__(self, camera_id, imgsz=None, roi=None, lanes=None, source=None, junction=None, loop=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.junction = junction
+        self.loop = loop
+        self.imgsz = int(imgsz) if imgsz else None
+        self.roi = np.asarray(roi, dtype=np.float32).reshape(-1, 2) if roi else None
+        self.lanes = [(lane["name"], np.asarray(lane["polygon"], dtype=np.float32).reshape(-1, 2))
+                      for lane in (lanes or [])]
+        self._scaled = {}
+
+    @classmethod
+    def from_dict(cls, camera_id, data):
+        return cls(camera_id, data.get("imgsz"), data.get("roi"), data.get("lanes"),
+                   data.get("source"), data.get("junction"), data.get("loop"))
+
+    def lane_names(self):
+        return [name for name, _ in self.lanes] if self.lanes else list(DEFAULT_LANES)
+
+    def _to_pixels(self, polygon, width, height):
+        if polygon.size and polygon.max() <= 1.0:
+            return polygon * np.array([width, height], dtype=np.float32)
+        return polygon
+
+    def geometry(self, width, height):
+        """
+        Returns (roi_polygon, roi_rect, lanes) in pixels for this frame size,
+        cached per resolution. roi_rect is (x1, y1, x2, y2) or None.
+        """
+        key = (width, height)
+        geom = self._scaled.get(key)
+        if geom is None:
+            roi, rect = None, None
+            if self.roi is not None and len(self.roi) >= 3:
+                roi = self._to_pixels(self.roi, width, height)
+                x1, y1 = np.floor(roi.min(axis=0)).astype(int)
+                x2, y2 = np.ceil(roi.max(axis=0)).astype(int)
+                rect = (max(0, x1), max(0, y1), min(width, x2), min(height, y2))
+            lanes = [(name, self._to_pixels(poly, width, height)) for name, poly in self.lanes]
+            geom = self._scaled[key] = (roi, rect, lanes)
+        return geom
+
+    def crop(self, frame):
+        """Returns (view_of_roi_rect, (x_offset, y_offset)); the whole frame without an ROI."""
+        _, rect, _ = self.geometry(frame.shape[1], frame.shape[0])
+        if rect is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = rect
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def filter(self, dets, width, height):
+        """Keeps rows of an (N, >=4) box array whose bottom-centre lies inside the ROI."""
+        roi, _, _ = self.geometry(width, height)
+        if roi is None or len(dets) == 0:
+            return dets
+        ground = np.stack([(dets[:, 0] + dets[:, 2]) / 2, dets[:, 3]], axis=1)
+        return dets[points_in_polygon(ground, roi)]
+
+    def assign_lane(self, bbox, width, height):
+        """Lane name for a box, or None when it is in no configured lane."""
+        _, _, lanes = self.geometry(width, height)
+        x1, _, x2, y2 = bbox
+        point = [[(x1 + x2) / 2, y2]]
+        for name, poly in lanes:
+            if points_in_polygon(point, poly)[0]:
+                return name
+        return None
+
+    def pixel_ratio(self, width, height):
+        """Fraction of the frame's pixels sent to the model."""
+        _, rect, _ = self.geometry(width, height)
+        if rect is None:
+            return 1.0
+        x1, y1, x2, y2 = rect
+        return round((x2 - x1) * (y2 - y1) / float(width * height), 4)
+
+    def fingerprint(self):
+        # Only settings that change detections; source / junction do not
+        return {
+            "camera": self.camera_id,
+            "imgsz": self.imgsz,
+            "roi": self.roi.tolist() if self.roi is not None else None,
+            "lanes": [[name, poly.tolist()] for name, poly in self.lanes],
+        }
+
+
+def load_cameras(path=None):
+    """Reads {camera_id: {...}} from AI_CAMERA_CONFIG (default: cameras.json next to this file)."""
+    path = path or os.environ.get("AI_CAMERA_CONFIG", DEFAULT_CONFIG_PATH)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        cameras = {cid: CameraConfig.from_dict(cid, cfg) for cid, cfg in data.items()}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"WARNING: Could not load camera config {path}: {e}", flush=True)
+        return {}
+    print(f"Loaded {len(cameras)} camera configs from {path}", flush=True)
+    return cameras
@@ -1,13 +1,53 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
 import os
+import time
+
+from inference_engine import InferenceEngine
+from sampling import FrameSampler
+from video_reader import PrefetchReader
+from spatial import overlapping_pairs
+from frame_context import FrameContext
+from metrics import FRAMES_ANALYSED, observe_stage, stage_timer
+from track_table import TrackTable
+
+# Per-frame decision tracing is expensive on busy streams; enable with AI_DEBUG=1
+DEBUG = os.environ.get("AI_DEBUG", "0") == "1"
+
+
+def debug(message):
+    if DEBUG:
+        print(message, flush=True)
+
+
+def create_tracker(frame_rate=30):
+    """Builds a fresh ByteTrack instance for a single stream."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml("bytetrack.yaml")))
+    return BYTETracker(args=cfg, frame_rate=frame_rate)
+
 
 class VehicleDetector:
+    """
+    Per-stream detection session.
+
+    Holds only tracking and accident state; the YOLO weights live in a shared
+    InferenceEngine so many sessions can run in one process.
+    """
     
-    def __init__(self, model_path="yolov8n.pt"):
-        # Load the YOLOv8 model
-        self.model = YOLO(model_path)
+    def __init__(self, model_path="yolov8n.pt", engine=None, camera=None):
+        # Shared model (loaded once per process) + per-session tracker
+        self.engine = engine if engine is not None else InferenceEngine(model_path)
+        self.names = self.engine.names
+        self.tracker = None
+        # Optional MotionGate (set per session): skips the model on unchanged frames
+        self.motion_gate = None
+        self._last_dets = None
+        # Optional CameraConfig: input size, ROI polygon and lane layout
+        self.camera = camera
         
         # Classes: 0: person, 1: bicycle, 2: car ... 9: traffic light
         self.target_classes = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
@@ -15,12 +55,9 @@ class VehicleDetector:
         # 🔹 CHANGE 1 — ADD MODE FLAG (VERY IMPORTANT)
         self.DETECTION_MODE = "ADVANCED"  # Options: "SIMPLE", "ADVANCED"
         
-        # Tracking State
-        self.unique_vehicle_ids = set()
+        # Tracking State (per-track motion lives in a TTL-evicted table)
+        self.tracks = TrackTable()
         self.total_counts = {} 
-        self.id_history = {} 
-        self.centroids = {} 
-        self.speeds = {}     
         self.accident_buffer = 0
         self.frame_counter = 0
 
@@ -30,10 +67,6 @@ class VehicleDetector:
         self.accident_severity = None
         self.accident_reason = None
         
-        # Speed tracking
-        self.prev_speeds = {}
-        self.accelerations = {}
-        
         # Constants
         self.FRAME_SKIP = 10
         self.ACCIDENT_PRIORITY = {"FIRE": 4, "ROLLOVER": 3, "DAMAGED": 2, "COLLISION": 1}
@@ -45,25 +78,72 @@ class VehicleDetector:
             print(f"WARNING: Invalid mode {mode}. Keeping {self.DETECTION_MODE}", flush=True)
             return
         self.DETECTION_MODE = mode
-        print(f"DEBUG: Switched to {self.DETECTION_MODE} mode", flush=True)
+        debug(f"DEBUG: Switched to {self.DETECTION_MODE} mode")
 
     def reset(self):
         """Resets tracking state."""
-        self.unique_vehicle_ids = set()
+        self.tracks.clear()
         self.total_counts = {}
-        self.id_history = {}
-        self.centroids = {}
-        self.speeds = {}
         self.accident_confirmed = False
         self.accident_type = None
         self.accident_severity = None
         self.accident_reason = None
         self.accident_buffer = 0
-        self.prev_speeds = {}
-        self.accelerations = {}
+        self.tracker = None
+        self._last_dets = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+
+    def _infer(self, frame, is_static):
+        """
+        Runs the shared model and applies this session's tracker.
+        Returns an (N, 7) array: [x1, y1, x2, y2, conf, cls, track_id].
+        """
+        height, width = frame.shape[:2]
+        # Only the ROI's bounding rectangle goes to the model (and the motion gate)
+        crop, (ox, oy) = self.camera.crop(frame) if self.camera is not None else (frame, (0, 0))
+        if self._gate_skips(crop, is_static):
+            # Scene unchanged since the last inference: same boxes, tracks still advance
+            dets = self._last_dets.copy()
+        elif self.camera is not None:
+            # Boxes are shifted back to frame coordinates and clipped to the polygon
+            with stage_timer("yolo_predict"):
+                dets = self.engine.predict(crop, conf=0.45, imgsz=self.camera.imgsz)
+            if ox or oy:
+                dets[:, [0, 2]] += ox
+                dets[:, [1, 3]] += oy
+            dets = self.camera.filter(dets, width, height)
+            self._last_dets = dets
+        else:
+            with stage_timer("yolo_predict"):
+                dets = self.engine.predict(frame, conf=0.45)
+            self._last_dets = dets
+        if is_static:
+            track_ids = np.full((len(dets), 1), -1, dtype=np.float32)
+            return np.hstack([dets, track_ids])
+
+        from ultralytics.engine.results import Boxes
+
+        if self.tracker is None:
+            self.tracker = create_tracker()
+        with stage_timer("tracker_update"):
+            tracks = self.tracker.update(Boxes(dets, frame.shape[:2]), frame)
+        tracks = np.asarray(tracks, dtype=np.float32).reshape(-1, 8)
+        # ByteTrack rows are [x1, y1, x2, y2, id, score, cls, idx]
+        return tracks[:, [0, 1, 2, 3, 5, 6, 4]]
+
+    def _gate_skips(self, view, is_static):
+        """True if the motion gate lets this frame reuse the previous detections."""
+        if self.motion_gate is None or is_static:
+            return False
+        # Still consulted when nothing can be reused, so its reference frame stays current
+        return not self.motion_gate.should_infer(view) and self._last_dets is not None
 
+    def assign_lane(self, bbox, frame_width, frame_height=None):
+        if self.camera is not None and self.camera.lanes and frame_height:
+            return self.camera.assign_lane(bbox, frame_width, frame_height)
 
-    def assign_lane(self, bbox, frame_width):
         x1, _ , x2, _ = bbox
         center_x = (x1 + x2) / 2
         one_third = frame_width / 3
@@ -73,28 +153,13 @@ class VehicleDetector:
         elif center_x < two_thirds: return "Center Lane"
         else: return "Right Lane"
 
-    def detect_traffic_light_color(self, frame, bbox):
-        x1, y1, x2, y2 = bbox
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0: return "Unknown"
+    def detect_traffic_light_color(self, frame, bbox, ctx=None):
+        ctx = ctx or FrameContext(frame)
+        red_count, total_pixels = ctx.color_count("red", bbox)
+        if total_pixels == 0: return "Unknown"
         
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        h, w, _ = roi.shape
-        total_pixels = h * w
-        
-        # Color Ranges
-        lower_red1, upper_red1 = np.array([0, 70, 50]), np.array([10, 255, 255])
-        lower_red2, upper_red2 = np.array([170, 70, 50]), np.array([180, 255, 255])
-        lower_green, upper_green = np.array([35, 100, 100]), np.array([85, 255, 255])
-        lower_yellow, upper_yellow = np.array([20, 100, 100]), np.array([35, 255, 255])
-        
-        mask_red = cv2.inRange(hsv, lower_red1, upper_red1) + cv2.inRange(hsv, lower_red2, upper_red2)
-        mask_green = cv2.inRange(hsv, lower_green, upper_green)
-        mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
-        
-        red_count = cv2.countNonZero(mask_red)
-        green_count = cv2.countNonZero(mask_green)
-        yellow_count = cv2.countNonZero(mask_yellow)
+        green_count, _ = ctx.color_count("green", bbox)
+        yellow_count, _ = ctx.color_count("yellow", bbox)
         
         threshold = 0.05 * total_pixels
         
@@ -103,25 +168,14 @@ class VehicleDetector:
         elif yellow_count > threshold: return "Yellow"
         return "Unknown"
 
-    def detect_fire_smoke(self, frame, bbox):
-        x1, y1, x2, y2 = bbox
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
+    def detect_fire_smoke(self, frame, bbox, ctx=None):
+        ctx = ctx or FrameContext(frame)
+        fire_pixels, total_pixels = ctx.color_count("fire", bbox)
+        if total_pixels == 0:
             return False
 
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        
-        lower_fire1 = np.array([5, 120, 150]) 
-        upper_fire1 = np.array([30, 255, 255])
-        
-        mask_fire = cv2.inRange(hsv, lower_fire1, upper_fire1)
-        fire_ratio = cv2.countNonZero(mask_fire) / mask_fire.size
-
-        # Smoke: Low Saturation (Gray/White)
-        lower_smoke = np.array([0, 0, 135])
-        upper_smoke = np.array([180, 30, 255])
-        mask_smoke = cv2.inRange(hsv, lower_smoke, upper_smoke)
-        smoke_ratio = cv2.countNonZero(mask_smoke) / mask_smoke.size
+        fire_ratio = fire_pixels / total_pixels
+        smoke_ratio = ctx.color_count("smoke", bbox)[0] / total_pixels
 
         # STRICTER LOGIC v4 (Balanced):
         if fire_ratio > 0.60: 
@@ -136,7 +190,7 @@ class VehicleDetector:
         return False
 
     # 🔹 CHANGE 2 — ADD SIMPLE ACCIDENT CHECK FUNCTION
-    def simple_accident_check(self, frame, det, is_static=False):
+    def simple_accident_check(self, frame, det, is_static=False, ctx=None):
         """Simple mode: ONLY catastrophic, obvious accidents"""
         
         if not is_static:
@@ -162,33 +216,32 @@ class VehicleDetector:
 
         # 🔥 FIRE (any vehicle, but must be near ground)
         if y2 > frame.shape[0] * 0.6:
-            if self.detect_fire_smoke(frame, det["bbox"]):
+            if self.detect_fire_smoke(frame, det["bbox"], ctx=ctx):
                 return True, "FIRE"
 
         return False, None
 
     # 🔴 CHANGE 1 — DAMAGE MUST BE LOCALIZED, NOT GLOBAL
-    def is_localized_damage(self, edges):
+    def is_localized_damage(self, edges, quadrants=None):
         """Check if damage is localized in one quadrant (real damage) vs uniform (texture/noise)"""
         h, w = edges.shape
         if h < 4 or w < 4:  # Too small to analyze
             return False
-            
-        h2, w2 = h // 2, w // 2
-
-        quadrants = [
-            edges[0:h2, 0:w2],     # Top-Left
-            edges[0:h2, w2:w],     # Top-Right
-            edges[h2:h, 0:w2],     # Bottom-Left
-            edges[h2:h, w2:w]      # Bottom-Right
-        ]
-
-        densities = []
-        for q in quadrants:
-            if q.size == 0:
-                densities.append(0)
-            else:
-                densities.append(cv2.countNonZero(q) / q.size)
+
+        if quadrants is None:
+            h2, w2 = h // 2, w // 2
+            quadrants = [
+                edges[0:h2, 0:w2],     # Top-Left
+                edges[0:h2, w2:w],     # Top-Right
+                edges[h2:h, 0:w2],     # Bottom-Left
+                edges[h2:h, w2:w]      # Bottom-Right
+            ]
+            counts = [cv2.countNonZero(q) if q.size else 0 for q in quadrants]
+            sizes = [q.size for q in quadrants]
+        else:
+            _, _, counts, sizes = quadrants
+
+        densities = [c / size if size else 0 for c, size in zip(counts, sizes)]
 
         max_q = max(densities)
         avg_q = sum(densities) / len(densities) if densities else 0
@@ -198,16 +251,16 @@ class VehicleDetector:
         return max_q > avg_q * 2.2 and max_q > 0.15
 
     # 🔹 CHANGE 4 — ADD ROLLOVER CONFIDENCE FUNCTION (NEW)
-    def rollover_confidence(self, frame, bbox, label, speed=0, is_static=False):
+    def rollover_confidence(self, frame, bbox, label, speed=0, is_static=False, ctx=None):
         """
         Returns rollover confidence between 0.0 – 1.0
         """
         x1, y1, x2, y2 = bbox
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
+        roi = (ctx or FrameContext(frame)).roi(bbox)
+        if roi.empty:
             return 0.0
 
-        h, w, _ = roi.shape
+        h, w = roi.h, roi.w
         if w == 0 or h == 0:
             return 0.0
 
@@ -228,9 +281,7 @@ class VehicleDetector:
             score += 0.2
 
         # 4️⃣ Visual damage reinforcement
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 80, 160)
-        edge_density = cv2.countNonZero(edges) / edges.size if edges.size else 0
+        edge_density = roi.edge_density("gray", 80, 160)
 
         if edge_density > 0.22:
             score += 0.1
@@ -238,11 +289,12 @@ class VehicleDetector:
         return min(score, 1.0)
 
     # 🔹 CHANGE 2 — REFACTOR is_damaged_or_rollover (CLEAN)
-    def is_damaged_or_rollover(self, frame, bbox, label, speed=0, is_static=False):
+    def is_damaged_or_rollover(self, frame, bbox, label, speed=0, is_static=False, ctx=None):
         """
         Returns (bool, type, confidence)
         type ∈ {"ROLLOVER", "DAMAGED", None}
         """
+        ctx = ctx or FrameContext(frame)
 
         # ---------- ROLLOVER ----------
         # 🚨 ABSOLUTE SAFETY (FIX 2)
@@ -251,7 +303,7 @@ class VehicleDetector:
 
         # ---------- ROLLOVER ----------
         rollover_score = self.rollover_confidence(
-            frame, bbox, label, speed=speed, is_static=is_static
+            frame, bbox, label, speed=speed, is_static=is_static, ctx=ctx
         )
 
         # Thresholds (FIX 3 - STRICT SPLIT)
@@ -266,16 +318,8 @@ class VehicleDetector:
         if not is_static:
             if label == "car" and rollover_score >= 0.80:
                  # FIX 2: Cars must show damage to be considered rollover
-                 # FIX 1: RAW CODE REPLACE (No helper function)
-                 x1, y1, x2, y2 = bbox
-                 roi = frame[y1:y2, x1:x2]
-                 if roi.size == 0:
-                     edge_density = 0.0
-                 else:
-                     gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-                     clahe_roi = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8)).apply(gray_roi)
-                     edges_roi = cv2.Canny(clahe_roi, 25, 75)
-                     edge_density = cv2.countNonZero(edges_roi) / edges_roi.size if edges_roi.size else 0
+                 roi = ctx.roi(bbox)
+                 edge_density = 0.0 if roi.empty else roi.edge_density("clahe", 25, 75)
 
                  if edge_density < 0.25:
                     return False, None, 0.0
@@ -286,39 +330,25 @@ class VehicleDetector:
                 return True, "ROLLOVER", rollover_score
 
         # ---------- DAMAGE ----------
-        x1, y1, x2, y2 = bbox
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
+        roi = ctx.roi(bbox)
+        if roi.empty:
             return False, None, 0.0
 
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-        
-        edges = cv2.Canny(gray, 25, 75)
+        # CLAHE-enhanced edges (shared with the car rollover check above)
+        edges = roi.edges("clahe", 25, 75)
+        quadrants = roi.quadrant_counts("clahe", 25, 75)
         
         # 🔴 CHANGE 1 — CHECK FOR LOCALIZED DAMAGE
-        if not self.is_localized_damage(edges):
+        if not self.is_localized_damage(edges, quadrants=quadrants):
             return False, None, 0.0
         
-        edge_pixels = cv2.countNonZero(edges)
-        total_pixels = (y2-y1) * (x2-x1)
-        
-        if total_pixels == 0: return False, None, 0.0
-        edge_density = edge_pixels / total_pixels
+        if edges.size == 0: return False, None, 0.0
+        edge_density = roi.edge_density("clahe", 25, 75)
         
         # --- QUADRANT CHECK (Localized Damage) ---
         if is_static:
-            h, w = edges.shape
-            h2, w2 = h // 2, w // 2
-            quadrants = [
-                edges[0:h2, 0:w2],     # Top-Left
-                edges[0:h2, w2:w],     # Top-Right
-                edges[h2:h, 0:w2],     # Bottom-Left
-                edges[h2:h, w2:w]      # Bottom-Right
-            ]
-            for q in quadrants:
-                q_pixels = cv2.countNonZero(q)
+            h2, w2, counts, _ = quadrants
+            for q_pixels in counts:
                 q_total = (h2 * w2)
                 if q_total > 0:
                     q_density = q_pixels / q_total
@@ -338,7 +368,7 @@ class VehicleDetector:
         """Only for VIDEO - detects sudden deceleration/stops"""
         tid = det.get("track_id", -1)
         speed = det.get("speed", 0)
-        accel = self.accelerations.get(tid, 0)
+        accel = self.tracks.acceleration(tid)
 
         # Sudden deceleration
         if accel < -8.0 and speed < 6.0:
@@ -374,67 +404,91 @@ class VehicleDetector:
             min(w2, h2) > 40
         )
 
-    def check_collisions(self, detections, frame, is_static=False):
+    def check_collisions(self, detections, frame, is_static=False, ctx=None):
         """
         Checks for overlapping bounding boxes.
+        All pairwise IoUs are computed at once; the expensive damage / motion
+        checks only run on surviving candidate pairs, at most once per box.
         """
         colliding_indices = set()
         vehicle_ids = {1, 2, 3, 5, 7}
-        
-        for i in range(len(detections)):
-            if detections[i]['cls_id'] not in vehicle_ids: continue
-            for j in range(i + 1, len(detections)):
-                if detections[j]['cls_id'] not in vehicle_ids: continue
-            
-                box1 = detections[i]['bbox']
-                box2 = detections[j]['bbox']
-                
-                # Check Overlap
-                lx = max(box1[0], box2[0])
-                ly = max(box1[1], box2[1])
-                rx = min(box1[2], box2[2])
-                ry = min(box1[3], box2[3])
-                
-                if lx < rx and ly < ry:
-                    intersection_area = (rx - lx) * (ry - ly)
-                    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-                    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
-                    iou = intersection_area / float(area1 + area2 - intersection_area)
-                    
-                    if is_static:
-                        if iou > 0.45 and self.is_head_on_or_side_hit(box1, box2):
-                            # For static, check damage on either vehicle
-                            dmg1, _, _ = self.is_damaged_or_rollover(frame, box1, detections[i]['class'], speed=0, is_static=True)
-                            dmg2, _, _ = self.is_damaged_or_rollover(frame, box2, detections[j]['class'], speed=0, is_static=True)
-                            
-                            if dmg1 or dmg2:
-                                print(f"DEBUG: Verified Collision (IoU: {iou:.2f}) with orientation mismatch.", flush=True)
-                                colliding_indices.add(i)
-                                colliding_indices.add(j)
-                            else:
-                                pass # Just traffic jam overlap
-                            
-                    else:
-                        # For video, check overlap + crash motion
-                        if iou > 0.35:
-                            if self.is_crash_motion(detections[i]) or self.is_crash_motion(detections[j]):
-                                colliding_indices.add(i)
-                                colliding_indices.add(j)
-                            
+
+        vehicle_idx = [k for k, det in enumerate(detections) if det['cls_id'] in vehicle_ids]
+        if len(vehicle_idx) < 2:
+            return colliding_indices
+
+        boxes = np.array([detections[k]['bbox'] for k in vehicle_idx], dtype=np.float32)
+        pi, pj, ious = overlapping_pairs(boxes, min_iou=0.45 if is_static else 0.35)
+        if len(ious) == 0:
+            return colliding_indices
+
+        if is_static:
+            ctx = ctx or FrameContext(frame)
+
+            def damaged(k):
+                det = detections[k]
+                if det.get('damage_checked') is None:
+                    is_dmg, dmg_type, _ = self.is_damaged_or_rollover(
+                        frame, det['bbox'], det['class'], speed=0, is_static=True, ctx=ctx
+                    )
+                    det['damage_checked'] = (is_dmg, dmg_type)
+                return det['damage_checked'][0]
+
+            for a, b, iou in zip(pi, pj, ious):
+                i, j = vehicle_idx[a], vehicle_idx[b]
+                box1, box2 = detections[i]['bbox'], detections[j]['bbox']
+                if not self.is_head_on_or_side_hit(box1, box2):
+                    continue
+                # For static, check damage on either vehicle
+                if damaged(i) or damaged(j):
+                    debug(f"DEBUG: Verified Collision (IoU: {iou:.2f}) with orientation mismatch.")
+                    colliding_indices.add(i)
+                    colliding_indices.add(j)
+        else:
+            # For video, check overlap + crash motion
+            crash = np.array([self.is_crash_motion(detections[k]) for k in vehicle_idx])
+            hit = crash[pi] | crash[pj]
+            for a, b in zip(pi[hit], pj[hit]):
+                colliding_indices.add(vehicle_idx[a])
+                colliding_indices.add(vehicle_idx[b])
+
         return colliding_indices
 
+    def draw_detections(self, frame, detections):
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, det['class'], (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
     def detect(self, frame, is_static=False):
         if frame is None:
             print("ERROR: Frame is None in detect()", flush=True)
             return {"count": 0, "emergency": False, "accident": False}
 
+        # Heuristics share one lazily-filled analysis context per frame
+        ctx = FrameContext(frame)
+        self._accident_t0 = None
+        result = self._analyse(frame, is_static, ctx)
+        if self.motion_gate is not None:
+            self.motion_gate.observe(result)
+        if self._accident_t0 is not None:
+            observe_stage("accident_checks", time.perf_counter() - self._accident_t0)
+        FRAMES_ANALYSED.inc()
+
+        # Annotate only after every heuristic has read the clean pixels
+        with stage_timer("draw"):
+            self.draw_detections(frame, result["detections"])
+        return result
+
+    def _analyse(self, frame, is_static, ctx):
+
         # 🚨 HARD AUTO-STATIC OVERRIDE (FINAL SAFETY NET) (FIX 2)
         if not hasattr(self, "_motion_initialized"):
             self._motion_initialized = True
             is_static = True
 
         # FIX 3: ADD ONE DEBUG LINE (TEMPORARY)
-        print(f"DEBUG: detect() called | is_static={is_static}", flush=True)
+        debug(f"DEBUG: detect() called | is_static={is_static}")
 
         # 🚨 FORCE SIMPLE MODE FOR STATIC SCENES (FIX 1)
         # REMOVED GLOBAL MUTATION: self.DETECTION_MODE = "SIMPLE"
@@ -455,16 +509,16 @@ class VehicleDetector:
         self.emergency_signal = False
 
         self.frame_counter += 1
-        if is_static:
-            results = self.model.predict(frame, conf=0.45, verbose=False)[0]
-        else:
-            results = self.model.track(frame, persist=True, tracker="bytetrack.yaml", conf=0.45, verbose=False)[0]
+        boxes = self._infer(frame, is_static)
         
         detections = []
         vehicle_count = 0
         
         height, width, _ = frame.shape
-        lane_data = {"Left Lane": 0, "Center Lane": 0, "Right Lane": 0}
+        if self.camera is not None:
+            lane_data = {name: 0 for name in self.camera.lane_names()}
+        else:
+            lane_data = {"Left Lane": 0, "Center Lane": 0, "Right Lane": 0}
         signals = {"Red": 0, "Green": 0, "Yellow": 0}
         
         # Count people for emergency detection
@@ -480,103 +534,94 @@ class VehicleDetector:
         
         # 1. Collect Detections
         raw_detections = []
-        if results.boxes:
-            for box in results.boxes:
-                id_val = int(box.id[0]) if box.id is not None else -1
-                cls_id = int(box.cls[0])
-                conf = float(box.conf[0])
-                
-                if cls_id in self.target_classes and conf > 0.25:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    label = self.model.names[cls_id]
-                    
-                    # Count people
-                    if cls_id == 0:  # person
-                        person_count += 1
-                    
-                    # Counting Logic
-                    if is_static:
-                         self.total_counts[label] = self.total_counts.get(label, 0) + 1
-                    elif id_val != -1:
-                        self.id_history[id_val] = self.id_history.get(id_val, 0) + 1
-                        if self.id_history[id_val] > 15 and id_val not in self.unique_vehicle_ids:
-                            self.unique_vehicle_ids.add(id_val)
-                            self.total_counts[label] = self.total_counts.get(label, 0) + 1
-                    
-                    # Speed calculation (only for video)
-                    current_speed = 0
-                    if not is_static and id_val != -1:
-                        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-                        if id_val in self.centroids:
-                            prev_cx, prev_cy = self.centroids[id_val]
-                            current_speed = np.sqrt((cx - prev_cx)**2 + (cy - prev_cy)**2)
-                        else:
-                            current_speed = 10.0
-                        
-                        prev_speed = self.prev_speeds.get(id_val, current_speed)
-                        acceleration = (current_speed - prev_speed) / self.FRAME_SKIP
-                        
-                        if abs(acceleration) > 50:
-                            acceleration = 0
+        if len(boxes):
+            keep = np.isin(boxes[:, 5].astype(int), self.target_classes) & (boxes[:, 4] > 0.25)
+            boxes = boxes[keep]
+            coords = boxes[:, :4].astype(int)
+            cls_ids = boxes[:, 5].astype(int)
+            track_ids = boxes[:, 6].astype(int)
+
+            # Count people
+            person_count += int(np.count_nonzero(cls_ids == 0))
+
+            # Speed calculation + counting (only for video), all tracks at once
+            speeds = np.zeros(len(boxes))
+            if not is_static:
+                tracked = track_ids != -1
+                if tracked.any():
+                    cx = (coords[tracked, 0] + coords[tracked, 2]) // 2
+                    cy = (coords[tracked, 1] + coords[tracked, 3]) // 2
+                    speeds[tracked], newly_counted = self.tracks.update(
+                        track_ids[tracked], cx, cy, self.frame_counter, self.FRAME_SKIP)
+                    for cls_id in cls_ids[tracked][newly_counted].tolist():
+                        label = self.names[cls_id]
+                        self.total_counts[label] = self.total_counts.get(label, 0) + 1
+
+                    # Count stopped vehicles
+                    stopped_vehicles += int(np.count_nonzero(speeds[tracked] < 2.0))
+
+            for (x1, y1, x2, y2), cls_id, id_val, conf, current_speed in zip(
+                    coords.tolist(), cls_ids.tolist(), track_ids.tolist(), boxes[:, 4].tolist(), speeds.tolist()):
+                label = self.names[cls_id]
+
+                # Counting Logic
+                if is_static:
+                     self.total_counts[label] = self.total_counts.get(label, 0) + 1
+
+                raw_detections.append({
+                    "bbox": [x1, y1, x2, y2],
+                    "class": label,
+                    "confidence": conf,
+                    "cls_id": cls_id,
+                    "track_id": id_val,
+                    "speed": current_speed,
+                    "damage_checked": None
+                })
+
+        # Empty or gated frames still age out tracks that left the view
+        if not is_static:
+            self.tracks.evict(self.frame_counter)
 
-                        self.prev_speeds[id_val] = current_speed
-                        self.centroids[id_val] = (cx, cy)
-                        self.speeds[id_val] = current_speed
-                        self.accelerations[id_val] = acceleration
-                        
-                        # Count stopped vehicles
-                        if current_speed < 2.0:
-                            stopped_vehicles += 1
-                    
-                    raw_detections.append({
-                        "bbox": [x1, y1, x2, y2],
-                        "class": label,
-                        "confidence": conf,
-                        "cls_id": cls_id,
-                        "track_id": id_val,
-                        "speed": current_speed,
-                        "damage_checked": None
-                    })
+        ctx.plan_color_checks([det['bbox'] for det in raw_detections])
 
         # 2. Check Collisions (Optimize: Skip in SIMPLE mode)
         colliding_indices = set()
         # FIX 4: Use current_mode instead of outdated self.DETECTION_MODE
         if current_mode == "ADVANCED":
-            colliding_indices = self.check_collisions(raw_detections, frame, is_static)
+            with stage_timer("collision_search"):
+                colliding_indices = self.check_collisions(raw_detections, frame, is_static, ctx=ctx)
         
         # 3. Label & Visualize
         for i, det in enumerate(raw_detections):
             vehicle_count += 1
             x1, y1, x2, y2 = det['bbox']
             label = det['class']
-            color = (0, 255, 0)
-            
-            # Draw
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
             
             detections.append({
                 "bbox": [x1, y1, x2, y2],
                 "class": label,
                 "confidence": det['confidence'],
                 "cls_id": det['cls_id'],
-                "track_id": det['track_id']
+                "track_id": det['track_id'],
+                "speed": det['speed']
             })
             
             # Traffic Light
             if det['cls_id'] == 9:
-                light_color = self.detect_traffic_light_color(frame, (x1, y1, x2, y2))
+                light_color = self.detect_traffic_light_color(frame, (x1, y1, x2, y2), ctx=ctx)
                 if light_color != "Unknown":
                     signals[light_color] += 1
                     
             # Lane
             if det['cls_id'] in list(range(9)):
-                lane = self.assign_lane((x1, y1, x2, y2), width)
-                lane_data[lane] += 1
+                lane = self.assign_lane((x1, y1, x2, y2), width, height)
+                if lane is not None:
+                    lane_data[lane] += 1
 
         # =========================
         # ACCIDENT STATE MACHINE
         # =========================
+        self._accident_t0 = time.perf_counter()
         accident_signal = False
         detected_type = None
         self.accident_reason = None
@@ -588,7 +633,7 @@ class VehicleDetector:
         # 🔹 CHANGE 3 — SPLIT ACCIDENT LOGIC
         # 🔴 MODE SWITCH
         if current_mode == "SIMPLE":
-            print(f"DEBUG: Using SIMPLE mode detection", flush=True)
+            debug(f"DEBUG: Using SIMPLE mode detection")
             # FIX: Reset counts in SIMPLE mode to prevent leakage
             self.total_counts = {} 
             for det in raw_detections:
@@ -597,9 +642,9 @@ class VehicleDetector:
                     continue
 
                 if det["cls_id"] in [2, 5, 7]:  # car, bus, truck
-                    is_acc, acc_type = self.simple_accident_check(frame, det, is_static)
+                    is_acc, acc_type = self.simple_accident_check(frame, det, is_static, ctx=ctx)
                     if is_acc:
-                        print(f"DEBUG: SIMPLE mode - Accident detected: {acc_type}", flush=True)
+                        debug(f"DEBUG: SIMPLE mode - Accident detected: {acc_type}")
                         # Visual Proof
                         cv2.putText(frame, f"ACCIDENT DETECTED: {acc_type}", (30, 50), 
                                     cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)
@@ -650,7 +695,7 @@ class VehicleDetector:
 
         else:
             # 🔵 ADVANCED MODE LOGIC (KEEP EXISTING)
-            print(f"DEBUG: Using ADVANCED mode detection", flush=True)
+            debug(f"DEBUG: Using ADVANCED mode detection")
             
             # Initialize fire_detected here so it's always defined,
             # regardless of whether we enter the static or dynamic branch below.
@@ -661,7 +706,7 @@ class VehicleDetector:
                 # ===========================================
                 # STATIC OR NEAR-STATIC SCENE LOGIC
                 # ===========================================
-                print(f"DEBUG: Processing static/near-static scene", flush=True)
+                debug(f"DEBUG: Processing static/near-static scene")
                 
                 # Damage voting
                 damage_votes = 0
@@ -674,9 +719,9 @@ class VehicleDetector:
                         x1, y1, x2, y2 = det['bbox']
                         # Only check fire if vehicle is in bottom half of frame
                         if y2 > frame.shape[0] * 0.5:
-                            if self.detect_fire_smoke(frame, det['bbox']):
+                            if self.detect_fire_smoke(frame, det['bbox'], ctx=ctx):
                                 fire_detected = True
-                                print(f"DEBUG: Localized fire detected on vehicle at bottom half", flush=True)
+                                debug(f"DEBUG: Localized fire detected on vehicle at bottom half")
                                 break
                 
                 # Check damage on all vehicles
@@ -691,12 +736,12 @@ class VehicleDetector:
                         # 🚨 Never skip large vehicles
                         if det['class'] not in ['bus', 'truck']:
                             if box_area < 0.003 * frame_area:
-                                print(f"DEBUG: Skipping small vehicle: {det['class']}", flush=True)
+                                debug(f"DEBUG: Skipping small vehicle: {det['class']}")
                                 continue
                         
                         if det['damage_checked'] is None:
                             is_dmg, dmg_type, conf = self.is_damaged_or_rollover(
-                                frame, det['bbox'], det['class'], speed=0, is_static=True
+                                frame, det['bbox'], det['class'], speed=0, is_static=True, ctx=ctx
                             )
                             det['damage_checked'] = (is_dmg, dmg_type)
                         else:
@@ -705,7 +750,7 @@ class VehicleDetector:
                         # Count votes
                         if is_dmg:
                             damage_votes += 1
-                            print(f"DEBUG: Damage vote for {det['class']}: {dmg_type}", flush=True)
+                            debug(f"DEBUG: Damage vote for {det['class']}: {dmg_type}")
                         if dmg_type == "ROLLOVER":
                             rollover_votes += 1
                 
@@ -713,7 +758,7 @@ class VehicleDetector:
                 evidence_count = 0
                 if fire_detected: 
                     evidence_count += 1
-                    print(f"DEBUG: Evidence 1: Fire detected", flush=True)
+                    debug(f"DEBUG: Evidence 1: Fire detected")
                 if rollover_votes >= 1: 
                     # 🚨 ROLLOVER IS ALWAYS AN ACCIDENT (FIX 3)
                     # FIX 3: EVIDENCE GATE FOR ROLLOVER
@@ -725,7 +770,7 @@ class VehicleDetector:
                         self.accident_severity = "CRITICAL"
                         self.accident_reason = "Heavy Vehicle rollover detected"
                         evidence_count += 1
-                        print(f"DEBUG: Evidence 2: Rollover detected on {det['class']} -> IMMEDIATE CRITICAL", flush=True)
+                        debug(f"DEBUG: Evidence 2: Rollover detected on {det['class']} -> IMMEDIATE CRITICAL")
                     elif damage_votes >= 1 or len(colliding_indices) >= 1:
                         accident_signal = True
                         detected_type = "ROLLOVER"
@@ -733,17 +778,17 @@ class VehicleDetector:
                         self.accident_severity = "CRITICAL"
                         self.accident_reason = "Car Rollover confirmed with damage/collision"
                         evidence_count += 1
-                        print(f"DEBUG: Evidence 2: Car Rollover confirmed with evidence", flush=True)
+                        debug(f"DEBUG: Evidence 2: Car Rollover confirmed with evidence")
                     else:
-                        print(f"DEBUG: REJECTED - Single car rollover candidate without damage/collision", flush=True)
+                        debug(f"DEBUG: REJECTED - Single car rollover candidate without damage/collision")
                 if damage_votes >= 2: 
                     evidence_count += 1
-                    print(f"DEBUG: Evidence 3: Multiple damaged vehicles ({damage_votes})", flush=True)
+                    debug(f"DEBUG: Evidence 3: Multiple damaged vehicles ({damage_votes})")
                 if len(colliding_indices) >= 1: 
                     evidence_count += 1
-                    print(f"DEBUG: Evidence 4: Collision detected", flush=True)
+                    debug(f"DEBUG: Evidence 4: Collision detected")
                 
-                print(f"DEBUG: Total evidence count: {evidence_count}", flush=True)
+                debug(f"DEBUG: Total evidence count: {evidence_count}")
                 
                 # Apply voting logic WITH EVIDENCE REQUIREMENT
                 if evidence_count >= 2:
@@ -798,20 +843,20 @@ class VehicleDetector:
 
                 else:
                     accident_signal = False
-                    print(f"DEBUG: REJECTED - No significant evidence (Count: {evidence_count})", flush=True)
+                    debug(f"DEBUG: REJECTED - No significant evidence (Count: {evidence_count})")
                         
             else:
                 # ===========================================
                 # DYNAMIC VIDEO LOGIC (requires crash motion)
                 # ===========================================
-                print(f"DEBUG: Processing dynamic video scene", flush=True)
+                debug(f"DEBUG: Processing dynamic video scene")
                 
                 # A. COLLISION SIGNAL
                 if len(colliding_indices) >= 2:
                     accident_signal = True
                     detected_type = "COLLISION"
                     self.accident_reason = "Multiple vehicles colliding"
-                    print(f"DEBUG: Dynamic accident - Collision with crash motion", flush=True)
+                    debug(f"DEBUG: Dynamic accident - Collision with crash motion")
 
                 # B. CRASH MOTION + DAMAGE
                 if not accident_signal:
@@ -822,7 +867,7 @@ class VehicleDetector:
                             if self.is_crash_motion(det):
                                 if det['damage_checked'] is None:
                                     is_dmg, dmg_type, conf = self.is_damaged_or_rollover(
-                                        frame, det['bbox'], det['class'], speed=det.get('speed', 0), is_static=False
+                                        frame, det['bbox'], det['class'], speed=det.get('speed', 0), is_static=False, ctx=ctx
                                     )
                                     det['damage_checked'] = (is_dmg, dmg_type)
                                 else:
@@ -830,7 +875,7 @@ class VehicleDetector:
                                     
                                 if is_dmg:
                                     damage_votes += 1
-                                    print(f"DEBUG: Dynamic damage vote for {det['class']}: {dmg_type}", flush=True)
+                                    debug(f"DEBUG: Dynamic damage vote for {det['class']}: {dmg_type}")
                     
                     # For video, still need multi-evidence
                     if damage_votes >= 2:
@@ -848,13 +893,13 @@ class VehicleDetector:
                             detected_type = "DAMAGED"
                             self.accident_reason = "Crash motion + damage + collision"
                         else:
-                            print(f"DEBUG: REJECTED - Single damaged vehicle without other evidence", flush=True)
+                            debug(f"DEBUG: REJECTED - Single damaged vehicle without other evidence")
                 
                 # C. FIRE in dynamic scene (upgrades existing accident)
                 if accident_signal:
                     for det in raw_detections:
                         if det['cls_id'] in [2, 5, 7]:
-                            if self.detect_fire_smoke(frame, det['bbox']):
+                            if self.detect_fire_smoke(frame, det['bbox'], ctx=ctx):
                                 # Upgrade to FIRE if higher priority
                                 if self.ACCIDENT_PRIORITY.get("FIRE", 0) > self.ACCIDENT_PRIORITY.get(detected_type, 0):
                                     detected_type = "FIRE"
@@ -867,11 +912,11 @@ class VehicleDetector:
                 for det in raw_detections:
                     if det['class'] in ['bus', 'truck']:
                         # Use Confidence Score instead of raw geometry
-                        conf = self.rollover_confidence(frame, det['bbox'], det['class'], speed=0, is_static=True)
+                        conf = self.rollover_confidence(frame, det['bbox'], det['class'], speed=0, is_static=True, ctx=ctx)
                         
                         # High confidence threshold for static confirmation
                         if conf >= 0.75:
-                            print(f"DEBUG: Static rollover confirmed in ADVANCED mode (Conf: {conf:.2f})", flush=True)
+                            debug(f"DEBUG: Static rollover confirmed in ADVANCED mode (Conf: {conf:.2f})")
                             accident_signal = True
                             detected_type = "ROLLOVER"
                             accident_label = det['class'] # FIX: Set label
@@ -891,7 +936,7 @@ class VehicleDetector:
             if detected_type == "ROLLOVER":
                  # If we somehow have a car rollover signal without collision/fire backup
                  if accident_label == "car" or (accident_label is None and not len(colliding_indices) and not fire_detected):
-                      print("DEBUG: Blocking car rollover without collision/fire (Final Gate)", flush=True)
+                      debug("DEBUG: Blocking car rollover without collision/fire (Final Gate)")
                       accident_signal = False
                       detected_type = None
 
@@ -902,15 +947,15 @@ class VehicleDetector:
             if accident_signal:
                 # Faster buffer for static scenes
                 self.accident_buffer += 3 if is_static else 2
-                print(f"DEBUG: Accident signal TRUE - buffer: {self.accident_buffer}", flush=True)
+                debug(f"DEBUG: Accident signal TRUE - buffer: {self.accident_buffer}")
             else:
                 self.accident_buffer = max(0, self.accident_buffer - 1)
-                print(f"DEBUG: Accident signal FALSE - buffer: {self.accident_buffer}", flush=True)
+                debug(f"DEBUG: Accident signal FALSE - buffer: {self.accident_buffer}")
 
             # FINAL CONFIRMATION
             # FIX: Only confirm if we have a valid signal AND buffer threshold
             if accident_signal and not self.accident_confirmed and self.accident_buffer >= 5:
-                print(f"DEBUG: Accident Confirmed! Type: {detected_type}, Reason: {self.accident_reason}", flush=True)
+                debug(f"DEBUG: Accident Confirmed! Type: {detected_type}, Reason: {self.accident_reason}")
                 self.accident_confirmed = True
                 self.accident_type = detected_type
                 # Priority-based severity
@@ -926,19 +971,19 @@ class VehicleDetector:
         if self.accident_confirmed is True:
             if self.accident_severity == "CRITICAL":
                 emergency_signal = True
-                print(f"DEBUG: Emergency signal TRUE - Critical Accident ({self.accident_type})", flush=True)
+                debug(f"DEBUG: Emergency signal TRUE - Critical Accident ({self.accident_type})")
             else:
                 emergency_signal = False
-                print(f"DEBUG: Emergency signal FALSE - Accident confirmed but severity is {self.accident_severity}", flush=True)
+                debug(f"DEBUG: Emergency signal FALSE - Accident confirmed but severity is {self.accident_severity}")
         else:
             emergency_signal = False
-            print(f"DEBUG: Emergency signal FALSE - No accident confirmed", flush=True)
+            debug(f"DEBUG: Emergency signal FALSE - No accident confirmed")
 
         # FIX 5: GLOBAL SAFETY KILL SWITCH (LAST LINE OF DEFENSE)
         if self.accident_type == "ROLLOVER":
             if damage_votes == 0 and not is_static and not accident_signal:
                 # If we are in video, but no damage votes, kill the rollover signal
-                print("DEBUG: Kill Switch - Rollover suppressed due to lack of damage evidence in video", flush=True)
+                debug("DEBUG: Kill Switch - Rollover suppressed due to lack of damage evidence in video")
                 self.accident_confirmed = False
                 self.accident_type = None
                 emergency_signal = False
@@ -973,7 +1018,12 @@ class VehicleDetector:
         # If less than 20% of vehicles are moving, treat as static
         return moving_vehicles < len(raw_detections) * 0.2
 
-    def process_video(self, video_path):
+    def process_video(self, video_path, sampler=None, progress=None, stop_event=None):
+        """
+        Offline summary of an image or video.
+        progress(frames_done, total_frames) is called after every analysed frame;
+        setting stop_event ends the run early with the summary so far.
+        """
         # ISSUE 4: Reset counts throughout the system at start of new video
         self.reset()
 
@@ -999,32 +1049,40 @@ class VehicleDetector:
              # FORCE SIMPLE MODE FOR STATIC / ACCIDENT SCENES (FIX 1: Handled in detect now)
              # self.set_mode("SIMPLE")  <-- REMOVED
              result = self.detect(frame, is_static=True)
+             if progress is not None:
+                 progress(1, 1)
              return self.total_counts, result["count"], result["emergency"], video_path
         else:
             # Video Logic
-            # FIX 5: DEFINE cap
-            cap = cv2.VideoCapture(video_path)
             max_vehicles = 0
             has_em = False
-            
-            frame_cnt = 0
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret: break
-                frame_cnt += 1
-                if frame_cnt % 10 != 0: continue
-                
-                # Auto-detect if scene is static or dynamic
-                is_likely_static = frame_cnt < 30  # Quick pre-check
-                
-                # Removed per-frame mode switching to prevent flipping
-                res = self.detect(frame, is_static=is_likely_static)
-                if res["count"] > max_vehicles:
-                    max_vehicles = res["count"]
-                if res["emergency"]: 
-                    has_em = True
-                    # Once emergency detected, we can stop early
-                    break
-                
-            cap.release()
+
+            # Offline summaries analyse every 10th frame unless told otherwise
+            if sampler is None:
+                sampler = FrameSampler(policy="stride", stride=10)
+
+            # Decode runs ahead on the reader thread while this one runs inference
+            with PrefetchReader(video_path, sampler=sampler) as reader:
+                for packet in reader:
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    self.FRAME_SKIP = packet.gap
+                    frame_cnt = packet.index + 1
+
+                    # Auto-detect if scene is static or dynamic
+                    is_likely_static = frame_cnt < 30  # Quick pre-check
+
+                    # Removed per-frame mode switching to prevent flipping
+                    res = self.detect(packet.frame, is_static=is_likely_static)
+                    reader.release(packet)
+                    if progress is not None:
+                        progress(frame_cnt, reader.frame_count)
+                    if res["count"] > max_vehicles:
+                        max_vehicles = res["count"]
+                    if res["emergency"]:
+                        has_em = True
+                        # Once emergency detected, we can stop early
+                        break
+                    sampler.observe(res)
+
             return self.total_counts, max_vehicles, has_em, None
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+CPU inference backends for the YOLO model.
+
+The detector only ever sees (N, 6) box arrays, so the backend is invisible to
+tracking and accident logic. Exported artefacts are written next to the .pt
+weights and reused on the next start:
+
+    torch     -> yolov8n.pt (ultralytics / PyTorch)
+    onnx      -> yolov8n.onnx (ONNX Runtime), yolov8n_int8.onnx with int8=True
+    openvino  -> yolov8n_openvino_model/, yolov8n_int8_openvino_model/ with int8=True
+    auto      -> openvino if installed, else onnx if installed, else torch
+"""
+import glob
+import os
+import re
+
+import cv2
+import numpy as np
+
+# Optional runtimes: the engine falls back to PyTorch when they are missing.
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+try:
+    import openvino
+    OPENVINO_AVAILABLE = True
+except ImportError:
+    OPENVINO_AVAILABLE = False
+
+BACKENDS = ("torch", "onnx", "openvino", "auto")
+
+DEFAULT_CALIBRATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "uploads")
+
+
+def pick_backend(backend):
+    if backend not in BACKENDS:
+        print(f"WARNING: Unknown inference backend {backend}. Using torch", flush=True)
+        return "torch"
+    if backend == "auto":
+        if OPENVINO_AVAILABLE:
+            return "openvino"
+        if ONNXRUNTIME_AVAILABLE:
+            return "onnx"
+        return "torch"
+    if backend == "onnx" and not ONNXRUNTIME_AVAILABLE:
+        print("WARNING: onnxruntime not installed. Falling back to torch backend.", flush=True)
+        return "torch"
+    if backend == "openvino" and not OPENVINO_AVAILABLE:
+        print("WARNING: openvino not installed. Falling back to torch backend.", flush=True)
+        return "torch"
+    return backend
+
+
+def resolve_model(model_path="yolov8n.pt", backend="torch", int8=False, imgsz=640, calibration_dir=None):
+    """
+    Returns (path_loadable_by_YOLO, backend_used), exporting / quantizing on first use.
+    """
+    backend = pick_backend(backend)
+    if backend == "torch" or not model_path.endswith(".pt"):
+        return model_path, "torch" if model_path.endswith(".pt") else backend
+
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        fp32_path = stem + ".onnx"
+        if not os.path.exists(fp32_path):
+            fp32_path = _export(model_path, "onnx", imgsz)
+        if not int8:
+            return fp32_path, "onnx"
+        int8_path = stem + "_int8.onnx"
+        if not os.path.exists(int8_path):
+            quantize_onnx(fp32_path, int8_path, imgsz, calibration_dir)
+        return int8_path, "onnx-int8"
+
+    # openvino
+    fp32_dir = stem + "_openvino_model"
+    if not os.path.isdir(fp32_dir):
+        fp32_dir = _export(model_path, "openvino", imgsz)
+    if not int8:
+        return fp32_dir, "openvino"
+    int8_dir = stem + "_int8_openvino_model"
+    if not os.path.isdir(int8_dir):
+        quantize_openvino(fp32_dir, int8_dir, imgsz, calibration_dir)
+    return int8_dir, "openvino-int8"
+
+
+def _export(model_path, fmt, imgsz):
+    from ultralytics import YOLO
+
+    print(f"Exporting {model_path} to {fmt} (imgsz={imgsz})...", flush=True)
+    # dynamic=True keeps the batch axis free for the micro-batcher
+    return YOLO(model_path).export(format=fmt, imgsz=imgsz, dynamic=True, half=False)
+
+
+# =========================
+# Calibration data
+# =========================
+
+def letterbox(frame, imgsz):
+    """Resize with unchanged aspect ratio and pad to imgsz x imgsz (same as ultralytics)."""
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    resized = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    out = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    out[top:top + nh, left:left + nw] = resized
+    return out
+
+
+def to_tensor(frame, imgsz):
+    """BGR frame -> (1, 3, imgsz, imgsz) float32 RGB tensor in [0, 1]."""
+    img = letterbox(frame, imgsz)[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(img, dtype=np.float32)[None] / 255.0
+
+
+def load_calibration_frames(calibration_dir=None, limit=200, video_stride=30):
+    """
+    Collects frames from stored uploads: snapshots / images directly and every
+    `video_stride`-th frame of uploaded videos.
+    """
+    calibration_dir = calibration_dir or DEFAULT_CALIBRATION_DIR
+    frames = []
+    for path in sorted(glob.glob(os.path.join(calibration_dir, "*"))):
+        if len(frames) >= limit:
+            break
+        if not os.path.isfile(path):
+            continue
+        img = cv2.imread(path)
+        if img is not None:
+            frames.append(img)
+            continue
+        cap = cv2.VideoCapture(path)
+        index = 0
+        while cap.isOpened() and len(frames) < limit:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if index % video_stride == 0:
+                frames.append(frame)
+            index += 1
+        cap.release()
+    if not frames:
+        raise RuntimeError(f"No calibration frames found in {calibration_dir}")
+    print(f"Loaded {len(frames)} calibration frames from {calibration_dir}", flush=True)
+    return frames
+
+
+# =========================
+# INT8 post-training quantization
+# =========================
+
+def _head_nodes(onnx_path):
+    """Node names of the final Detect head, kept in float to limit box drift."""
+    import onnx
+
+    model = onnx.load(onnx_path)
+    indices = [int(m.group(1)) for node in model.graph.node
+               for m in [re.search(r"/model\.(\d+)/", node.name)] if m]
+    if not indices:
+        return []
+    head = f"/model.{max(indices)}/"
+    return [node.name for node in model.graph.node if head in node.name]
+
+
+def quantize_onnx(fp32_path, int8_path, imgsz=640, calibration_dir=None, limit=200):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    frames = load_calibration_frames(calibration_dir, limit)
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter(frames)
+
+        def get_next(self):
+            frame = next(self._iter, None)
+            return None if frame is None else {input_name: to_tensor(frame, imgsz)}
+
+    print(f"Quantizing {fp32_path} -> {int8_path} (INT8, {len(frames)} calibration frames)...", flush=True)
+    quantize_static(
+        fp32_path, int8_path, FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        nodes_to_exclude=_head_nodes(fp32_path),
+    )
+    return int8_path
+
+
+def quantize_openvino(fp32_dir, int8_dir, imgsz=640, calibration_dir=None, limit=200):
+    import shutil
+
+    import nncf
+
+    frames = load_calibration_frames(calibration_dir, limit)
+    xml_path = glob.glob(os.path.join(fp32_dir, "*.xml"))[0]
+    core = openvino.Core()
+    model = core.read_model(xml_path)
+
+    print(f"Quantizing {fp32_dir} -> {int8_dir} (INT8, {len(frames)} calibration frames)...", flush=True)
+    dataset = nncf.Dataset(frames, lambda frame: to_tensor(frame, imgsz))
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(frames))
+
+    # Keep ultralytics' metadata.yaml so YOLO() can load the directory
+    shutil.copytree(fp32_dir, int8_dir, dirs_exist_ok=True)
+    openvino.save_model(quantized, os.path.join(int8_dir, os.path.basename(xml_path)))
+    return int8_dir
@@ -0,0 +1,231 @@
+import copy
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from inference_backends import resolve_model
+from metrics import BATCH_SIZE
+
+
+class InferenceEngine:
+    """
+    Loads the YOLO weights once and serves predictions to every detector session.
+
+    Each worker thread gets a shallow replica of the model that shares the same
+    network weights but owns its own ultralytics predictor, so concurrent
+    streams never step on each other's predictor state.
+    Predictions are returned as a compact float32 array of shape (N, 6):
+    [x1, y1, x2, y2, conf, cls].
+
+    Frames submitted by different streams are grouped by a MicroBatcher and
+    run through one batched forward pass (set AI_BATCH_WINDOW_MS=0 to disable).
+
+    The runtime is chosen with AI_INFER_BACKEND (torch | onnx | openvino | auto)
+    and AI_INFER_INT8=1 (see inference_backends); the output format is the same
+    for every backend.
+    """
+
+    def __init__(self, model_path="yolov8n.pt", workers=None, batch_window_ms=None, max_batch=None,
+                 backend=None, int8=None, imgsz=None):
+        from ultralytics import YOLO
+
+        self.imgsz = imgsz or int(os.environ.get("AI_INFER_IMGSZ", 640))
+        if backend is None:
+            backend = os.environ.get("AI_INFER_BACKEND", "torch")
+        if int8 is None:
+            int8 = os.environ.get("AI_INFER_INT8", "0") == "1"
+        self.model_path, self.backend = resolve_model(model_path, backend, int8, self.imgsz)
+        print(f"Inference backend: {self.backend} ({self.model_path})", flush=True)
+        self.model = YOLO(self.model_path, task="detect")
+        self.names = self.model.names
+        self.workers = workers or int(os.environ.get("AI_INFER_WORKERS", 2))
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        # Run one prediction on the base model so layer fusion happens once,
+        # before any replica shares the weights across threads.
+        with self._lock:
+            self.model.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, verbose=False)
+
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="yolo-worker")
+
+        if batch_window_ms is None:
+            batch_window_ms = float(os.environ.get("AI_BATCH_WINDOW_MS", 10))
+        if max_batch is None:
+            max_batch = int(os.environ.get("AI_MAX_BATCH", 8))
+        self.batcher = None
+        if batch_window_ms > 0 and max_batch > 1:
+            self.batcher = MicroBatcher(
+                self._predict_batch_local, self._pool, self.workers,
+                window_ms=batch_window_ms, max_batch=max_batch,
+            )
+
+    def _replica(self):
+        model = getattr(self._local, "model", None)
+        if model is None:
+            with self._lock:
+                model = copy.copy(self.model)
+                model.predictor = None
+            self._local.model = model
+        return model
+
+    def _predict_local(self, frame, conf, imgsz):
+        results = self._replica().predict(frame, conf=conf, imgsz=imgsz, verbose=False)[0]
+        return boxes_to_array(results.boxes)
+
+    def _predict_batch_local(self, frames, conf, imgsz):
+        results = self._replica().predict(frames, conf=conf, imgsz=imgsz, verbose=False)
+        return [boxes_to_array(r.boxes) for r in results]
+
+    def submit(self, frame, conf=0.45, imgsz=None):
+        """Queues a frame for inference and returns a Future. imgsz overrides the engine default."""
+        imgsz = imgsz or self.imgsz
+        if self.batcher is not None:
+            return self.batcher.submit(frame, conf, imgsz)
+        return self._pool.submit(self._predict_local, frame, conf, imgsz)
+
+    def warm_up(self, frame, imgsz=None):
+        """
+        Runs `frame` once on every worker thread, bypassing the batcher (which
+        would fold them into one pass on one replica), so each replica sets up
+        its predictor now instead of on its first real frame.
+        """
+        imgsz = imgsz or self.imgsz
+        # Holds every task until all have started, so each thread takes exactly one
+        barrier = threading.Barrier(self.workers)
+
+        def run():
+            barrier.wait()
+            if self.batcher is not None:
+                return self._predict_batch_local([frame], 0.45, imgsz)
+            return self._predict_local(frame, 0.45, imgsz)
+
+        for fut in [self._pool.submit(run) for _ in range(self.workers)]:
+            fut.result()
+
+    def predict(self, frame, conf=0.45, imgsz=None):
+        """Blocking prediction through the shared worker pool."""
+        return self.submit(frame, conf, imgsz).result()
+
+    def predict_batch(self, frames, conf=0.45, imgsz=None):
+        """One batched forward pass on the calling thread (used by inference processes)."""
+        return self._predict_batch_local(frames, conf, imgsz or self.imgsz)
+
+    def info(self):
+        return {"backend": self.backend, "model": self.model_path, "imgsz": self.imgsz, "workers": self.workers}
+
+    def batch_stats(self):
+        if self.batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batcher.stats()}
+
+    def shutdown(self):
+        if self.batcher is not None:
+            self.batcher.stop()
+        self._pool.shutdown(wait=False)
+
+
+class MicroBatcher:
+    """
+    Collects frames from all active streams for up to `window_ms` (or until
+    `max_batch` frames are waiting) and runs them as a single batch.
+
+    A batch is only dispatched when an inference worker is free, so under load
+    frames keep accumulating and batches grow on their own. Tracking is not
+    involved here; each session associates its own boxes afterwards.
+    """
+
+    def __init__(self, run_batch, pool, workers, window_ms=10, max_batch=8):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pool = pool
+        self._slots = threading.Semaphore(workers)
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._frames = 0
+        self._batches = 0
+        self._thread = threading.Thread(target=self._collect, daemon=True, name="yolo-batcher")
+        self._thread.start()
+
+    def submit(self, frame, conf, imgsz):
+        fut = Future()
+        self._queue.put((frame, (conf, imgsz), fut))
+        return fut
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            self._slots.acquire()
+            self._record(len(batch))
+            self._pool.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            # Requests with a different confidence threshold or input size cannot share a pass
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for (conf, imgsz), items in groups.items():
+                try:
+                    outputs = self.run_batch([frame for frame, _, _ in items], conf, imgsz)
+                except Exception as e:
+                    for _, _, fut in items:
+                        fut.set_exception(e)
+                    continue
+                for (_, _, fut), dets in zip(items, outputs):
+                    fut.set_result(dets)
+        finally:
+            self._slots.release()
+
+    def _record(self, size):
+        BATCH_SIZE.observe(size)
+        with self._stats_lock:
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._frames += size
+            self._batches += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "frames": self._frames,
+                "mean_batch_size": round(self._frames / self._batches, 2) if self._batches else 0.0,
+                "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+                "queued": self._queue.qsize(),
+            }
+
+    def stop(self):
+        self._queue.put(None)
+
+
+def boxes_to_array(boxes):
+    """Converts an ultralytics Boxes object into an (N, 6) float32 array."""
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    return boxes.data[:, :6].cpu().numpy().astype(np.float32)
@@ -0,0 +1,359 @@
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+from sampling import FrameSampler
+from sessions import SessionLimitError
+from metrics import FRAMES_DROPPED, observe_stage
+
+# Frames held back after (re)connecting before analysis starts, and the most ever buffered
+JITTER_FRAMES = int(os.environ.get("AI_INGEST_JITTER_FRAMES", 3))
+BUFFER_FRAMES = int(os.environ.get("AI_INGEST_BUFFER", 8))
+# Open / read timeout of network sources; a feed without frames for this long counts as stalled
+TIMEOUT_S = float(os.environ.get("AI_INGEST_TIMEOUT_S", 10))
+RECONNECT_MIN_S = 1.0
+RECONNECT_MAX_S = float(os.environ.get("AI_INGEST_RECONNECT_MAX_S", 30))
+
+# seq: frames read since the feed started (gaps mean dropped frames)
+IngestFrame = namedtuple("IngestFrame", ["seq", "arrived", "frame"])
+
+
+def _open_capture(source):
+    if isinstance(source, int) or os.path.exists(source):
+        return cv2.VideoCapture(source)
+    # Network stream: never let a dead camera block open() / read() forever
+    if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        ms = int(TIMEOUT_S * 1000)
+        return cv2.VideoCapture(source, cv2.CAP_FFMPEG,
+                                [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms])
+    return cv2.VideoCapture(source)
+
+
+class CameraFeed:
+    """
+    Reads one camera continuously on a background thread.
+
+    The source is an RTSP / HTTP URL, a device index, or a local video file,
+    which is replayed in a loop at its own frame rate as a stand-in for a
+    camera. Lost connections are retried with exponential backoff (plus
+    jitter, so many cameras behind one failed switch do not reconnect in
+    lockstep). Frames go through a small jitter buffer: bursts of network
+    delivery are absorbed by up to `max_buffer` frames, read() only starts
+    handing out frames of a new connection once JITTER_FRAMES have arrived,
+    and when the analyser falls behind the oldest frames are dropped - a
+    live feed is only useful fresh.
+    """
+
+    def __init__(self, camera_id, source, loop=None, jitter_frames=None, max_buffer=None):
+        self.camera_id = camera_id
+        self.source = int(source) if str(source).isdigit() else source
+        self.loop = os.path.isfile(str(self.source)) if loop is None else loop
+        self.jitter_frames = jitter_frames or JITTER_FRAMES
+        self.max_buffer = max(max_buffer or BUFFER_FRAMES, self.jitter_frames)
+        self.fps = 0.0
+
+        self.state = "idle"
+        self.last_error = None
+        self.connected_since = None
+        self.last_frame_at = None
+        self.reconnects = 0
+        self.loops = 0
+        self.frames_read = 0
+        self.dropped = 0
+
+        self._buffer = deque()
+        self._filling = True
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"ingest-{self.camera_id}")
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and wait:
+            self._thread.join(timeout=TIMEOUT_S)
+
+    # ---------- producer ----------
+
+    def _run(self):
+        backoff = RECONNECT_MIN_S
+        while not self._stop.is_set():
+            self.state = "connecting"
+            cap = _open_capture(self.source)
+            try:
+                if cap.isOpened():
+                    if self._read_until_lost(cap):
+                        backoff = RECONNECT_MIN_S
+                else:
+                    self.last_error = "could not open source"
+            finally:
+                cap.release()
+            if self._stop.is_set():
+                break
+
+            self.state = "reconnecting"
+            self.reconnects += 1
+            self.connected_since = None
+            print(f"Camera {self.camera_id}: {self.last_error}; reconnecting in {backoff:.1f}s", flush=True)
+            self._stop.wait(backoff * random.uniform(0.8, 1.2))
+            backoff = min(RECONNECT_MAX_S, backoff * 2)
+        self.state = "stopped"
+
+    def _read_until_lost(self, cap):
+        """Reads until the source fails; returns True if any frame was received."""
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # Files are replayed in real time; live sources pace themselves
+        interval = 1.0 / (self.fps or 25.0) if self.loop else 0.0
+        received = False
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            ok, frame = cap.read()
+            observe_stage("decode", time.perf_counter() - start)
+            if not ok:
+                if self.loop and received and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                    self.loops += 1
+                    continue
+                self.last_error = "stream ended" if received else "no frames received"
+                return received
+            if not received:
+                received = True
+                with self._cond:
+                    self._filling = True
+                self.state = "streaming"
+                self.connected_since = time.time()
+                self.last_error = None
+            self._push(frame)
+            if interval:
+                next_due = max(next_due + interval, time.monotonic() - interval)
+                self._stop.wait(max(0.0, next_due - time.monotonic()))
+        return received
+
+    def _push(self, frame):
+        now = time.monotonic()
+        with self._cond:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+                FRAMES_DROPPED.inc(reason="ingest_overflow")
+            self._buffer.append(IngestFrame(self.frames_read, now, frame))
+            self.frames_read += 1
+            self.last_frame_at = now
+            if len(self._buffer) >= self.jitter_frames:
+                self._filling = False
+            self._cond.notify_all()
+
+    # ---------- consumer ----------
+
+    def read(self, timeout=1.0):
+        """Next buffered IngestFrame, or None if none is released within `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._filling or not self._buffer) and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if not self._buffer:
+                return None
+            return self._buffer.popleft()
+
+    def stats(self):
+        age = time.monotonic() - self.last_frame_at if self.last_frame_at is not None else None
+        with self._cond:
+            buffered = len(self._buffer)
+        return {
+            "state": "stalled" if self.state == "streaming" and age is not None and age > TIMEOUT_S else self.state,
+            "source_fps": round(self.fps, 2),
+            "looping": self.loop,
+            "connected_since": self.connected_since,
+            "last_frame_age_s": round(age, 2) if age is not None else None,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.dropped,
+            "buffered": buffered,
+            "reconnects": self.reconnects,
+            "loops": self.loops,
+            "last_error": self.last_error,
+        }
+
+
+class CameraIngest:
+    """
+    One configured camera: a CameraFeed plus an analysis thread that runs
+    every sampled frame through its own detector session and hands each
+    result to `on_result(camera, result)` (and None once it stops).
+    """
+
+    def __init__(self, camera, loader, on_result=None):
+        self.camera = camera
+        self.loader = loader
+        self.on_result = on_result
+        self.feed = CameraFeed(camera.camera_id, camera.source, loop=camera.loop)
+        self.sampler = FrameSampler.from_params()
+        self.state = "starting"
+        self.analysed = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_result = None
+        self._analyse_fps = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.feed.start()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"analyse-{self.camera.camera_id}")
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self.feed.stop(wait)
+        if self._thread is not None and wait:
+            self._thread.join(timeout=TIMEOUT_S)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.state = "waiting_for_model"
+                sessions = self.loader.wait().sessions
+                detector = self._open_session(sessions)
+                if detector is None:
+                    break
+                try:
+                    self.state = "analysing"
+                    self._analyse(detector)
+                finally:
+                    sessions.close(detector.session_id)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"Camera {self.camera.camera_id} analysis failed: {e}", flush=True)
+                self._stop.wait(RECONNECT_MIN_S)
+        self.state = "stopped"
+        if self.on_result is not None:
+            self.on_result(self.camera, None)
+
+    def _open_session(self, sessions):
+        """Waits for a free stream slot; every camera holds one for as long as it runs."""
+        while not self._stop.is_set():
+            try:
+                return sessions.open(str(self.camera.source), kind="camera", camera=self.camera)
+            except SessionLimitError:
+                self.state = "waiting_for_slot"
+                self._stop.wait(RECONNECT_MIN_S)
+        return None
+
+    def _analyse(self, detector):
+        last, interval = None, None
+        while not self._stop.is_set():
+            item = self.feed.read(timeout=1.0)
+            if item is None:
+                continue
+            if self.feed.fps:
+                self.sampler.set_source_fps(self.feed.fps)
+            if not self.sampler.should_analyse(item.seq):
+                FRAMES_DROPPED.inc(reason="sampled")
+                continue
+            detector.FRAME_SKIP = self.sampler.mark(item.seq)
+            res = detector.detect(item.frame, is_static=False)
+            self.sampler.observe(res)
+            self.analysed += 1
+            self.last_result = res
+
+            now = time.monotonic()
+            if last is not None:
+                gap = now - last
+                interval = gap if interval is None else 0.9 * interval + 0.1 * gap
+                self._analyse_fps = 1.0 / max(interval, 1e-6)
+            last = now
+
+            if self.on_result is not None:
+                self.on_result(self.camera, res)
+
+    def stats(self):
+        res = self.last_result or {}
+        return {
+            "camera": self.camera.camera_id,
+            "junction": self.camera.junction,
+            "analysis": self.state,
+            "frames_analysed": self.analysed,
+            "analyse_fps": round(self._analyse_fps, 2) if self._analyse_fps else None,
+            "stride": self.sampler.stride,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "count": res.get("count"),
+            "emergency": res.get("emergency"),
+            "feed": self.feed.stats(),
+        }
+
+
+class IngestSupervisor:
+    """
+    Runs every camera that has a `source` in cameras.json, continuously,
+    in this process. Each camera gets its own reader and analysis thread;
+    inference goes through the shared engine, so frames of different
+    cameras are batched together.
+    """
+
+    def __init__(self, loader, on_result=None):
+        self.loader = loader
+        self.on_result = on_result
+        self._cameras = {}
+        self._lock = threading.Lock()
+
+    def start(self, cameras):
+        for camera in cameras.values():
+            if camera.source is not None:
+                self.add(camera)
+        if self._cameras:
+            print(f"Ingesting {len(self._cameras)} cameras", flush=True)
+
+    def add(self, camera):
+        with self._lock:
+            if camera.camera_id in self._cameras:
+                return self._cameras[camera.camera_id]
+            ingest = self._cameras[camera.camera_id] = CameraIngest(camera, self.loader, self.on_result)
+        return ingest.start()
+
+    def remove(self, camera_id):
+        with self._lock:
+            ingest = self._cameras.pop(camera_id, None)
+        if ingest is not None:
+            ingest.stop()
+        return ingest
+
+    def restart(self, camera_id):
+        ingest = self.remove(camera_id)
+        return self.add(ingest.camera) if ingest is not None else None
+
+    def stop(self):
+        with self._lock:
+            running = list(self._cameras.values())
+            self._cameras.clear()
+        # Daemon threads: signal them all and let them wind down on their own
+        for ingest in running:
+            ingest.stop(wait=False)
+
+    def states(self):
+        """Camera count per feed state, for the metrics gauge."""
+        counts = {}
+        for stats in self.stats():
+            key = (stats["feed"]["state"],)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def stats(self):
+        with self._lock:
+            running = list(self._cameras.values())
+        return [ingest.stats() for ingest in running]
@@ -0,0 +1,230 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+
+from model_loader import ModelUnavailable
+from result_cache import analysis_fingerprint, cacheable_summary, summary_for_upload
+from sessions import SessionLimitError
+
+# Lower runs first; emergency re-checks jump ahead of routine uploads
+PRIORITIES = {"emergency": 0, "high": 1, "normal": 5, "low": 9}
+
+FINISHED = ("completed", "failed", "cancelled")
+
+# Options of VehicleDetector.process_video that shape a summary (part of the cache key)
+SUMMARY_OPTIONS = {"sampling": "stride:10"}
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when AI_JOB_QUEUE jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, path, filename, priority="normal", callback_url=None, camera=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.filename = filename
+        self.camera = camera
+        self.priority = priority
+        self.callback_url = callback_url
+        self.state = "queued"
+        self.frames_done = 0
+        self.total_frames = 0
+        self.result = None
+        self.cached = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def progress(self):
+        if self.state == "completed":
+            return 1.0
+        if self.total_frames:
+            return round(min(1.0, self.frames_done / self.total_frames), 4)
+        return 0.0
+
+    def describe(self):
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "priority": self.priority,
+            "state": self.state,
+            "progress": self.progress,
+            "frames_done": self.frames_done,
+            "total_frames": self.total_frames,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs /api/process_video/-style analyses in the background.
+
+    A bounded pool of AI_JOB_WORKERS threads pulls jobs from a priority queue
+    (at most AI_JOB_QUEUE waiting). Results go through the shared analysis
+    cache, and an optional callback URL receives the finished job as JSON.
+    """
+
+    def __init__(self, loader, cache, workers=None, max_queued=None, history=None):
+        self.loader = loader
+        self.cache = cache
+        self.workers = workers or int(os.environ.get("AI_JOB_WORKERS", 2))
+        self.max_queued = max_queued or int(os.environ.get("AI_JOB_QUEUE", 64))
+        self.history = history or int(os.environ.get("AI_JOB_HISTORY", 200))
+        self._jobs = {}
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}")
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put((-1, next(self._seq), None))
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    def submit(self, path, filename, priority="normal", callback_url=None, camera=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        job = Job(path, filename, priority, callback_url, camera)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.state == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"Job queue full ({self.max_queued} waiting)")
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._queue.put((PRIORITIES[priority], next(self._seq), job))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with self._lock:
+            # Queued jobs are dropped (and their callback sent) by the worker when dequeued
+            if job.state == "queued":
+                self._finish(job, "cancelled")
+        return job
+
+    def describe(self):
+        with self._lock:
+            return [job.describe() for job in sorted(self._jobs.values(), key=lambda j: j.created_at)]
+
+    # -------------------------
+    # Workers
+    # -------------------------
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                skipped = job.state != "queued"
+                if not skipped:
+                    job.state = "running"
+                    job.started_at = time.time()
+            if skipped:
+                # Cancelled while queued: never ran, but the callback still hears about it
+                if job.state == "cancelled":
+                    self._notify(job)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"Job {job.job_id} failed: {e}", flush=True)
+                with self._lock:
+                    job.error = str(e)
+                    self._finish(job, "failed")
+            self._notify(job)
+
+    def _run(self, job):
+        try:
+            loader = self.loader.wait()
+        except ModelUnavailable as e:
+            raise RuntimeError(str(e))
+
+        fingerprint = analysis_fingerprint(loader.engine, camera=job.camera, **SUMMARY_OPTIONS)
+        key = self.cache.key_for(job.path, fingerprint)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                job.result, job.cached = summary_for_upload(cached, job.path), True
+                self._finish(job, "completed")
+            return
+
+        def progress(done, total):
+            job.frames_done, job.total_frames = done, total
+
+        detector = self._open_session(loader.sessions, job)
+        if detector is None:
+            with self._lock:
+                self._finish(job, "cancelled")
+            return
+        try:
+            summary = detector.process_video(job.path, progress=progress, stop_event=job.cancel_event)
+        finally:
+            loader.sessions.close(detector.session_id)
+
+        with self._lock:
+            if job.cancel_event.is_set():
+                self._finish(job, "cancelled")
+                return
+        self.cache.put(key, cacheable_summary(summary), fingerprint)
+        with self._lock:
+            job.result = summary
+            self._finish(job, "completed")
+
+    def _open_session(self, sessions, job):
+        """Waits for a free stream slot (live streams may hold all of them)."""
+        while not job.cancel_event.is_set():
+            try:
+                return sessions.open(job.path, kind="job", camera=job.camera)
+            except SessionLimitError:
+                time.sleep(1.0)
+        return None
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.state in FINISHED]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.job_id]
+
+    def _notify(self, job):
+        if not job.callback_url:
+            return
+        import requests
+
+        payload = job.describe()
+        if job.state == "completed":
+            payload["summary"] = job.result
+        try:
+            requests.post(job.callback_url, json=payload, timeout=5)
+        except Exception as e:
+            print(f"WARNING: Job {job.job_id} callback to {job.callback_url} failed: {e}", flush=True)
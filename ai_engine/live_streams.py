@@ -0,0 +1,377 @@
+import asyncio
+import base64
+import os
+import time
+import uuid
+from collections import deque
+
+import cv2
+
+from model_loader import ModelUnavailable
+from pipeline import FramePipeline
+from sessions import SessionLimitError
+from metrics import FRAMES_DROPPED
+
+# A stream nobody watches any more is stopped after this many seconds
+LINGER_S = float(os.environ.get("AI_STREAM_LINGER_S", 5))
+
+# Output quality tiers: (scale, JPEG quality). Tier 0 matches the original full-size output.
+QUALITY_TIERS = (
+    (1.0, 95),
+    (1.0, 75),
+    (0.75, 65),
+    (0.5, 55),
+    (0.35, 45),
+)
+# Seconds between tier changes of one client, and frames without backlog before stepping up
+TIER_COOLDOWN_S = 1.0
+UPGRADE_AFTER = 30
+# A client taking frames this much more slowly than they are published is
+# falling behind even while its queue happens to be empty: no upgrades
+SLOW_CLIENT_RATIO = 1.2
+
+
+def frame_metadata(index, res, counts, snapshot_path):
+    """Lightweight per-frame detection event, keyed by frame number."""
+    return {
+        "frame_index": index,
+        "counts": counts,
+        "emergency": res["emergency"],
+        "accident_type": res["accident_type"],
+        "severity": res["severity"],
+        "snapshot_path": snapshot_path,
+        "completed": False,
+    }
+
+
+def is_critical(meta):
+    """Metadata that must reach every client, however slow."""
+    return bool(meta.get("emergency") or meta.get("accident_type") or meta.get("completed") or meta.get("error"))
+
+
+class TieredEncoder:
+    """
+    Pipeline encoder that JPEG-encodes each frame once per quality tier
+    currently requested by any client of the stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, frame):
+        buffers = {}
+        scaled = {}
+        for tier in self.stream.wanted_tiers:
+            scale, quality = QUALITY_TIERS[tier]
+            img = scaled.get(scale)
+            if img is None:
+                if scale < 1.0:
+                    h, w = frame.shape[:2]
+                    img = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                     interpolation=cv2.INTER_AREA)
+                else:
+                    img = frame
+                scaled[scale] = img
+            ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                buffers[tier] = buf.tobytes()
+        return buffers or None
+
+
+class Subscriber:
+    """
+    One client attached to a LiveStream.
+
+    Items are ("meta", index, dict), ("frame", index, jpeg_bytes) or, for
+    bundled (SSE) clients, ("bundle", index, (dict, base64_jpeg)); None ends
+    the stream. Offers never block the producer: when the client falls behind,
+    the oldest pending frame is dropped and the client's quality tier steps
+    down; once it keeps up again (no backlog, and frames taken about as fast
+    as they are published) the tier steps back up. Critical metadata
+    (emergency / accident / completion) is never dropped.
+    """
+
+    def __init__(self, frames=True, metadata=True, bundled=False, max_frames=3, max_meta=64):
+        self.frames = frames or bundled
+        self.metadata = metadata and not bundled
+        self.bundled = bundled
+        self.max_frames = max_frames
+        self.max_meta = max_meta
+        self.tier = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+
+        self._items = deque()
+        self._ready = asyncio.Event()
+        self._pending = {"frame": 0, "meta": 0}
+        self._pressure = False
+        self._calm = 0
+        self._last_change = time.monotonic()
+        self._last_get = None
+        self._interval = None
+        self._last_publish = None
+        self._publish_interval = None
+
+    def offer(self, item, droppable=True):
+        if self.closed:
+            return
+        if item is not None and droppable:
+            lane = "meta" if item[0] == "meta" else "frame"
+            limit = self.max_meta if lane == "meta" else self.max_frames
+            if self._pending[lane] >= limit:
+                self._drop_oldest(lane)
+            self._pending[lane] += 1
+            self._items.append((lane, item))
+        else:
+            self._items.append((None, item))
+        self._ready.set()
+
+    def _drop_oldest(self, lane):
+        for i, (item_lane, _) in enumerate(self._items):
+            if item_lane == lane:
+                del self._items[i]
+                self._pending[lane] -= 1
+                if lane == "frame":
+                    self.dropped += 1
+                    self._pressure = True
+                    FRAMES_DROPPED.inc(reason="slow_client")
+                return
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        lane, item = self._items.popleft()
+        if lane is not None:
+            self._pending[lane] -= 1
+        if lane == "frame":
+            now = time.monotonic()
+            if self._last_get is not None:
+                gap = now - self._last_get
+                self._interval = gap if self._interval is None else 0.8 * self._interval + 0.2 * gap
+            self._last_get = now
+            self.delivered += 1
+        return item
+
+    def is_slow(self):
+        """True while the measured consume rate is below the producer's frame rate."""
+        if self._interval is None or self._publish_interval is None:
+            return False
+        return self._interval > SLOW_CLIENT_RATIO * self._publish_interval
+
+    def adapt(self):
+        """Called once per published frame: adjusts the quality tier to the client's pace."""
+        now = time.monotonic()
+        if self._last_publish is not None:
+            gap = now - self._last_publish
+            self._publish_interval = gap if self._publish_interval is None else 0.8 * self._publish_interval + 0.2 * gap
+        self._last_publish = now
+        if now - self._last_change < TIER_COOLDOWN_S:
+            return
+        if self._pressure:
+            if self.tier < len(QUALITY_TIERS) - 1:
+                self.tier += 1
+                self._last_change = now
+            self._pressure = False
+            self._calm = 0
+        # The frame just offered is always pending here; anything beyond it is backlog
+        elif self._pending["frame"] <= 1 and not self.is_slow():
+            self._calm += 1
+            if self._calm >= UPGRADE_AFTER and self.tier > 0:
+                self.tier -= 1
+                self._last_change = now
+                self._calm = 0
+        else:
+            self._calm = 0
+
+    def close(self):
+        self.closed = True
+        self._items.clear()
+
+    def describe(self):
+        return {
+            "tier": self.tier,
+            "scale": QUALITY_TIERS[self.tier][0],
+            "jpeg_quality": QUALITY_TIERS[self.tier][1],
+            "pending_frames": self._pending["frame"],
+            "dropped_frames": self.dropped,
+            "delivered_frames": self.delivered,
+            "consume_fps": round(1.0 / self._interval, 2) if self._interval else None,
+            "publish_fps": round(1.0 / self._publish_interval, 2) if self._publish_interval else None,
+        }
+
+
+class LiveStream:
+    """
+    One analysed source fanned out to every client watching it.
+
+    Frames are analysed once by a FramePipeline and JPEG-encoded once per
+    quality tier in use; binary frames (MJPEG / WebSocket) and metadata events
+    (SSE / WebSocket text) are then published separately, both tagged with the
+    frame index. Each client gets the tier matching its own consumption rate.
+    """
+
+    def __init__(self, stream_id, video_path, loader, sampler=None, on_close=None, camera=None, on_result=None):
+        self.stream_id = stream_id
+        self.video_path = video_path
+        self.loader = loader
+        self.sampler = sampler
+        self.camera = camera
+        self.on_close = on_close
+        # on_result(camera, result) per analysed frame and (camera, None) at the end; camera streams only
+        self.on_result = on_result if camera is not None else None
+        self.started_at = time.time()
+        self.frames_published = 0
+        # Read by the encode thread; replaced (never mutated) on the event loop
+        self.wanted_tiers = (0,)
+        self._subscribers = []
+        self._idle_since = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def subscribe(self, frames=True, metadata=True, bundled=False):
+        sub = Subscriber(frames, metadata, bundled)
+        self._subscribers.append(sub)
+        self._idle_since = None
+        self._update_tiers()
+        return sub
+
+    def unsubscribe(self, sub):
+        sub.close()
+        if sub in self._subscribers:
+            self._subscribers.remove(sub)
+        if not self._subscribers:
+            self._idle_since = time.monotonic()
+        self._update_tiers()
+
+    def _update_tiers(self):
+        tiers = {sub.tier for sub in self._subscribers if sub.frames}
+        self.wanted_tiers = tuple(sorted(tiers)) or (0,)
+
+    def _publish_frame(self, index, meta, buffers):
+        critical = is_critical(meta)
+        encoded = {}
+        for sub in list(self._subscribers):
+            if sub.frames:
+                # The client's tier may have changed after this frame was encoded
+                tier = min(buffers, key=lambda t: abs(t - sub.tier))
+                if sub.bundled:
+                    if tier not in encoded:
+                        encoded[tier] = base64.b64encode(buffers[tier]).decode()
+                    sub.offer(("bundle", index, (meta, encoded[tier])), droppable=not critical)
+                else:
+                    if sub.metadata:
+                        sub.offer(("meta", index, meta), droppable=not critical)
+                    sub.offer(("frame", index, buffers[tier]))
+                sub.adapt()
+            elif sub.metadata:
+                sub.offer(("meta", index, meta), droppable=not critical)
+        self._update_tiers()
+
+    def _publish_event(self, payload):
+        """Final / error events, delivered to every client that takes metadata."""
+        for sub in list(self._subscribers):
+            if sub.bundled:
+                sub.offer(("bundle", None, (payload, None)), droppable=False)
+            elif sub.metadata:
+                sub.offer(("meta", None, payload), droppable=False)
+
+    def _abandoned(self):
+        return self._idle_since is not None and time.monotonic() - self._idle_since > LINGER_S
+
+    async def _run(self):
+        try:
+            try:
+                sessions = (await self.loader.wait_async()).sessions
+                detector = sessions.open(self.video_path, kind="live", camera=self.camera)
+            except (ModelUnavailable, SessionLimitError) as e:
+                self._publish_event({"error": str(e), "completed": True})
+                return
+
+            try:
+                await self._stream(detector)
+            finally:
+                sessions.close(detector.session_id)
+        except Exception as e:
+            print(f"Live stream {self.stream_id} failed: {e}", flush=True)
+            self._publish_event({"error": str(e), "completed": True})
+        finally:
+            for sub in list(self._subscribers):
+                sub.offer(None, droppable=False)
+            if self.on_close is not None:
+                self.on_close(self)
+
+    async def _stream(self, detector):
+        pipeline = FramePipeline(self.video_path, detector, sampler=self.sampler, encoder=TieredEncoder(self))
+        results = pipeline.results()
+        try:
+            async for index, buffers, res, counts, snapshot_path in results:
+                self._publish_frame(index, frame_metadata(index, res, counts, snapshot_path), buffers)
+                self.frames_published += 1
+                if self.on_result is not None:
+                    self.on_result(self.camera, res)
+                if self._abandoned():
+                    return
+        finally:
+            await results.aclose()
+            if self.on_result is not None:
+                self.on_result(self.camera, None)
+
+        if pipeline.error:
+            self._publish_event({"error": pipeline.error, "completed": True})
+            return
+        self._publish_event({
+            "completed": True,
+            "counts": detector.total_counts,
+            "emergency": detector.accident_confirmed,
+            "accident_type": detector.accident_type if detector.accident_confirmed else None,
+            "severity": detector.accident_severity if detector.accident_confirmed else None,
+            "snapshot_path": pipeline.snapshot_path,
+        })
+
+    def describe(self):
+        return {
+            "stream_id": self.stream_id,
+            "source": os.path.basename(self.video_path),
+            "subscribers": len(self._subscribers),
+            "frames_published": self.frames_published,
+            "encoded_tiers": list(self.wanted_tiers),
+            "clients": [sub.describe() for sub in self._subscribers if sub.frames],
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+
+class StreamRegistry:
+    """
+    Live streams by id, so an MJPEG <img> and a metadata EventSource opened
+    with the same client-chosen stream_id share one analysis.
+    """
+
+    def __init__(self, loader, on_result=None):
+        self.loader = loader
+        self.on_result = on_result
+        self._streams = {}
+
+    def attach(self, video_path, stream_id=None, sampler=None, camera=None):
+        """Returns the stream with this id, starting it on first use."""
+        stream_id = stream_id or uuid.uuid4().hex[:12]
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            stream = LiveStream(stream_id, video_path, self.loader, sampler,
+                                on_close=self._closed, camera=camera, on_result=self.on_result).start()
+            self._streams[stream_id] = stream
+        return stream
+
+    def _closed(self, stream):
+        if self._streams.get(stream.stream_id) is stream:
+            del self._streams[stream.stream_id]
+
+    def get(self, stream_id):
+        return self._streams.get(stream_id)
+
+    def describe(self):
+        return [s.describe() for s in self._streams.values()]
@@ -1,23 +1,36 @@
 import os
 import sys
+import math
 import cv2
 import numpy as np
-import base64
 import asyncio
 import json
 import uuid
 import zipfile
 import shutil
+from contextlib import asynccontextmanager
 import sumo_parser
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from sse_starlette.sse import EventSourceResponse
 
-from detector import VehicleDetector
+from model_loader import ModelLoader, ModelUnavailable
+from sessions import SessionLimitError
+from result_cache import AnalysisCache, analysis_fingerprint, cacheable_summary, summary_for_upload
+from jobs import JobManager, JobQueueFull, SUMMARY_OPTIONS
+from live_streams import StreamRegistry, frame_metadata
+from camera_config import load_cameras
+from ingest import IngestSupervisor
+from pipeline import ACTIVE_PIPELINES
+from snapshots import snapshot_writer
+from sampling import FrameSampler
+import motion_gate
+import metrics
 from traffic_logic import TrafficController
+from traffic_state import TrafficState, STREAM_HZ
 import threading
 import time
 
@@ -37,7 +50,36 @@ except ImportError:
 
 load_dotenv()
 
-app = FastAPI(title="SmartWay Traffic AI Engine")
+# =========================
+# Model Initialization
+# =========================
+
+# Per-camera input size / ROI / lanes (cameras.json, see cameras.example.json)
+cameras = load_cameras()
+
+# Cameras with a "source" in cameras.json are read and analysed continuously;
+# each one's results feed its junction in traffic_state (AI_INGEST=0 disables)
+INGEST_ENABLED = os.environ.get("AI_INGEST", "1") == "1"
+INGEST_CAMERAS = sum(1 for c in cameras.values() if c.source is not None) if INGEST_ENABLED else 0
+
+# Weights are loaded once, in the background, so the server binds immediately;
+# every stream gets its own detector session once the loader is ready. Ingested
+# cameras get one reserved session each, outside the AI_MAX_STREAMS budget.
+loader = ModelLoader(warmup_sizes=[c.imgsz for c in cameras.values() if c.imgsz],
+                     camera_sessions=INGEST_CAMERAS)
+
+@asynccontextmanager
+async def lifespan(app):
+    loader.start()
+    jobs.start()
+    if INGEST_ENABLED:
+        ingest.start(cameras)
+    yield
+    ingest.stop()
+    jobs.stop()
+    loader.shutdown()
+
+app = FastAPI(title="SmartWay Traffic AI Engine", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,33 +89,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+controller = TrafficController()
+
+# Summaries of already analysed uploads, keyed by file content + detector config
+analysis_cache = AnalysisCache()
+
+# Background video analysis (submit / poll / cancel) instead of one long HTTP call
+jobs = JobManager(loader, analysis_cache)
+
+# Binary live streams (MJPEG / WebSocket) shared by every client using the same stream_id;
+# streams opened with a camera that has a junction feed it like ingested cameras
+live_streams = StreamRegistry(loader, on_result=lambda camera, res: apply_camera_result(camera, res))
+
+ingest = IngestSupervisor(loader, on_result=lambda camera, res: apply_camera_result(camera, res))
+
 # =========================
-# Model Initialization
+# Metrics (gauges are only evaluated when /metrics is scraped)
 # =========================
 
-try:
-    detector = VehicleDetector()
-    print("YOLOv8 Model Loaded Successfully")
-except Exception as e:
-    print(f"Model Load Failed: {e}")
-    detector = None
-
-controller = TrafficController()
+def _queue_depths():
+    depths = {("pipeline_analysed",): 0, ("reader_ring",): 0}
+    for pipeline in list(ACTIVE_PIPELINES):
+        d = pipeline.queue_depths()
+        depths[("pipeline_analysed",)] += d["analysed"]
+        depths[("reader_ring",)] += d["reader_ring"]
+    if loader.ready:
+        queued = loader.engine.batch_stats().get("queued")
+        if queued is not None:
+            depths[("inference_batch",)] = queued
+    return depths
+
+metrics.gauge("ai_active_streams", "Open detector sessions.",
+              lambda: loader.sessions.active_count() if loader.ready else 0)
+metrics.gauge("ai_queue_depth", "Items waiting in engine queues.", _queue_depths, labels=("queue",))
+metrics.gauge("ai_model_loaded", "1 when the YOLO model is loaded and warmed up.", lambda: int(loader.ready))
+metrics.gauge("ai_motion_gate_hit_ratio", "Share of gated frames that reused detections instead of running YOLO.",
+              motion_gate.hit_ratio)
+metrics.gauge("ai_traffic_stream_clients", "Clients connected to /traffic/stream.",
+              lambda: traffic_state.subscriber_count())
+metrics.gauge("ai_ingest_cameras", "Continuously ingested cameras by feed state.", ingest.states,
+              labels=("state",))
 
 # =========================
 # Global Traffic State
 # =========================
 
-traffic_state = {
-    "junctions": {
-        "J-01": {"density": 0, "status": "green", "emergency": False},
-        "J-02": {"density": 0, "status": "red", "emergency": False},
-        "J-03": {"density": 0, "status": "red", "emergency": False},
-        "J-04": {"density": 0, "status": "green", "emergency": False},
-    },
-    "alerts": [],
-    "mode": "AI_OPTIMIZED"
-}
+traffic_state = TrafficState({
+    "J-01": {"density": 0, "status": "green", "emergency": False},
+    "J-02": {"density": 0, "status": "red", "emergency": False},
+    "J-03": {"density": 0, "status": "red", "emergency": False},
+    "J-04": {"density": 0, "status": "green", "emergency": False},
+})
+
+def apply_camera_result(camera, res):
+    """Feeds a camera's detection result (None once it stops) into its junction."""
+    if camera.junction:
+        traffic_state.apply_reading(camera.camera_id, camera.junction, res)
 
 # =========================
 # SUMO Simulation Globals
@@ -150,6 +221,13 @@ class OverrideRequest(BaseModel):
 
 class ProcessRequest(BaseModel):
     filename: str
+    camera: str | None = None
+
+class JobRequest(BaseModel):
+    filename: str
+    priority: str = "normal"
+    callback_url: str | None = None
+    camera: str | None = None
 
 # =========================
 # Helpers
@@ -159,72 +237,47 @@ def get_upload_path(filename):
     base_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_dir, "..", "backend", "uploads", filename)
 
+def get_camera(camera_id):
+    if not camera_id:
+        return None
+    if camera_id not in cameras:
+        raise HTTPException(404, f"Unknown camera {camera_id}")
+    return cameras[camera_id]
+
+def resolve_source(file):
+    if file.startswith("stored:"):
+        return get_upload_path(file.replace("stored:", ""))
+    return file
+
 # =========================
 # Core SSE Generator
 # =========================
 
-async def generate_frames(video_path):
-    if detector is None:
-        yield {"data": json.dumps({"error": "AI model not loaded. Check server logs.", "completed": True})}
-        return
-
-    img = cv2.imread(video_path)
-    is_image = img is not None
-    cap = None if is_image else cv2.VideoCapture(video_path)
-
-    detector.reset()
-    snapshot_path = None
-    snapshot_taken = False
-
-    def stream():
-        if is_image:
-            yield True, img
-        else:
-            while cap.isOpened():
-                yield cap.read()
-
-    for ok, frame in stream():
-        if not ok:
-            break
-
-        # ✅ FIXED (CORRECT): Force static mode for images / single frames
-        res = detector.detect(frame, is_static=is_image)
-
-        # SNAPSHOT ONLY ON CONFIRMED ACCIDENT OR STATIC IMAGE
-        if (res["emergency"] or is_image) and not snapshot_taken:
-            snapshot_path = f"{os.path.dirname(video_path)}/snapshot_{uuid.uuid4().hex}.jpg"
-            cv2.imwrite(snapshot_path, frame)
-            snapshot_taken = True
-
-        _, buf = cv2.imencode(".jpg", frame)
-        payload = {
-            "frame": base64.b64encode(buf).decode(),
-            "counts": detector.total_counts,
-            "emergency": res["emergency"],
-            "accident_type": res["accident_type"],
-            "severity": res["severity"],
-            "snapshot_path": snapshot_path,
-            "completed": False
-        }
-
-        yield {"data": json.dumps(payload)}
-        await asyncio.sleep(0.02)
-
-    # Force capture from detector state at end
-    final_type = detector.accident_type if detector.accident_confirmed else None
-    final_sev = detector.accident_severity if detector.accident_confirmed else None
-    
-    print(f"DEBUG: Final Yield - Emergency: {detector.accident_confirmed}, Type: {final_type}", flush=True)
-
-    # Single final completion payload (duplicate removed)
-    yield {"data": json.dumps({
-        "completed": True,
-        "counts": detector.total_counts,
-        "emergency": detector.accident_confirmed,
-        "accident_type": final_type,
-        "severity": final_sev,
-        "snapshot_path": snapshot_path
-    })}
+async def generate_frames(video_path, sampler=None, camera=None):
+    # Each SSE client gets its own stream; analysis and JPEG encode run on
+    # pipeline threads, and a client that reads slowly gets smaller frames or
+    # skipped intermediate frames (never skipped emergency / accident events).
+    stream = live_streams.attach(video_path, sampler=sampler, camera=camera)
+    sub = stream.subscribe(bundled=True)
+    try:
+        while True:
+            item = await sub.get()
+            if item is None:
+                break
+            _, index, (meta, frame_b64) = item
+            payload = meta if frame_b64 is None else {"frame": frame_b64, **meta}
+            if payload.get("completed"):
+                print(f"DEBUG: Final Yield - Emergency: {payload.get('emergency')}, "
+                      f"Type: {payload.get('accident_type')}", flush=True)
+
+            send_start = time.perf_counter()
+            yield {"data": json.dumps(payload)}
+            metrics.observe_stage("sse_send", time.perf_counter() - send_start)
+            if payload.get("completed"):
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        stream.unsubscribe(sub)
 
 # =========================
 # Routes
@@ -232,44 +285,271 @@ async def generate_frames(video_path):
 
 @app.get("/")
 def root():
-    return {"status": "AI Engine Online", "model_ready": detector is not None}
+    return {"status": "AI Engine Online", "model_ready": loader.ready}
+
+@app.get("/health/live")
+def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness():
+    status = loader.status()
+    if not loader.ready:
+        return JSONResponse(status, status_code=503)
+    return status
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/engine/stats")
+def engine_stats():
+    if not loader.ready:
+        raise HTTPException(503, f"AI model {loader.state}.")
+    return {**loader.engine.info(), "batching": loader.engine.batch_stats()}
+
+@app.get("/api/sessions")
+def list_sessions():
+    if not loader.ready:
+        return {"active": 0, "sessions": []}
+    sessions = loader.sessions
+    cameras_active = sessions.active_count("camera")
+    return {"active": sessions.active_count() - cameras_active, "max": sessions.max_sessions,
+            "camera_active": cameras_active, "camera_max": sessions.max_camera_sessions,
+            "sessions": sessions.describe()}
 
 @app.post("/traffic/override")
 def override_signal(req: OverrideRequest):
-    if req.junction_id not in traffic_state["junctions"]:
+    try:
+        traffic_state.override(req.junction_id, req.action, req.mode)
+    except KeyError:
         raise HTTPException(404, "Invalid junction")
-
-    traffic_state["mode"] = req.mode
-    for jid in traffic_state["junctions"]:
-        traffic_state["junctions"][jid]["status"] = "red"
-
-    traffic_state["junctions"][req.junction_id]["status"] = req.action
-    return traffic_state
+    return traffic_state.snapshot()
 
 @app.get("/traffic/state")
 def get_state():
-    return traffic_state
+    return traffic_state.snapshot()
+
+@app.get("/traffic/stream")
+async def traffic_stream():
+    # Full state once, then only changed fields, at most AI_TRAFFIC_STREAM_HZ events per second
+    async def events():
+        sub, state = traffic_state.subscribe()
+        try:
+            yield {"event": "state", "data": json.dumps(state)}
+            while True:
+                delta = await sub.get()
+                if delta:
+                    yield {"event": "delta", "data": json.dumps(delta)}
+                await asyncio.sleep(1.0 / STREAM_HZ)
+        finally:
+            traffic_state.unsubscribe(sub)
+
+    return EventSourceResponse(events())
 
 @app.post("/api/process_video/")
 def process_video(req: ProcessRequest):
-    if detector is None:
-        raise HTTPException(503, "AI model not loaded. Check server logs for model load errors.")
     path = get_upload_path(req.filename)
     if not os.path.exists(path):
         raise HTTPException(404, "File not found")
+    # Requests arriving during startup wait for the model instead of failing
+    try:
+        sessions = loader.wait().sessions
+    except ModelUnavailable as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "5"})
+
+    camera = get_camera(req.camera)
+    fingerprint = analysis_fingerprint(loader.engine, camera=camera, **SUMMARY_OPTIONS)
+    key = analysis_cache.key_for(path, fingerprint)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return {"status": "success", "summary": summary_for_upload(cached, path), "cached": True}
 
-    summary = detector.process_video(path)
-    return {"status": "success", "summary": summary}
+    try:
+        with sessions.session(path, kind="batch", camera=camera) as detector:
+            summary = detector.process_video(path)
+    except SessionLimitError as e:
+        raise HTTPException(429, str(e))
+    analysis_cache.put(key, cacheable_summary(summary), fingerprint)
+    return {"status": "success", "summary": summary, "cached": False}
+
+@app.post("/api/jobs", status_code=202)
+def submit_job(req: JobRequest):
+    path = get_upload_path(req.filename)
+    if not os.path.exists(path):
+        raise HTTPException(404, "File not found")
+    try:
+        job = jobs.submit(path, req.filename, req.priority, req.callback_url, get_camera(req.camera))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except JobQueueFull as e:
+        raise HTTPException(429, str(e))
+    return {"job_id": job.job_id, "state": job.state}
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": jobs.describe()}
+
+@app.get("/api/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.describe()
+
+@app.get("/api/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.state == "completed":
+        return {"status": "success", "summary": job.result, "cached": job.cached}
+    if job.state == "failed":
+        raise HTTPException(500, job.error)
+    raise HTTPException(409, f"Job is {job.state}")
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.describe()
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return analysis_cache.stats()
+
+@app.get("/api/snapshots/stats")
+def snapshot_stats():
+    return snapshot_writer.stats()
 
 @app.get("/api/live-detect-sse/")
-async def live_sse(file: str):
-    if file.startswith("stored:"):
-        file = get_upload_path(file.replace("stored:", ""))
+async def live_sse(file: str, sampling: str = None, stride: int = None, target_fps: float = None,
+                   camera: str = None):
+    """
+    sampling: "stride" | "fps" | "adaptive" (default from AI_SAMPLING_POLICY,
+              else every frame, as before sampling policies existed).
+    camera: id from cameras.json (input size, ROI, lanes).
+    """
+    file = resolve_source(file)
 
     if not os.path.exists(file):
         return EventSourceResponse(iter([{"data": json.dumps({"error": "File not found"})}]))
 
-    return EventSourceResponse(generate_frames(file))
+    sampler = FrameSampler.from_params(sampling, stride, target_fps)
+    return EventSourceResponse(generate_frames(file, sampler, get_camera(camera)))
+
+# =========================
+# Binary Live Streams
+# =========================
+# Annotated frames travel as raw JPEG (no base64 / JSON); detection metadata
+# travels separately, tagged with the same frame_index. Clients that use two
+# connections (MJPEG <img> + metadata EventSource) pass the same stream_id.
+
+MJPEG_BOUNDARY = "frame"
+
+def _attach_stream(file, stream_id, sampling, stride, target_fps, camera):
+    file = resolve_source(file)
+    stream = live_streams.get(stream_id) if stream_id else None
+    if stream is not None:
+        return stream
+    if not os.path.exists(file):
+        raise HTTPException(404, "File not found")
+    sampler = FrameSampler.from_params(sampling, stride, target_fps)
+    return live_streams.attach(file, stream_id, sampler, get_camera(camera))
+
+@app.get("/api/live-detect-mjpeg/")
+async def live_mjpeg(file: str, stream_id: str = None, sampling: str = None, stride: int = None,
+                     target_fps: float = None, camera: str = None):
+    """multipart/x-mixed-replace JPEG stream; each part carries an X-Frame-Index header."""
+    stream = _attach_stream(file, stream_id, sampling, stride, target_fps, camera)
+    sub = stream.subscribe(frames=True, metadata=False)
+
+    async def parts():
+        try:
+            while True:
+                item = await sub.get()
+                if item is None:
+                    return
+                _, index, jpeg = item
+                yield (f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\nX-Frame-Index: {index}\r\n\r\n").encode() + jpeg + b"\r\n"
+        finally:
+            stream.unsubscribe(sub)
+
+    return StreamingResponse(parts(), media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+                             headers={"X-Stream-Id": stream.stream_id})
+
+@app.get("/api/live-detect-meta/")
+async def live_meta(file: str, stream_id: str = None, sampling: str = None, stride: int = None,
+                    target_fps: float = None, camera: str = None):
+    """Metadata-only SSE events (counts, emergency, accident) keyed by frame_index."""
+    stream = _attach_stream(file, stream_id, sampling, stride, target_fps, camera)
+    sub = stream.subscribe(frames=False, metadata=True)
+
+    async def events():
+        try:
+            yield {"event": "stream", "data": json.dumps({"stream_id": stream.stream_id})}
+            while True:
+                item = await sub.get()
+                if item is None:
+                    return
+                yield {"data": json.dumps(item[2])}
+        finally:
+            stream.unsubscribe(sub)
+
+    return EventSourceResponse(events())
+
+@app.websocket("/api/live-detect-ws/")
+async def live_ws(websocket: WebSocket, file: str, stream_id: str = None, sampling: str = None,
+                  stride: int = None, target_fps: float = None, camera: str = None):
+    """
+    Text messages: JSON metadata with frame_index.
+    Binary messages: 4-byte big-endian frame index followed by the JPEG bytes.
+    """
+    await websocket.accept()
+    try:
+        stream = _attach_stream(file, stream_id, sampling, stride, target_fps, camera)
+    except HTTPException as e:
+        await websocket.send_text(json.dumps({"error": e.detail, "completed": True}))
+        await websocket.close()
+        return
+    sub = stream.subscribe(frames=True, metadata=True)
+    try:
+        await websocket.send_text(json.dumps({"stream_id": stream.stream_id}))
+        while True:
+            item = await sub.get()
+            if item is None:
+                break
+            kind, index, payload = item
+            if kind == "meta":
+                await websocket.send_text(json.dumps(payload))
+            else:
+                await websocket.send_bytes(index.to_bytes(4, "big") + payload)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream.unsubscribe(sub)
+
+@app.get("/api/live-streams")
+def list_live_streams():
+    return {"streams": live_streams.describe()}
+
+@app.get("/api/cameras")
+def list_cameras():
+    return {cid: {**cam.fingerprint(), "lanes": cam.lane_names()} for cid, cam in cameras.items()}
+
+@app.get("/api/ingest")
+def ingest_status():
+    """Per-camera health of continuous ingest: connection, buffer, reconnects, analysis rate."""
+    return {"enabled": INGEST_ENABLED, "cameras": ingest.stats()}
+
+@app.post("/api/ingest/{camera_id}/restart")
+def restart_ingest(camera_id: str):
+    if ingest.restart(camera_id) is None:
+        raise HTTPException(404, f"Camera {camera_id} is not being ingested")
+    return {"restarted": camera_id}
 
 # =========================
 # SUMO Routes
@@ -303,14 +583,23 @@ def get_sumo_status():
 # =========================
 
 @app.post("/api/sumo/upload")
-async def handle_sumo_upload(file: UploadFile = File(...)):
+async def handle_sumo_upload(file: UploadFile = File(...), demand: str | None = None):
     """
     Accepts a .zip file containing SUMO .net.xml and .rou.xml,
     extracts it, parses the traffic flows, and returns the analysis
     without needing Eclipse SUMO installed.
+    demand="0.5,1,1.5" adds a signal-plan sweep over those demand factors.
     """
     if not file.filename.endswith('.zip'):
         raise HTTPException(400, "File must be a .zip containing SUMO files")
+    bad_demand = "demand must be comma-separated positive numbers, e.g. 0.5,1,1.5"
+    try:
+        demand_scenarios = [float(f) for f in demand.split(",")] if demand else None
+    except ValueError:
+        raise HTTPException(400, bad_demand)
+    # float() also accepts "nan", "inf" and negatives, none of which scale a demand
+    if demand_scenarios and not all(math.isfinite(f) and f > 0 for f in demand_scenarios):
+        raise HTTPException(400, bad_demand)
         
     session_id = str(uuid.uuid4())
     extract_dir = os.path.join(os.path.dirname(__file__), "sumo_uploads", session_id)
@@ -332,7 +621,7 @@ async def handle_sumo_upload(file: UploadFile = File(...)):
         
     # Run the XML parser
     try:
-        analysis_result = sumo_parser.run_headless_simulation(extract_dir)
+        analysis_result = sumo_parser.run_headless_simulation(extract_dir, demand_scenarios)
         return {"status": "success", "session_id": session_id, "data": analysis_result}
     except FileNotFoundError as e:
         raise HTTPException(400, str(e))
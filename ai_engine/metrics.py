@@ -0,0 +1,178 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) shared by every per-stage histogram
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(k, "") for k in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        """{label_values_tuple: count} snapshot."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        values = self.values()
+        if not values and not self.labels:
+            values = {(): 0}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time (zero cost otherwise)."""
+
+    def __init__(self, name, help_text, callback, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        # callback() -> number, or {label_values_tuple: number} when labelled
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"WARNING: gauge {self.name} failed: {e}", flush=True)
+            return lines
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {v}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(k, "") for k in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, n) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, ('le', '+Inf'))} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "ai_stage_seconds",
+    "Time spent per pipeline stage (decode, yolo_predict, tracker_update, collision_search, "
+    "accident_checks, draw, jpeg_encode, snapshot_write, sse_send).",
+    labels=("stage",),
+))
+FRAMES_ANALYSED = REGISTRY.register(Counter(
+    "ai_frames_analysed_total", "Frames run through VehicleDetector.detect.",
+))
+FRAMES_DROPPED = REGISTRY.register(Counter(
+    "ai_frames_dropped_total", "Decoded or grabbed frames that were never analysed.", labels=("reason",),
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "ai_inference_batch_size", "Frames per batched YOLO forward pass.",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "ai_analysis_cache_lookups_total", "Analysis cache lookups by tier that answered.", labels=("result",),
+))
+MOTION_GATE = REGISTRY.register(Counter(
+    "ai_motion_gate_total", "Motion-gate decisions per analysed frame (skipped = previous detections reused).",
+    labels=("result",),
+))
+SNAPSHOTS = REGISTRY.register(Counter(
+    "ai_snapshots_total", "Accident snapshots by outcome (written, reused, dropped, failed).", labels=("result",),
+))
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def gauge(name, help_text, callback, labels=()):
+    """Registers (or replaces) a scrape-time gauge."""
+    return REGISTRY.register(Gauge(name, help_text, callback, labels))
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+
+class ModelUnavailable(RuntimeError):
+    """Raised when the model failed to load or did not become ready in time."""
+
+
+class ModelLoader:
+    """
+    Loads the InferenceEngine on a background thread so the server can bind
+    and answer health checks immediately.
+
+    States: pending -> loading -> warming -> ready (or failed).
+    Callers that need the model wait on it with a timeout
+    (AI_READY_TIMEOUT_S, default 60) instead of being rejected outright.
+    """
+
+    def __init__(self, model_path="yolov8n.pt", warmup_runs=None, ready_timeout=None, warmup_sizes=(),
+                 camera_sessions=0):
+        self.model_path = model_path
+        # Session slots reserved for continuously ingested cameras
+        self.camera_sessions = camera_sessions
+        # Extra input sizes used by per-camera configs, warmed up alongside the default
+        self.warmup_sizes = tuple(warmup_sizes)
+        self.warmup_runs = warmup_runs if warmup_runs is not None else int(os.environ.get("AI_WARMUP_RUNS", 3))
+        self.ready_timeout = ready_timeout if ready_timeout is not None else float(os.environ.get("AI_READY_TIMEOUT_S", 60))
+        self.state = "pending"
+        self.error = None
+        self.engine = None
+        self.sessions = None
+        self.timings = {}
+        self._future = Future()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, daemon=True, name="model-loader")
+            self._thread.start()
+
+    def _load(self):
+        engine = None
+        try:
+            self.state = "loading"
+            start = time.perf_counter()
+            # Heavy imports (ultralytics / torch) happen here, off the import path of main
+            from sessions import SessionManager
+
+            # AI_INFER_PROCESSES > 0 moves YOLO into a pool of processes fed through shared memory
+            if int(os.environ.get("AI_INFER_PROCESSES", 0)) > 0:
+                from process_engine import ProcessInferenceEngine
+                engine = ProcessInferenceEngine(self.model_path)
+            else:
+                from inference_engine import InferenceEngine
+                engine = InferenceEngine(self.model_path)
+            self.timings["load_s"] = round(time.perf_counter() - start, 3)
+
+            self.state = "warming"
+            start = time.perf_counter()
+            self._warm_up(engine)
+            self.timings["warmup_s"] = round(time.perf_counter() - start, 3)
+
+            self.engine = engine
+            self.sessions = SessionManager(engine, max_camera_sessions=self.camera_sessions)
+            self.state = "ready"
+            print(f"YOLOv8 Model Loaded Successfully ({engine.workers} inference workers, "
+                  f"backend {engine.backend}, load {self.timings['load_s']}s, "
+                  f"warm-up {self.timings['warmup_s']}s)", flush=True)
+            self._future.set_result(self)
+        except Exception as e:
+            print(f"Model Load Failed: {e}", flush=True)
+            if engine is not None:
+                engine.shutdown()
+            self.error = str(e)
+            self.state = "failed"
+            self._future.set_exception(ModelUnavailable(f"AI model not loaded: {e}"))
+
+    def _warm_up(self, engine):
+        """
+        Runs a few full-size inferences on every worker so the first real
+        frames do not pay for lazy predictor setup, and builds one tracker so
+        the ByteTrack imports are done too.
+        """
+        from detector import create_tracker
+
+        for imgsz in sorted({engine.imgsz, *self.warmup_sizes}):
+            frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+            for _ in range(self.warmup_runs):
+                engine.warm_up(frame, imgsz=imgsz)
+        create_tracker()
+
+    def wait(self, timeout=None):
+        """Blocks until ready; raises ModelUnavailable on failure or timeout."""
+        timeout = self.ready_timeout if timeout is None else timeout
+        try:
+            return self._future.result(timeout=timeout)
+        except FutureTimeout:
+            raise ModelUnavailable(f"AI model still {self.state} after {timeout:g}s")
+
+    async def wait_async(self, timeout=None):
+        """Awaitable variant of wait() for the event loop."""
+        timeout = self.ready_timeout if timeout is None else timeout
+        try:
+            # shield: a timed-out waiter must not cancel the shared future
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._future)), timeout)
+        except asyncio.TimeoutError:
+            raise ModelUnavailable(f"AI model still {self.state} after {timeout:g}s")
+
+    def status(self):
+        return {"state": self.state, "error": self.error, **self.timings}
+
+    def shutdown(self):
+        if self.engine is not None:
+            self.engine.shutdown()
@@ -0,0 +1,108 @@
+import os
+
+import cv2
+import numpy as np
+
+from metrics import MOTION_GATE
+
+# "camera": gate sessions bound to a fixed camera (ingest, camera=<id>) | "all" | "off"
+GATE_MODE = os.environ.get("AI_MOTION_GATE", "camera")
+# Fraction of thumbnail pixels that must change (by more than PIXEL_DELTA grey
+# levels) since the last inference before the model runs again
+THRESHOLD = float(os.environ.get("AI_MOTION_GATE_THRESHOLD", 0.002))
+PIXEL_DELTA = int(os.environ.get("AI_MOTION_GATE_PIXEL_DELTA", 12))
+# Consecutive analysed frames that may reuse detections before a full inference is forced
+MAX_SKIP = int(os.environ.get("AI_MOTION_GATE_MAX_SKIP", 10))
+THUMB_W, THUMB_H = 160, 90
+
+
+def gate_for(kind, camera=None):
+    """A MotionGate for a new session, or None if gating is off for it."""
+    if GATE_MODE == "all" or (GATE_MODE == "camera" and (kind == "camera" or camera is not None)):
+        return MotionGate()
+    return None
+
+
+def gate_settings(kind, camera=None):
+    """Settings of the gate gate_for() would attach to a session (None if ungated)."""
+    if gate_for(kind, camera) is None:
+        return None
+    return {"threshold": THRESHOLD, "pixel_delta": PIXEL_DELTA, "max_skip": MAX_SKIP}
+
+
+def hit_ratio():
+    """Share of gated frames that skipped inference, over the process lifetime."""
+    values = MOTION_GATE.values()
+    total = sum(values.values())
+    return round(values.get(("skipped",), 0) / total, 4) if total else 0.0
+
+
+def thumbnail(frame):
+    # Subsample first so large frames cost about as much as small ones
+    step = max(1, min(frame.shape[0] // (THUMB_H * 2), frame.shape[1] // (THUMB_W * 2)))
+    small = cv2.resize(frame[::step, ::step], (THUMB_W, THUMB_H), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+class MotionGate:
+    """
+    Decides per analysed frame whether the model has to run at all.
+
+    A fixed camera during a red phase or an empty night road produces long
+    runs of near-identical frames. The gate compares a small grey thumbnail
+    with the one of the last frame that was actually inferred; if hardly any
+    pixels changed, the session reuses that frame's boxes (the tracker and
+    track table still advance). Comparing against the last *inferred* frame
+    means slow drift adds up and eventually triggers inference. The model
+    runs anyway after `max_skip` reused frames, and on every frame while the
+    last result carried accident evidence.
+    """
+
+    def __init__(self, threshold=None, pixel_delta=None, max_skip=None):
+        self.threshold = THRESHOLD if threshold is None else threshold
+        self.pixel_delta = PIXEL_DELTA if pixel_delta is None else pixel_delta
+        self.max_skip = MAX_SKIP if max_skip is None else max_skip
+        self.reset()
+
+    def reset(self):
+        self._reference = None
+        self._skipped = 0
+        self._hold = False
+        self.last_score = None
+        self.decisions = {}
+
+    def should_infer(self, frame):
+        thumb = thumbnail(frame)
+        if self._reference is None or thumb.shape != self._reference.shape:
+            reason = "first"
+        elif self._hold:
+            reason = "evidence"
+        elif self._skipped >= self.max_skip:
+            reason = "forced"
+        else:
+            changed = cv2.absdiff(thumb, self._reference) > self.pixel_delta
+            self.last_score = float(np.count_nonzero(changed)) / changed.size
+            reason = "motion" if self.last_score >= self.threshold else "skipped"
+
+        self.decisions[reason] = self.decisions.get(reason, 0) + 1
+        MOTION_GATE.inc(result=reason)
+        if reason == "skipped":
+            self._skipped += 1
+            return False
+        self._reference = thumb
+        self._skipped = 0
+        return True
+
+    def observe(self, result):
+        """Keeps the model running on every frame while accident evidence is present."""
+        self._hold = bool(result.get("emergency") or result.get("accident") or result.get("evidence_count", 0) > 0)
+
+    def stats(self):
+        total = sum(self.decisions.values())
+        return {
+            "threshold": self.threshold,
+            "max_skip": self.max_skip,
+            "last_score": round(self.last_score, 5) if self.last_score is not None else None,
+            "hit_rate": round(self.decisions.get("skipped", 0) / total, 4) if total else 0.0,
+            "decisions": dict(self.decisions),
+        }
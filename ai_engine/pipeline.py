@@ -0,0 +1,198 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import weakref
+
+import cv2
+
+from sampling import FrameSampler
+from video_reader import PrefetchReader
+from metrics import stage_timer
+from snapshots import snapshot_writer
+
+_END = object()
+
+# Live pipelines, for queue-depth gauges
+ACTIVE_PIPELINES = weakref.WeakSet()
+
+
+def encode_jpeg(frame):
+    ok, buf = cv2.imencode(".jpg", frame)
+    return buf if ok else None
+
+
+class FramePipeline:
+    """
+    Staged decode -> infer -> encode executor for one live stream.
+
+    Decode runs on a PrefetchReader thread; inference and encode each run on
+    their own thread and hand work to the next through a bounded queue, so
+    decode and JPEG encode overlap with inference and a slow consumer applies
+    backpressure all the way back to the decoder.
+    The asyncio side only awaits finished results and never touches OpenCV
+    or the model.
+    Frames the sampler skips are only grabbed, never decoded or analysed.
+    Frame buffers come from the reader's ring and go back to it after encode.
+    `encoder(frame)` returns whatever results() should yield for the frame
+    (default: one JPEG buffer), or None to skip it.
+    """
+
+    def __init__(self, video_path, detector, sampler=None, queue_size=4, ring_size=16, encoder=None):
+        self.video_path = video_path
+        self.detector = detector
+        self.sampler = sampler or FrameSampler()
+        self.encoder = encoder or encode_jpeg
+        self.queue_size = queue_size
+        # Frames stay in the reader ring until encoded, so it must outsize the queues
+        self.ring_size = max(ring_size, 2 * queue_size + 4)
+        self.snapshot_path = None
+        self.error = None
+
+        self._reader = None
+        self._analysed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+
+    # ---------- helpers ----------
+
+    def _put(self, q, item):
+        """Blocking put that gives up once the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, exc):
+        print(f"Pipeline Error ({os.path.basename(self.video_path)}): {exc}", flush=True)
+        self.error = str(exc)
+
+    # ---------- stages ----------
+
+    def _frames(self):
+        """Yields (packet_or_None, index, frame, is_image, gap) from the image or the prefetch reader."""
+        img = cv2.imread(self.video_path)
+        if img is not None:
+            yield None, 0, img, True, 1
+            return
+
+        self._reader = PrefetchReader(self.video_path, ring_size=self.ring_size, sampler=self.sampler).start()
+        for packet in self._reader:
+            if self._stop.is_set():
+                self._reader.release(packet)
+                return
+            yield packet, packet.index, packet.frame, False, packet.gap
+
+    def _infer_stage(self):
+        try:
+            for packet, index, frame, is_image, gap in self._frames():
+                # Acceleration math must use the real distance between analysed frames
+                self.detector.FRAME_SKIP = gap
+                res = self.detector.detect(frame, is_static=is_image)
+                self.sampler.observe(res)
+                counts = dict(self.detector.total_counts)
+                if not self._put(self._analysed, (packet, index, frame, is_image, res, counts)):
+                    self._release(packet)
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self._analysed, _END)
+
+    def _release(self, packet):
+        if packet is not None:
+            self._reader.release(packet)
+
+    def _encode_stage(self, loop, out):
+        def publish(item):
+            fut = asyncio.run_coroutine_threadsafe(out.put(item), loop)
+            while not self._stop.is_set():
+                try:
+                    fut.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            fut.cancel()
+            return False
+
+        try:
+            while True:
+                item = self._get(self._analysed)
+                if item is _END:
+                    break
+                packet, index, frame, is_image, res, counts = item
+
+                # SNAPSHOT ONLY ON CONFIRMED ACCIDENT OR STATIC IMAGE
+                # (written in the background; a near-duplicate of an earlier snapshot reuses that file)
+                if (res["emergency"] or is_image) and self.snapshot_path is None:
+                    self.snapshot_path = snapshot_writer.save(frame, os.path.dirname(self.video_path))
+
+                with stage_timer("jpeg_encode"):
+                    buf = self.encoder(frame)
+                # The ring slot can be reused by the decoder once encoded
+                self._release(packet)
+                if buf is None:
+                    continue
+                if not publish((index, buf, res, counts, self.snapshot_path)):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            try:
+                publish(_END)
+            except RuntimeError:
+                pass  # event loop already closed
+
+    # ---------- public API ----------
+
+    async def results(self):
+        """
+        Async generator of (frame_index, encoded_frame, detect_result, counts, snapshot_path).
+        Stops the worker threads when the consumer goes away.
+        """
+        loop = asyncio.get_running_loop()
+        out = asyncio.Queue(maxsize=self.queue_size)
+        self._threads = [
+            threading.Thread(target=self._infer_stage, daemon=True, name="pipe-infer"),
+            threading.Thread(target=self._encode_stage, args=(loop, out), daemon=True, name="pipe-encode"),
+        ]
+        for t in self._threads:
+            t.start()
+        ACTIVE_PIPELINES.add(self)
+
+        try:
+            while True:
+                item = await out.get()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self.stop()
+            ACTIVE_PIPELINES.discard(self)
+
+    def queue_depths(self):
+        reader = self._reader
+        return {
+            "analysed": self._analysed.qsize(),
+            "reader_ring": reader.stats()["buffered"] if reader is not None else 0,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._reader is not None:
+            self._reader.stop(wait=False)
+
+    def reader_stats(self):
+        return self._reader.stats() if self._reader is not None else {}
@@ -0,0 +1,393 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+
+import cv2
+import numpy as np
+
+from inference_backends import resolve_model
+from metrics import BATCH_SIZE
+
+# Largest frame passed without downscaling (1920x1080 BGR is 5.9 MB)
+SLOT_MB = float(os.environ.get("AI_SHM_SLOT_MB", 6.5))
+# ultralytics' default max_det: result rows that fit in a slot
+MAX_DETECTIONS = 300
+RESULT_BYTES = MAX_DETECTIONS * 6 * 4
+START_TIMEOUT_S = float(os.environ.get("AI_INFER_PROC_START_TIMEOUT_S", 300))
+
+
+def _attach(name):
+    # The creating process owns (and unlinks) the segment. Spawned workers share
+    # its resource tracker, so attaching without track=False (3.13+) is harmless.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    """
+    Fixed-size slots in one shared-memory segment, each holding one frame
+    followed by the detection rows computed for it. Only (slot, shape)
+    travels between processes; pixels are never pickled.
+    """
+
+    def __init__(self, slots, frame_bytes, name=None):
+        self.slots = slots
+        self.frame_bytes = frame_bytes
+        self.stride = frame_bytes + RESULT_BYTES
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.stride)
+        else:
+            self.shm = _attach(name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def frame(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.stride)
+
+    def result(self, slot, rows):
+        return np.ndarray((rows, 6), dtype=np.float32, buffer=self.shm.buf,
+                          offset=slot * self.stride + self.frame_bytes)
+
+    def close(self, unlink=False):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a view is still referenced somewhere; the OS frees it at exit
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker_main(shm_name, slots, frame_bytes, model_path, imgsz, max_batch, threads, tasks, results):
+    """Inference process: loads its own model, then serves slots until its task pipe closes."""
+    # Each process owns a few cores; without this every process would spawn a thread per core
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    cv2.setNumThreads(threads)
+    ring = SharedFrameRing(slots, frame_bytes, name=shm_name)
+    try:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        from inference_engine import InferenceEngine
+
+        engine = InferenceEngine(model_path, workers=1, batch_window_ms=0, backend="torch", imgsz=imgsz)
+    except Exception as e:
+        results.send(("failed", str(e)))
+        ring.close()
+        return
+    results.send(("ready", engine.names))
+
+    try:
+        while True:
+            # Take whatever else is already waiting: batches grow with load
+            batch = [tasks.recv()]
+            while len(batch) < max_batch and tasks.poll(0):
+                batch.append(tasks.recv())
+            results.send(("batch", len(batch)))
+
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[2:], []).append(item)
+            for (conf, size), items in groups.items():
+                try:
+                    outputs = engine.predict_batch([ring.frame(slot, shape) for slot, shape, _, _ in items],
+                                                   conf, size)
+                except Exception as e:
+                    for slot, _, _, _ in items:
+                        results.send(("done", slot, 0, str(e)))
+                    continue
+                for (slot, _, _, _), dets in zip(items, outputs):
+                    rows = min(len(dets), MAX_DETECTIONS)
+                    ring.result(slot, rows)[:] = dets[:rows]
+                    results.send(("done", slot, rows, None))
+    except (EOFError, OSError):
+        pass  # front end closed the pipe: shut down
+    finally:
+        engine.shutdown()
+        ring.close()
+
+
+class _Worker:
+    def __init__(self, worker_id, proc, tasks, results):
+        self.worker_id = worker_id
+        self.proc = proc
+        self.tasks = tasks
+        self.results = results
+        self.in_flight = set()
+        self.starting = False
+        self.send_lock = threading.Lock()
+
+
+class ProcessInferenceEngine:
+    """
+    Drop-in replacement for InferenceEngine that runs YOLO in a pool of
+    AI_INFER_PROCESSES separate processes instead of threads, so inference
+    does not compete with detect()'s Python code for the GIL and scales with
+    cores.
+
+    submit() copies the frame into a free slot of a shared-memory ring and
+    sends only (slot, shape, conf, imgsz) to the least busy process, which
+    batches everything already waiting for it and writes the (N, 6) rows
+    back into the same slot. A collector thread resolves the futures.
+    Every process has its own pipes, so one that dies (seen through its
+    sentinel) only fails its own in-flight frames and is then replaced.
+    Frames larger than a slot (AI_SHM_SLOT_MB) are downscaled first and
+    their boxes scaled back - the model letterboxes to imgsz anyway.
+    Each process gets AI_INFER_THREADS_PER_PROC intra-op threads (default 1).
+    """
+
+    def __init__(self, model_path="yolov8n.pt", processes=None, threads_per_process=None, slots=None,
+                 max_batch=None, backend=None, int8=None, imgsz=None):
+        self.imgsz = imgsz or int(os.environ.get("AI_INFER_IMGSZ", 640))
+        if backend is None:
+            backend = os.environ.get("AI_INFER_BACKEND", "torch")
+        if int8 is None:
+            int8 = os.environ.get("AI_INFER_INT8", "0") == "1"
+        # Export / quantize once here, so the workers only load the result
+        self.model_path, self.backend = resolve_model(model_path, backend, int8, self.imgsz)
+        self.workers = processes or int(os.environ.get("AI_INFER_PROCESSES", os.cpu_count() or 1))
+        self.threads = threads_per_process or int(os.environ.get("AI_INFER_THREADS_PER_PROC", 1))
+        self.max_batch = max_batch or int(os.environ.get("AI_MAX_BATCH", 8))
+        self.batcher = None
+        slots = slots or int(os.environ.get("AI_SHM_SLOTS", 0)) or max(8, 3 * self.workers)
+
+        self._ring = SharedFrameRing(slots, int(SLOT_MB * 1024 * 1024))
+        self._ctx = mp.get_context("spawn")
+        self._free = list(range(slots))
+        self._slot_ready = threading.Condition()
+        self._pending = {}  # slot -> (future, box scale, worker)
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._ids = itertools.count()
+        self._collector = None
+        self._stopping = False
+        self.restarts = 0
+        self._batches = 0
+        self._frames = 0
+        print(f"Inference backend: {self.backend} ({self.model_path}), "
+              f"{self.workers} processes x {self.threads} threads, {slots} shared-memory slots", flush=True)
+
+        try:
+            for _ in range(self.workers):
+                worker = self._spawn()
+                self._workers[worker.worker_id] = worker
+            for worker in self._workers.values():
+                self.names = self._wait_ready(worker)
+        except Exception:
+            self.shutdown()
+            raise
+        self._collector = threading.Thread(target=self._collect, daemon=True, name="infer-proc-collector")
+        self._collector.start()
+        # Runs before multiprocessing terminates the daemon processes at exit
+        atexit.register(self.shutdown)
+
+    # ---------- processes ----------
+
+    def _spawn(self):
+        task_recv, task_send = self._ctx.Pipe(duplex=False)
+        result_recv, result_send = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_worker_main, daemon=True, name="yolo-proc",
+            args=(self._ring.name, self._ring.slots, self._ring.frame_bytes, self.model_path, self.imgsz,
+                  self.max_batch, self.threads, task_recv, result_send),
+        )
+        proc.start()
+        # The child holds its own copies of these ends
+        task_recv.close()
+        result_send.close()
+        return _Worker(next(self._ids), proc, task_send, result_recv)
+
+    def _wait_ready(self, worker):
+        if not worker.results.poll(START_TIMEOUT_S):
+            raise RuntimeError(f"Inference process not ready after {START_TIMEOUT_S:g}s")
+        try:
+            kind, payload = worker.results.recv()
+        except EOFError:
+            raise RuntimeError(f"Inference process exited during start-up ({worker.proc.exitcode})")
+        if kind == "failed":
+            raise RuntimeError(f"Inference process failed to load: {payload}")
+        return payload
+
+    def _replace(self, worker):
+        """Fails the frames a dead process held and starts a new one in its place."""
+        with self._lock:
+            if self._workers.pop(worker.worker_id, None) is None:
+                return
+            lost = list(worker.in_flight)
+        worker.tasks.close()
+        worker.results.close()
+        for slot in lost:
+            self._finish(slot, error=f"inference process {worker.proc.pid} died")
+        if self._stopping:
+            return
+        print(f"WARNING: Inference process {worker.proc.pid} exited ({worker.proc.exitcode}); "
+              f"failed {len(lost)} frames, restarting it", flush=True)
+        self.restarts += 1
+        # Loads in the background; the collector sees its "ready" message
+        replacement = self._spawn()
+        replacement.starting = True
+        with self._lock:
+            self._workers[replacement.worker_id] = replacement
+
+    # ---------- results ----------
+
+    def _collect(self):
+        while not self._stopping:
+            with self._lock:
+                workers = list(self._workers.values())
+            handles = {}
+            for worker in workers:
+                handles[worker.results] = worker
+                handles[worker.proc.sentinel] = worker
+            try:
+                ready = wait_connections(list(handles), timeout=1.0)
+            except OSError:
+                continue  # a pipe was closed by shutdown()
+            for handle in ready:
+                worker = handles[handle]
+                if worker.worker_id not in self._workers:
+                    continue
+                # Messages sent just before a crash are still handled
+                if not self._drain(worker) or handle == worker.proc.sentinel:
+                    self._replace(worker)
+
+    def _drain(self, worker):
+        """Handles every message waiting on a worker's result pipe; False once the pipe is closed."""
+        try:
+            while worker.results.poll(0):
+                msg = worker.results.recv()
+                kind = msg[0]
+                if kind == "done":
+                    _, slot, rows, error = msg
+                    self._finish(slot, rows, error)
+                elif kind == "batch":
+                    BATCH_SIZE.observe(msg[1])
+                    self._batches += 1
+                    self._frames += msg[1]
+                elif kind == "ready":
+                    worker.starting = False
+                elif kind == "failed":
+                    print(f"WARNING: Replacement inference process failed to load: {msg[1]}", flush=True)
+        except (EOFError, OSError):
+            return False
+        return True
+
+    def _finish(self, slot, rows=0, error=None):
+        with self._lock:
+            entry = self._pending.pop(slot, None)
+            if entry is not None:
+                entry[2].in_flight.discard(slot)
+        if entry is None:
+            return
+        fut, scale, _ = entry
+        if error is not None:
+            fut.set_exception(RuntimeError(error))
+        else:
+            dets = self._ring.result(slot, rows).copy()
+            if scale != 1.0:
+                dets[:, :4] *= scale
+            fut.set_result(dets)
+        with self._slot_ready:
+            self._free.append(slot)
+            self._slot_ready.notify()
+
+    # ---------- public API (same as InferenceEngine) ----------
+
+    def _fit(self, frame):
+        """Returns (frame that fits a slot, factor to scale its boxes back by)."""
+        if frame.nbytes <= self._ring.frame_bytes:
+            return frame, 1.0
+        shrink = (self._ring.frame_bytes / frame.nbytes) ** 0.5 * 0.999
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, int(w * shrink)), max(1, int(h * shrink))), interpolation=cv2.INTER_AREA)
+        return small, w / small.shape[1]
+
+    def submit(self, frame, conf=0.45, imgsz=None):
+        """Queues a frame for inference and returns a Future. Blocks while every slot is in flight."""
+        imgsz = imgsz or self.imgsz
+        frame, scale = self._fit(frame)
+        fut = Future()
+        with self._slot_ready:
+            while not self._free:
+                self._slot_ready.wait()
+            slot = self._free.pop()
+        self._ring.frame(slot, frame.shape)[:] = frame
+
+        with self._lock:
+            ready = [w for w in self._workers.values() if not w.starting] or list(self._workers.values())
+            worker = min(ready, key=lambda w: len(w.in_flight)) if ready else None
+            if worker is not None:
+                worker.in_flight.add(slot)
+                self._pending[slot] = (fut, scale, worker)
+        if worker is None:
+            with self._slot_ready:
+                self._free.append(slot)
+                self._slot_ready.notify()
+            raise RuntimeError("No inference process running")
+        try:
+            with worker.send_lock:
+                worker.tasks.send((slot, frame.shape, conf, imgsz))
+        except (OSError, ValueError) as e:
+            self._finish(slot, error=f"inference process unavailable: {e}")
+        return fut
+
+    def warm_up(self, frame, imgsz=None):
+        """Runs `frame` once per process; submit() hands each to the least busy one."""
+        for fut in [self.submit(frame, imgsz=imgsz) for _ in range(self.workers)]:
+            fut.result()
+
+    def predict(self, frame, conf=0.45, imgsz=None):
+        return self.submit(frame, conf, imgsz).result()
+
+    def info(self):
+        return {"backend": self.backend, "model": self.model_path, "imgsz": self.imgsz,
+                "workers": self.workers, "mode": "processes", "threads_per_process": self.threads}
+
+    def batch_stats(self):
+        with self._lock:
+            in_flight = len(self._pending)
+            processes = len(self._workers)
+        return {
+            "enabled": True,
+            "processes": processes,
+            "max_batch": self.max_batch,
+            "batches": self._batches,
+            "frames": self._frames,
+            "mean_batch_size": round(self._frames / self._batches, 2) if self._batches else 0.0,
+            "slots": self._ring.slots,
+            "queued": in_flight,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        with self._lock:
+            workers = list(self._workers.values())
+        # A closed task pipe makes each process finish its batch and exit
+        for worker in workers:
+            with worker.send_lock:
+                worker.tasks.close()
+        for worker in workers:
+            worker.proc.join(timeout=5)
+            if worker.proc.is_alive():
+                worker.proc.terminate()
+        if self._collector is not None:
+            self._collector.join(timeout=5)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for fut, _, _ in pending.values():
+            fut.set_exception(RuntimeError("inference engine shut down"))
+        self._ring.close(unlink=True)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import motion_gate
+from metrics import CACHE_LOOKUPS
+from track_table import COUNT_AFTER_HITS, SPEED_FRAMES, TRACK_TTL
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "analysis")
+
+# Bump when detection / accident logic changes in a way that alters summaries
+# (or when the cached summary layout changes)
+ANALYSIS_VERSION = 3
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def analysis_fingerprint(engine, camera=None, **options):
+    """
+    Describes everything besides the input file that determines a summary:
+    model weights, runtime, input size, camera ROI / lanes, motion gate and
+    track table settings, and analysis options.
+    """
+    try:
+        size, mtime = _signature(engine.model_path)
+    except OSError:
+        size, mtime = None, None
+    return {
+        "version": ANALYSIS_VERSION,
+        "model": os.path.basename(os.path.normpath(engine.model_path)),
+        "model_size": size,
+        "model_mtime": mtime,
+        "backend": engine.backend,
+        "imgsz": engine.imgsz,
+        "color_mode": os.environ.get("AI_COLOR_MODE", "auto"),
+        "camera": camera.fingerprint() if camera is not None else None,
+        # Uploads and jobs are analysed as batch sessions
+        "motion_gate": motion_gate.gate_settings("batch", camera),
+        "tracks": {"ttl": TRACK_TTL, "count_after_hits": COUNT_AFTER_HITS, "speed_frames": SPEED_FRAMES},
+        **options,
+    }
+
+
+def cacheable_summary(summary):
+    """
+    A process_video() summary without its per-upload part: for images the
+    last element is the analysed file's path, which only a flag is kept of.
+    """
+    counts, count, emergency, path = summary
+    return [counts, count, emergency, path is not None]
+
+
+def summary_for_upload(cached, path):
+    """Rebuilds the summary a cache hit returns for the upload at `path`."""
+    counts, count, emergency, has_path = cached
+    return [dict(counts), count, emergency, path if has_path else None]
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of analysis summaries.
+
+    Keys are sha256(file content) + sha256(fingerprint), so a renamed upload
+    still hits and a model / config change never returns a stale summary.
+    Two tiers: an in-memory LRU (AI_CACHE_ENTRIES) in front of JSON files on
+    disk (AI_CACHE_DIR), evicted least-recently-used beyond AI_CACHE_MAX_MB.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=None, max_disk_mb=None):
+        self.cache_dir = cache_dir or os.environ.get("AI_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_entries = max_entries or int(os.environ.get("AI_CACHE_ENTRIES", 256))
+        max_disk_mb = max_disk_mb if max_disk_mb is not None else float(os.environ.get("AI_CACHE_MAX_MB", 64))
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+
+        self._memory = OrderedDict()
+        # key -> [size_bytes, last_used]; mirrors the files on disk
+        self._disk = {}
+        # (path, size, mtime_ns) -> content digest, so unchanged files are hashed once
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                st = os.stat(os.path.join(self.cache_dir, name))
+                self._disk[name[:-5]] = [st.st_size, st.st_mtime]
+
+    # -------------------------
+    # Keys
+    # -------------------------
+
+    def file_digest(self, path):
+        path = os.path.realpath(path)
+        memo_key = (path, *_signature(path))
+        with self._lock:
+            digest = self._digests.get(memo_key)
+            if digest is not None:
+                self._digests.move_to_end(memo_key)
+                return digest
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        with self._lock:
+            self._digests[memo_key] = digest
+            while len(self._digests) > self.max_entries * 4:
+                self._digests.popitem(last=False)
+        return digest
+
+    def key_for(self, path, fingerprint):
+        config = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+        return f"{self.file_digest(path)}-{config[:16]}"
+
+    # -------------------------
+    # Lookup / store
+    # -------------------------
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                CACHE_LOOKUPS.inc(result="memory")
+                return self._memory[key]
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._path(key)
+            try:
+                with open(path) as f:
+                    value = json.load(f)["summary"]
+                os.utime(path)
+            except (OSError, ValueError, KeyError):
+                with self._lock:
+                    self._disk.pop(key, None)
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk[key][1] = time.time()
+                    self._remember(key, value)
+                CACHE_LOOKUPS.inc(result="disk")
+                return value
+
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, key, value, fingerprint=None):
+        data = json.dumps({"key": key, "fingerprint": fingerprint, "created": time.time(), "summary": value})
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            # Stored as it will be read back from disk (tuples become lists)
+            self._remember(key, json.loads(data)["summary"])
+            self._disk[key] = [len(data), time.time()]
+            evicted = self._evict_disk()
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        total = sum(size for size, _ in self._disk.values())
+        evicted = []
+        for key, (size, _) in sorted(self._disk.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_disk_bytes:
+                break
+            del self._disk[key]
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_entries": len(self._disk),
+                "disk_bytes": sum(size for size, _ in self._disk.values()),
+                "max_disk_bytes": self.max_disk_bytes,
+            }
@@ -0,0 +1,96 @@
+import os
+import threading
+
+
+class FrameSampler:
+    """
+    Decides which decoded frames are sent to the detector.
+
+    Policies:
+      - "stride":   analyse every `stride`-th frame
+      - "fps":      analyse at roughly `target_fps`, derived from the source fps
+      - "adaptive": start at `stride` and move between `min_stride` and
+                    `max_stride` depending on scene activity (speeds, vehicle
+                    count, accident evidence)
+
+    The gap between two analysed frames is returned by `mark()` so the
+    detector's FRAME_SKIP always matches the real stride.
+
+    The reader thread asks should_analyse() while the inference thread calls
+    mark() / observe(), so the stride and last index are kept under a lock.
+    """
+
+    POLICIES = ("stride", "fps", "adaptive")
+
+    # Adaptive thresholds
+    BUSY_COUNT = 8        # vehicles in view
+    FAST_SPEED = 15.0     # px per SPEED_FRAMES source frames, like detection speeds
+    STATIC_SPEED = 2.0
+
+    def __init__(self, policy="stride", stride=1, target_fps=None, min_stride=1, max_stride=12):
+        if policy not in self.POLICIES:
+            print(f"WARNING: Invalid sampling policy {policy}. Using stride", flush=True)
+            policy = "stride"
+        self.policy = policy
+        self.stride = max(1, int(stride))
+        self.target_fps = target_fps
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        if policy == "adaptive":
+            self.stride = min(self.max_stride, max(self.min_stride, self.stride))
+        self._last = -1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_params(cls, policy=None, stride=None, target_fps=None):
+        """
+        Builds a sampler from request params, falling back to AI_SAMPLING_* env vars.
+        Without either, every frame is analysed (the original live behaviour);
+        "fps" and "adaptive" are opt-in.
+        """
+        policy = policy or os.environ.get("AI_SAMPLING_POLICY", "stride")
+        if stride is None:
+            stride = int(os.environ.get("AI_SAMPLING_STRIDE", 1))
+        if target_fps is None and os.environ.get("AI_SAMPLING_TARGET_FPS"):
+            target_fps = float(os.environ["AI_SAMPLING_TARGET_FPS"])
+        return cls(
+            policy=policy,
+            stride=stride,
+            target_fps=target_fps,
+            max_stride=int(os.environ.get("AI_SAMPLING_MAX_STRIDE", 12)),
+        )
+
+    def set_source_fps(self, fps):
+        """Converts the target analysis rate into a stride once the source fps is known."""
+        if self.policy == "fps" and self.target_fps and fps and fps > 0:
+            with self._lock:
+                self.stride = max(1, int(round(fps / self.target_fps)))
+
+    def should_analyse(self, index):
+        with self._lock:
+            return index - self._last >= self.stride
+
+    def mark(self, index):
+        """Records an analysed frame and returns the number of frames since the previous one."""
+        with self._lock:
+            gap = self.stride if self._last < 0 else index - self._last
+            self._last = index
+            return gap
+
+    def observe(self, result):
+        """Feeds a detect() result back into the adaptive policy."""
+        if self.policy != "adaptive" or not result:
+            return
+
+        detections = result.get("detections", [])
+        speeds = [d.get("speed", 0) for d in detections]
+        max_speed = max(speeds) if speeds else 0.0
+
+        with self._lock:
+            if result.get("emergency") or result.get("accident") or result.get("evidence_count", 0) > 0:
+                # Accident evidence: analyse every frame until it clears
+                self.stride = self.min_stride
+            elif max_speed > self.FAST_SPEED or len(detections) >= self.BUSY_COUNT:
+                self.stride = max(self.min_stride, self.stride // 2)
+            elif not detections or max_speed < self.STATIC_SPEED:
+                self.stride = min(self.max_stride, self.stride + 1)
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from detector import VehicleDetector
+from motion_gate import gate_for
+
+
+class SessionLimitError(RuntimeError):
+    """Raised when every stream slot of the engine is already taken."""
+
+
+class SessionManager:
+    """
+    Hands out per-stream VehicleDetector sessions.
+
+    All sessions share one InferenceEngine (weights + worker pool); each one
+    owns its tracker, counts and accident state, so parallel streams never
+    reset or pollute each other.
+
+    Continuously ingested cameras (kind "camera") have their own budget of
+    `max_camera_sessions` (AI_MAX_CAMERA_STREAMS, by default one per
+    configured camera), so they neither wait for nor crowd out the
+    `max_sessions` (AI_MAX_STREAMS) slots used by uploads, jobs and live streams.
+    """
+
+    def __init__(self, engine, max_sessions=None, max_camera_sessions=None):
+        self.engine = engine
+        self.max_sessions = max_sessions or int(os.environ.get("AI_MAX_STREAMS", 16))
+        if os.environ.get("AI_MAX_CAMERA_STREAMS"):
+            max_camera_sessions = int(os.environ["AI_MAX_CAMERA_STREAMS"])
+        self.max_camera_sessions = max_camera_sessions or 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _limit_for(self, kind):
+        """(budget, sessions already using it) for a new session of `kind`."""
+        in_pool = sum(1 for info in self._sessions.values() if (info["kind"] == "camera") == (kind == "camera"))
+        return (self.max_camera_sessions if kind == "camera" else self.max_sessions), in_pool
+
+    def open(self, source, kind="live", camera=None):
+        with self._lock:
+            limit, used = self._limit_for(kind)
+            if used >= limit:
+                pool = "Camera ingest" if kind == "camera" else "Stream"
+                raise SessionLimitError(f"{pool} limit reached ({limit})")
+            detector = VehicleDetector(engine=self.engine, camera=camera)
+            detector.motion_gate = gate_for(kind, camera)
+            detector.session_id = uuid.uuid4().hex[:12]
+            self._sessions[detector.session_id] = {
+                "detector": detector,
+                "source": source,
+                "kind": kind,
+                "started_at": time.time(),
+            }
+        return detector
+
+    def close(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    @contextmanager
+    def session(self, source, kind="live", camera=None):
+        detector = self.open(source, kind, camera)
+        try:
+            yield detector
+        finally:
+            self.close(detector.session_id)
+
+    def active_count(self, kind=None):
+        with self._lock:
+            if kind is None:
+                return len(self._sessions)
+            return sum(1 for info in self._sessions.values() if info["kind"] == kind)
+
+    def describe(self):
+        with self._lock:
+            return [
+                {
+                    "session_id": sid,
+                    "source": os.path.basename(info["source"]),
+                    "kind": info["kind"],
+                    "camera": info["detector"].camera.camera_id if info["detector"].camera else None,
+                    "uptime_s": round(time.time() - info["started_at"], 1),
+                    "counts": dict(info["detector"].total_counts),
+                    "tracks": info["detector"].tracks.stats(),
+                    "motion_gate": info["detector"].motion_gate.stats() if info["detector"].motion_gate else None,
+                }
+                for sid, info in self._sessions.items()
+            ]
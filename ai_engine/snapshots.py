@@ -0,0 +1,214 @@
+import atexit
+import os
+import queue
+import re
+import threading
+import uuid
+
+import cv2
+import numpy as np
+
+from metrics import SNAPSHOTS, stage_timer
+
+# Difference hash of HASH_W x HASH_H bits; snapshots within DEDUP_BITS of an
+# existing one count as the same incident (0 = only identical hashes). A new
+# vehicle in a fixed camera's view flips only a few bits, so keep this small.
+HASH_W, HASH_H = 16, 8
+DEDUP_BITS = int(os.environ.get("AI_SNAPSHOT_DEDUP_BITS", 3))
+QUEUE_SIZE = int(os.environ.get("AI_SNAPSHOT_QUEUE", 32))
+# Hashes remembered per directory (most recent first out)
+INDEX_SIZE = int(os.environ.get("AI_SNAPSHOT_INDEX", 1024))
+
+# New snapshots carry their hash in the name, so a restart re-indexes them without decoding
+_HASHED_NAME = re.compile(r"^snapshot_p([0-9a-f]{%d})\.jpg$" % (HASH_W * HASH_H // 4))
+_LEGACY_NAME = re.compile(r"^snapshot_[0-9a-f]+\.jpg$")
+
+
+def perceptual_hash(frame):
+    """Difference hash of a BGR (or grayscale) frame as an int of HASH_W * HASH_H bits."""
+    # Subsample big frames first; area-averaging a full 1080p frame costs milliseconds
+    step = max(1, min(frame.shape[0] // (HASH_H * 8), frame.shape[1] // ((HASH_W + 1) * 8)))
+    small = cv2.resize(frame[::step, ::step], (HASH_W + 1, HASH_H), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class SnapshotWriter:
+    """
+    Writes accident snapshots on a background thread.
+
+    save() hashes the frame, and if a near-identical snapshot already exists
+    in the same directory (same footage analysed again, or the same incident
+    seen twice) returns that file instead of writing another one. Otherwise
+    it reserves a file name, queues a copy of the frame and returns the path
+    straight away; the writer thread encodes it and moves it into place
+    atomically, so the file is either absent for a moment or complete.
+    """
+
+    def __init__(self, dedup_bits=None, queue_size=None, index_size=None):
+        self.dedup_bits = DEDUP_BITS if dedup_bits is None else dedup_bits
+        self.index_size = index_size or INDEX_SIZE
+        self._queue = queue.Queue(maxsize=queue_size or QUEUE_SIZE)
+        # directory -> {path: hash}, oldest first
+        self._index = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closing = False
+        self.written = 0
+        self.reused = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, daemon=True, name="snapshot-writer")
+            self._thread.start()
+
+    def _directory_index(self, directory):
+        """Index for `directory`; existing snapshots are indexed from their names on first use."""
+        index = self._index.get(directory)
+        if index is not None:
+            return index
+        index = self._index[directory] = {}
+        legacy = []
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+        for name in names:
+            match = _HASHED_NAME.match(name)
+            if match:
+                index[os.path.join(directory, name)] = int(match.group(1), 16)
+            elif _LEGACY_NAME.match(name):
+                legacy.append(os.path.join(directory, name))
+        # Older snapshots have random names and must be decoded; do that off the caller's thread
+        if legacy:
+            self._put(("index", directory, legacy), block=False)
+        return index
+
+    def _find(self, index, phash):
+        best, best_distance = None, self.dedup_bits + 1
+        for path, other in index.items():
+            distance = bin(phash ^ other).count("1")
+            if distance < best_distance:
+                best, best_distance = path, distance
+        return best
+
+    def _remember(self, index, path, phash):
+        index[path] = phash
+        while len(index) > self.index_size:
+            index.pop(next(iter(index)))
+
+    def save(self, frame, directory):
+        """
+        Returns the snapshot path for `frame` in `directory` without waiting for
+        the write, or None if the writer is backed up (the caller may retry
+        with a later frame).
+        """
+        phash = perceptual_hash(frame)
+        with self._lock:
+            self._ensure_thread()
+            index = self._directory_index(directory)
+            existing = self._find(index, phash)
+            if existing is not None:
+                self.reused += 1
+                SNAPSHOTS.inc(result="reused")
+                return existing
+            path = os.path.join(directory, f"snapshot_p{phash:0{HASH_W * HASH_H // 4}x}.jpg")
+            # The caller's buffer is reused once this frame is encoded for the stream
+            if not self._put(("write", directory, path, frame.copy()), block=False):
+                self.dropped += 1
+                SNAPSHOTS.inc(result="dropped")
+                return None
+            self._remember(index, path, phash)
+        return path
+
+    def _put(self, item, block=True):
+        try:
+            self._queue.put(item, block=block)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if item[0] == "write":
+                    self._write(*item[1:])
+                else:
+                    self._index_legacy(*item[1:])
+            finally:
+                self._queue.task_done()
+
+    def _write(self, directory, path, frame):
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with stage_timer("snapshot_write"):
+                ok, buf = cv2.imencode(".jpg", frame)
+                if not ok:
+                    raise ValueError("JPEG encoding failed")
+                with open(tmp, "wb") as f:
+                    f.write(buf.tobytes())
+                os.replace(tmp, path)
+            self.written += 1
+            SNAPSHOTS.inc(result="written")
+        except Exception as e:
+            self.failed += 1
+            SNAPSHOTS.inc(result="failed")
+            print(f"WARNING: snapshot {path} could not be written: {e}", flush=True)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            # Never hand this path out again as an existing snapshot
+            with self._lock:
+                self._index.get(directory, {}).pop(path, None)
+
+    def _index_legacy(self, directory, paths):
+        for path in paths:
+            if self._closing:
+                return
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            phash = perceptual_hash(frame)
+            with self._lock:
+                index = self._index.get(directory)
+                if index is not None and path not in index:
+                    self._remember(index, path, phash)
+
+    def flush(self):
+        """Blocks until every queued snapshot has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout=5.0):
+        """Writes whatever is still queued (for up to `timeout` seconds) and stops the thread."""
+        self._closing = True
+        if self._thread is not None and self._thread.is_alive():
+            self._put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            indexed = sum(len(index) for index in self._index.values())
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "reused": self.reused,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "indexed": indexed,
+            "dedup_bits": self.dedup_bits,
+        }
+
+
+# Shared by every pipeline in the process
+snapshot_writer = SnapshotWriter()
+atexit.register(snapshot_writer.close)
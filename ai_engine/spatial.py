@@ -0,0 +1,122 @@
+import numpy as np
+
+# Above this many boxes the N x N matrix is replaced by a uniform-grid hash
+DENSE_GRID_THRESHOLD = 300
+
+
+def pairwise_iou(boxes):
+    """
+    IoU matrix for an (N, 4) array of [x1, y1, x2, y2] boxes, computed in one shot.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    iw = np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :])
+    ih = np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :])
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0.0)
+    area = (x2 - x1) * (y2 - y1)
+    union = area[:, None] + area[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+def _pair_iou(boxes, i, j):
+    a, b = boxes[i], boxes[j]
+    iw = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    ih = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0.0)
+    union = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+def grid_candidate_pairs(boxes, cell_size=None):
+    """
+    Uniform-grid spatial hash: returns (i, j) index arrays (i < j) of boxes
+    sharing at least one cell. Only these pairs can overlap.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    n = len(boxes)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if cell_size is None:
+        sizes = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        cell_size = max(float(np.median(sizes)), 1.0)
+
+    cx1 = np.floor(boxes[:, 0] / cell_size).astype(np.int64)
+    cy1 = np.floor(boxes[:, 1] / cell_size).astype(np.int64)
+    cx2 = np.floor(boxes[:, 2] / cell_size).astype(np.int64)
+    cy2 = np.floor(boxes[:, 3] / cell_size).astype(np.int64)
+
+    cells = {}
+    for idx in range(n):
+        for gx in range(cx1[idx], cx2[idx] + 1):
+            for gy in range(cy1[idx], cy2[idx] + 1):
+                cells.setdefault((gx, gy), []).append(idx)
+
+    keys = []
+    for members in cells.values():
+        if len(members) < 2:
+            continue
+        m = np.asarray(members, dtype=np.int64)
+        a, b = np.triu_indices(len(m), k=1)
+        keys.append(m[a] * n + m[b])
+    if not keys:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Large boxes share many cells; keep each pair once
+    keys = np.unique(np.concatenate(keys))
+    return keys // n, keys % n
+
+
+def overlapping_pairs(boxes, min_iou=0.0):
+    """
+    Returns (i, j, iou) arrays for every box pair (i < j) whose IoU exceeds
+    `min_iou`. Uses a dense NumPy matrix for normal frames and a grid hash
+    for very dense ones.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    n = len(boxes)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    if n > DENSE_GRID_THRESHOLD:
+        i, j = grid_candidate_pairs(boxes)
+        iou = _pair_iou(boxes, i, j)
+    else:
+        i, j = np.triu_indices(n, k=1)
+        iou = pairwise_iou(boxes)[i, j]
+
+    keep = iou > min_iou
+    return i[keep], j[keep], iou[keep]
+
+
+def points_in_polygon(points, polygon, edge_tolerance=1e-3):
+    """
+    Even-odd ray casting for an (N, 2) array of points against an (M, 2)
+    polygon. Returns a boolean mask of length N. Points on an edge or vertex
+    (within `edge_tolerance` pixels) count as inside, so boxes clamped to a
+    frame border that is also the polygon's border are kept.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    poly = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    px, py = points[:, 0:1], points[:, 1:2]
+    x1, y1 = poly[:, 0], poly[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    # Edges straddling the horizontal line through each point
+    straddle = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = straddle & (px < x_cross)
+    inside = (np.count_nonzero(crossings, axis=1) % 2) == 1
+
+    # Distance of every point to every edge segment
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length2 > 0, ((px - x1) * dx + (py - y1) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    dist2 = (x1 + t * dx - px) ** 2 + (y1 + t * dy - py) ** 2
+    on_edge = (dist2 <= edge_tolerance * edge_tolerance).any(axis=1)
+    return inside | on_edge
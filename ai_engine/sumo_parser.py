@@ -3,6 +3,16 @@ import xml.etree.ElementTree as ET
 import math
 import random
 
+import numpy as np
+
+# Webster / HCM signal-plan constants
+SATURATION_FLOW_PER_LANE = 1800.0  # veh/h of green per lane
+LOST_TIME_PER_PHASE = 4.0          # start-up + clearance lost time, seconds
+MIN_CYCLE, MAX_CYCLE = 40.0, 150.0
+MIN_GREEN, MAX_GREEN = 15, 90
+# A junction snapshot count is read as the vehicles arriving over this many seconds
+DEMAND_WINDOW_S = 300.0
+
 def parse_sumo_network(net_xml_path):
     """
     Parses network.net.xml to find junctions (with traffic lights)
@@ -194,29 +204,78 @@ def parse_sumo_routes(rou_xml_path):
 
     return flows, vehicles
 
-def calculate_green_time(ns_vehicles, we_vehicles):
+def webster_plan(flows, saturation=SATURATION_FLOW_PER_LANE, lost_time=LOST_TIME_PER_PHASE):
     """
-    Applies a simplified Webster's formula to determine green times.
-    Cycle length C = (1.5 * L + 5) / (1 - Y)  ... but we simplify:
-    Green Time is proportional to traffic volume, min 10s, max 90s.
+    Webster signal plans for many junctions at once.
+
+    flows:      (..., P) critical-approach demand per phase in veh/h; leading
+                axes (junctions, scenarios x junctions, ...) are all planned together
+    saturation: saturation flow per phase in veh/h, same shape or broadcastable
+    lost_time:  lost seconds per phase
+
+    Per junction: flow ratios y = q / s, Y = sum(y), lost time L = P * lost_time,
+    optimal cycle C = (1.5 L + 5) / (1 - Y) clamped to [MIN_CYCLE, MAX_CYCLE]
+    (MAX_CYCLE when Y >= 0.95, i.e. oversaturated), and effective green C - L
+    split in proportion to y, with every phase kept within [MIN_GREEN, MAX_GREEN].
+    Returns a dict of arrays: cycle, green, flow_ratio, total_flow_ratio and
+    saturation_degree (X = y C / g per phase; above 1 means queues grow).
     """
-    MIN_GREEN = 15
-    MAX_GREEN = 90
-    
-    # Assume 1 vehicle takes ~2.5 seconds to pass
-    ns_time = max(MIN_GREEN, min(MAX_GREEN, int(ns_vehicles * 2.5)))
-    we_time = max(MIN_GREEN, min(MAX_GREEN, int(we_vehicles * 2.5)))
-    
-    # If one side is empty, still give minimum time
-    if ns_vehicles == 0: ns_time = MIN_GREEN
-    if we_vehicles == 0: we_time = MIN_GREEN
-        
-    return ns_time, we_time
+    q = np.asarray(flows, dtype=np.float64)
+    y = q / np.asarray(saturation, dtype=np.float64)
+    phases = q.shape[-1]
+    total_lost = phases * lost_time
+    Y = y.sum(axis=-1)
+
+    with np.errstate(divide="ignore"):
+        cycle = (1.5 * total_lost + 5.0) / (1.0 - Y)
+    cycle = np.where(Y >= 0.95, MAX_CYCLE, np.clip(cycle, MIN_CYCLE, MAX_CYCLE))
+
+    # Without demand every phase gets an equal share
+    share = np.where(Y[..., None] > 0, y / np.where(Y > 0, Y, 1.0)[..., None], 1.0 / phases)
+    green = np.clip(share * (cycle - total_lost)[..., None], MIN_GREEN, MAX_GREEN)
+    # Min / max green may have stretched or shortened the cycle
+    cycle = green.sum(axis=-1) + total_lost
+
+    return {
+        "cycle": cycle,
+        "green": green,
+        "flow_ratio": y,
+        "total_flow_ratio": Y,
+        "saturation_degree": y * cycle[..., None] / green,
+    }
+
+
+def webster_sweep(flows, demand_factors, saturation=SATURATION_FLOW_PER_LANE, lost_time=LOST_TIME_PER_PHASE):
+    """
+    Plans every junction under each demand scenario (flows scaled by each
+    factor) in one pass and summarises each scenario network-wide.
+    """
+    factors = np.asarray(demand_factors, dtype=np.float64)
+    q = np.asarray(flows, dtype=np.float64)
+    plan = webster_plan(factors.reshape((-1,) + (1,) * q.ndim) * q, saturation, lost_time)
+    junction_axes = tuple(range(1, plan["cycle"].ndim))
+    oversaturated = (plan["saturation_degree"] > 1.0).any(axis=-1)
+    return [
+        {
+            "demand_factor": float(f),
+            "mean_cycle_secs": round(float(c), 1),
+            "max_cycle_secs": round(float(m), 1),
+            "oversaturated_junctions": int(o),
+        }
+        for f, c, m, o in zip(
+            factors,
+            plan["cycle"].mean(axis=junction_axes),
+            plan["cycle"].max(axis=junction_axes),
+            oversaturated.sum(axis=junction_axes),
+        )
+    ]
+
 
-def run_headless_simulation(extract_dir):
+def run_headless_simulation(extract_dir, demand_scenarios=None):
     """
     Simulates traffic based purely on XML parsing.
-    Returns the JSON payload expected by the frontend.
+    Returns the JSON payload expected by the frontend; with demand_scenarios
+    (e.g. [0.5, 1.0, 1.5]) it also sweeps the signal plans across scaled demand.
     """
     net_file = None
     rou_file = None
@@ -243,32 +302,31 @@ def run_headless_simulation(extract_dir):
     # In a real engine, we'd track step-by-step. Here we generate a realistic instantaneous state
     # based on the total flows.
     
+    # Random but proportional counts per junction: a single snapshot usually
+    # has 10-50 cars at an intersection; NS vs WE split around 60/40 or 40/60
+    j_ids = list(junctions)
+    n = len(j_ids)
+    scale_factor = np.array([random.uniform(0.01, 0.03) for _ in range(n)])
+    ns_ratio = np.array([random.uniform(0.3, 0.7) for _ in range(n)])
+    vtypes = ("car", "bus", "truck", "motorcycle")
+    counts = (np.array([flows.get(v, 0) for v in vtypes], dtype=np.float64) * scale_factor[:, None]).astype(int)
+    j_total = counts.sum(axis=1)
+    ns_count = (j_total * ns_ratio).astype(int)
+    we_count = j_total - ns_count
+
+    # Webster signal timing for every junction at once (flows in veh/h, saturation per lane)
+    lanes = np.array([[max(1, len(junctions[j].get("ns_lanes", []))), max(1, len(junctions[j].get("we_lanes", [])))]
+                      for j in j_ids]).reshape(n, 2)
+    demand = np.stack([ns_count, we_count], axis=1) * (3600.0 / DEMAND_WINDOW_S)
+    saturation = SATURATION_FLOW_PER_LANE * lanes
+    plan = webster_plan(demand, saturation)
+    greens = np.rint(plan["green"]).astype(int)
+
     junction_data = {}
-    
-    for j_id, j_info in junctions.items():
-        # Generate random but proportional counts for this junction
-        # NS usually has slightly more traffic than WE in our sample
-        
-        # Base scale: a single snapshot usually has 10-50 cars at an intersection
-        scale_factor = random.uniform(0.01, 0.03) 
-        
-        counts = {
-            "car": int(flows.get("car", 0) * scale_factor),
-            "bus": int(flows.get("bus", 0) * scale_factor),
-            "truck": int(flows.get("truck", 0) * scale_factor),
-            "motorcycle": int(flows.get("motorcycle", 0) * scale_factor),
-        }
-        
-        j_total = sum(counts.values())
-        
-        # Split NS vs WE randomly but around 60/40 or 40/60
-        ns_ratio = random.uniform(0.3, 0.7)
-        ns_count = int(j_total * ns_ratio)
-        we_count = j_total - ns_count
-        
-        # Calculate Webster's Signal Timing
-        ns_green, we_green = calculate_green_time(ns_count, we_count)
-        
+    for i, j_id in enumerate(j_ids):
+        j_info = junctions[j_id]
+        ns_green, we_green = int(greens[i, 0]), int(greens[i, 1])
+
         # If emergency, override timing
         emergency_at_this_junction = emergency_detected and random.random() > 0.5
         if emergency_at_this_junction:
@@ -277,21 +335,23 @@ def run_headless_simulation(extract_dir):
             we_green = 10
             
         junction_data[j_id] = {
-            "vehicle_counts": counts,
+            "vehicle_counts": dict(zip(vtypes, counts[i].tolist())),
             "lane_density": {
-                "NS_vehicles": ns_count,
-                "WE_vehicles": we_count
+                "NS_vehicles": int(ns_count[i]),
+                "WE_vehicles": int(we_count[i])
             },
             "signals": {
                 "ns_green_secs": ns_green,
-                "we_green_secs": we_green
+                "we_green_secs": we_green,
+                "cycle_secs": round(float(plan["cycle"][i]), 1),
+                "flow_ratio": round(float(plan["total_flow_ratio"][i]), 3)
             },
             "emergency": emergency_at_this_junction,
             "x": j_info.get("x", 0),
             "y": j_info.get("y", 0)
         }
-        
-    return {
+
+    summary = {
         "network_name": os.path.basename(net_file),
         "junction_count": len(junctions),
         "total_vehicles_simulated": total_vehicles,
@@ -304,3 +364,6 @@ def run_headless_simulation(extract_dir):
         },
         "vehicles": vehicles
     }
+    if demand_scenarios:
+        summary["demand_sweep"] = webster_sweep(demand, demand_scenarios, saturation)
+    return summary
@@ -0,0 +1,56 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext, RoiContext
+
+
+def make_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8), (9, 9), 3)
+
+
+def planned_mode(bboxes):
+    ctx = FrameContext(make_frame(), color_mode="auto")
+    ctx.plan_color_checks(bboxes)
+    return ctx.color_mode
+
+
+def test_auto_mode_counts_box_work_not_coverage():
+    # A handful of cars stays on the per-box path
+    assert planned_mode([[100 * k, 400, 100 * k + 80, 460] for k in range(10)]) == "roi"
+    # One frame-sized box covers everything but is still cheaper than the integral pass
+    assert planned_mode([[0, 0, 1280, 720]]) == "roi"
+    # Heavily overlapping large boxes cost one crop each, even though they cover less of the frame
+    assert planned_mode([[0, 0, 900, 600]] * 4) == "integral"
+    # Hundreds of small boxes: the per-box overhead adds up
+    assert planned_mode([[x, 300, x + 32, 332] for x in range(0, 1240, 4)]) == "integral"
+
+
+def test_integral_and_roi_counts_agree():
+    frame = make_frame(1)
+    roi_ctx, integral_ctx = FrameContext(frame, color_mode="roi"), FrameContext(frame, color_mode="integral")
+    for bbox in [[10, 20, 110, 90], [600, 300, 900, 650], [1200, 680, 1280, 720]]:
+        for name in ("fire", "smoke", "red"):
+            assert roi_ctx.color_count(name, bbox) == integral_ctx.color_count(name, bbox)
+
+
+def test_downscaled_edge_density_matches_full_resolution():
+    # Stored accident snapshots, cropped to boxes above MAX_ROI_SIDE
+    snapshots = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "backend", "uploads", "*.jpg")))
+    assert snapshots
+    errors = {"gray": [], "clahe": []}
+    for path in snapshots[::4]:
+        frame = cv2.imread(path)
+        h, w = frame.shape[:2]
+        for bbox in [(0, 0, w, h), (0, 0, w // 2 + 200, h), (w // 4, h // 4, w, h)]:
+            full, scaled = RoiContext(frame, bbox, max_side=10 ** 6), RoiContext(frame, bbox)
+            assert scaled.scale < 1.0
+            for source, lo, hi in [("gray", 80, 160), ("clahe", 25, 75)]:
+                reference = full.edge_density(source, lo, hi)
+                if reference > 0.01:
+                    errors[source].append(abs(scaled.edge_density(source, lo, hi) / reference - 1))
+    assert np.median(errors["gray"]) < 0.15
+    assert np.median(errors["clahe"]) < 0.10
@@ -0,0 +1,50 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from inference_engine import InferenceEngine, MicroBatcher
+
+
+class RecordingModel:
+    """Stands in for an ultralytics YOLO model; records which replica ran on which thread."""
+
+    def __init__(self):
+        self.predictor = None
+        self.calls = []
+
+    def predict(self, source, **kwargs):
+        if self.predictor is None:
+            self.predictor = object()  # lazy setup, once per replica
+            time.sleep(0.01)
+        self.calls.append((threading.current_thread().name, id(self)))
+        frames = source if isinstance(source, list) else [source]
+        return [SimpleNamespace(boxes=None) for _ in frames]
+
+
+def bare_engine(workers, batching):
+    """InferenceEngine wired to RecordingModel, without loading real weights."""
+    engine = InferenceEngine.__new__(InferenceEngine)
+    engine.imgsz, engine.workers, engine.model = 64, workers, RecordingModel()
+    engine._lock, engine._local = threading.Lock(), threading.local()
+    engine._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yolo-worker")
+    engine.batcher = None
+    if batching:
+        engine.batcher = MicroBatcher(engine._predict_batch_local, engine._pool, workers, window_ms=50, max_batch=8)
+    return engine
+
+
+def test_warm_up_reaches_every_replica():
+    for batching in (False, True):
+        engine = bare_engine(workers=3, batching=batching)
+        try:
+            engine.warm_up(np.zeros((64, 64, 3), dtype=np.uint8))
+            # copy.copy shares the calls list, so it sees every replica's predictions
+            threads = {name for name, _ in engine.model.calls}
+            replicas = {replica for _, replica in engine.model.calls}
+            assert len(threads) == 3 and len(replicas) == 3
+            assert engine.batch_stats().get("batches", 0) == 0
+        finally:
+            engine.shutdown()
@@ -0,0 +1,26 @@
+import threading
+
+from jobs import JobManager
+
+
+def test_job_cancelled_while_queued_still_calls_back(tmp_path, monkeypatch):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    manager = JobManager(loader=None, cache=None, workers=1)
+    notified, done = [], threading.Event()
+
+    def notify(job):
+        notified.append((job.job_id, job.state))
+        done.set()
+
+    monkeypatch.setattr(manager, "_notify", notify)
+    job = manager.submit(str(video), "clip.mp4", callback_url="http://example.invalid/hook")
+    manager.cancel(job.job_id)
+    assert job.state == "cancelled"
+
+    manager.start()
+    try:
+        assert done.wait(5)
+    finally:
+        manager.stop()
+    assert notified == [(job.job_id, "cancelled")]
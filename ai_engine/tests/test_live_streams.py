@@ -0,0 +1,52 @@
+import asyncio
+
+import live_streams
+from live_streams import QUALITY_TIERS, Subscriber
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def simulate(monkeypatch, publish_every, consume_every, seconds, start_tier):
+    """Publishes frames at one pace while the client takes them at another; returns the tier history."""
+    clock = FakeClock()
+    monkeypatch.setattr(live_streams.time, "monotonic", clock.monotonic)
+
+    async def run():
+        sub = Subscriber(frames=True, metadata=False)
+        sub.tier = start_tier
+        tiers, index = [], 0
+        next_publish, next_consume, end = clock.now, clock.now, clock.now + seconds
+        while clock.now < end:
+            clock.now = min(next_publish, next_consume)
+            if clock.now == next_publish:
+                sub.offer(("frame", index, b"jpeg"))
+                sub.adapt()
+                tiers.append(sub.tier)
+                index += 1
+                next_publish += publish_every
+            if clock.now == next_consume:
+                if sub._items:
+                    await sub.get()
+                next_consume += consume_every
+        return sub, tiers
+
+    return asyncio.run(run())
+
+
+def test_client_keeping_up_steps_back_up(monkeypatch):
+    sub, tiers = simulate(monkeypatch, publish_every=0.1, consume_every=0.05, seconds=20, start_tier=3)
+    assert tiers[-1] == 0
+    assert sub.dropped == 0 and not sub.is_slow()
+
+
+def test_slow_client_never_steps_up(monkeypatch):
+    sub, tiers = simulate(monkeypatch, publish_every=0.1, consume_every=0.14, seconds=20, start_tier=2)
+    assert sub.is_slow()
+    assert all(later >= earlier for earlier, later in zip(tiers, tiers[1:]))
+    assert tiers[-1] == len(QUALITY_TIERS) - 1
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import motion_gate
+import result_cache
+from result_cache import AnalysisCache, analysis_fingerprint, cacheable_summary, summary_for_upload
+
+
+def test_hit_on_renamed_upload_returns_its_own_path(tmp_path):
+    first, second = tmp_path / "a.jpg", tmp_path / "b.jpg"
+    first.write_bytes(b"same image")
+    second.write_bytes(b"same image")
+    cache = AnalysisCache(cache_dir=str(tmp_path / "cache"), max_entries=4)
+    fingerprint = {"version": 0}
+
+    summary = ({"car": 2}, 2, False, str(first))
+    cache.put(cache.key_for(str(first), fingerprint), cacheable_summary(summary), fingerprint)
+    key = cache.key_for(str(second), fingerprint)
+    assert key == cache.key_for(str(first), fingerprint)
+
+    # Memory tier, then disk tier (a fresh cache over the same directory)
+    for hit in (cache.get(key), AnalysisCache(cache_dir=str(tmp_path / "cache")).get(key)):
+        assert summary_for_upload(hit, str(second)) == [{"car": 2}, 2, False, str(second)]
+    assert str(first) not in (tmp_path / "cache" / f"{key}.json").read_text()
+
+
+def test_video_summary_has_no_path():
+    cached = cacheable_summary(({"bus": 1}, 1, True, None))
+    assert summary_for_upload(cached, "/uploads/clip.mp4") == [{"bus": 1}, 1, True, None]
+
+
+def test_fingerprint_tracks_gate_and_track_settings(monkeypatch):
+    engine = SimpleNamespace(model_path="missing.pt", backend="torch", imgsz=640)
+    camera = SimpleNamespace(fingerprint=lambda: "cam-1")
+    monkeypatch.setattr(motion_gate, "GATE_MODE", "camera")
+    base = analysis_fingerprint(engine, camera=camera)
+    assert base["motion_gate"] is not None
+    # Without a camera, batch uploads are not gated, so gate settings do not matter
+    assert analysis_fingerprint(engine)["motion_gate"] is None
+
+    monkeypatch.setattr(motion_gate, "THRESHOLD", motion_gate.THRESHOLD * 2)
+    gated = analysis_fingerprint(engine, camera=camera)
+    monkeypatch.setattr(result_cache, "TRACK_TTL", 30)
+    short_ttl = analysis_fingerprint(engine, camera=camera)
+    assert len({str(sorted(f.items())) for f in (base, gated, short_ttl)}) == 3
@@ -0,0 +1,28 @@
+from sampling import FrameSampler
+
+
+def test_default_analyses_every_frame(monkeypatch):
+    for var in ("AI_SAMPLING_POLICY", "AI_SAMPLING_STRIDE", "AI_SAMPLING_TARGET_FPS"):
+        monkeypatch.delenv(var, raising=False)
+    sampler = FrameSampler.from_params()
+    assert (sampler.policy, sampler.stride) == ("stride", 1)
+    assert all(sampler.should_analyse(i) and sampler.mark(i) == 1 for i in range(10))
+
+
+def test_adaptive_is_opt_in(monkeypatch):
+    monkeypatch.setenv("AI_SAMPLING_POLICY", "adaptive")
+    monkeypatch.setenv("AI_SAMPLING_STRIDE", "2")
+    sampler = FrameSampler.from_params()
+    assert (sampler.policy, sampler.stride) == ("adaptive", 2)
+    # Request params win over the environment
+    assert FrameSampler.from_params("stride", 3).policy == "stride"
+
+
+def test_mark_reports_real_gap_after_stride_change():
+    sampler = FrameSampler(policy="adaptive", stride=2)
+    analysed = [i for i in range(12) if sampler.should_analyse(i) and sampler.mark(i) is not None]
+    assert analysed == [1, 3, 5, 7, 9, 11]
+    sampler.observe({"detections": []})  # empty scene: back off
+    assert sampler.stride == 3
+    assert not sampler.should_analyse(13) and sampler.should_analyse(14)
+    assert sampler.mark(14) == 3
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from sessions import SessionLimitError, SessionManager
+
+
+def test_camera_ingest_has_its_own_budget(monkeypatch):
+    monkeypatch.delenv("AI_MAX_CAMERA_STREAMS", raising=False)
+    sessions = SessionManager(SimpleNamespace(names={0: "person"}), max_sessions=2, max_camera_sessions=3)
+
+    cameras = [sessions.open(f"rtsp://cam{i}", kind="camera") for i in range(3)]
+    with pytest.raises(SessionLimitError):
+        sessions.open("rtsp://cam3", kind="camera")
+
+    # Every camera slot is taken, yet uploads / jobs / live streams still get theirs
+    upload = sessions.open("clip.mp4", kind="batch")
+    sessions.open("clip.mp4", kind="job")
+    with pytest.raises(SessionLimitError):
+        sessions.open("live.mp4", kind="live")
+    assert sessions.active_count() == 5 and sessions.active_count("camera") == 3
+
+    # Freeing a slot only helps its own pool
+    sessions.close(upload.session_id)
+    with pytest.raises(SessionLimitError):
+        sessions.open("rtsp://cam3", kind="camera")
+    sessions.open("live.mp4", kind="live")
+    sessions.close(cameras[0].session_id)
+    sessions.open("rtsp://cam3", kind="camera")
+
+
+def test_camera_budget_env_override(monkeypatch):
+    monkeypatch.setenv("AI_MAX_CAMERA_STREAMS", "40")
+    assert SessionManager(SimpleNamespace(names={}), max_camera_sessions=3).max_camera_sessions == 40
@@ -0,0 +1,66 @@
+import numpy as np
+
+from spatial import DENSE_GRID_THRESHOLD, grid_candidate_pairs, overlapping_pairs, pairwise_iou, points_in_polygon
+
+
+# ROI of cameras.example.json in pixels of a 1280x720 frame
+ROI = np.array([[0.05, 0.45], [0.95, 0.45], [1.0, 1.0], [0.0, 1.0]]) * [1280, 720]
+
+
+def test_interior_and_exterior_points():
+    inside = points_in_polygon([[640, 500], [640, 100], [10, 330]], ROI)
+    assert inside.tolist() == [True, False, False]
+
+
+def test_points_on_edges_are_inside():
+    # Bottom edge (boxes clamped to the frame height), top edge, middle of the slanted left side
+    left_mid = ROI[0] + 0.5 * (ROI[3] - ROI[0])
+    points = [[640, 720], [0, 720], [640, 324], left_mid]
+    assert points_in_polygon(points, ROI).all()
+
+
+def test_vertices_are_inside():
+    assert points_in_polygon(ROI, ROI).all()
+
+
+def test_just_outside_the_edge_is_outside():
+    assert not points_in_polygon([[640, 720.5], [640, 323.5]], ROI).any()
+
+
+def random_boxes(n, seed=0):
+    """Dense traffic-like scene: mostly car-sized boxes, a few large buses, some on the frame border."""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, [1280, 720], (n, 2))
+    wh = rng.uniform(20, 90, (n, 2)) * np.where(rng.random((n, 1)) < 0.05, 4, 1)
+    boxes = np.hstack([xy, xy + wh])
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, 1280)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, 720)
+    return boxes.astype(np.float32)
+
+
+def dense_pairs(boxes, min_iou):
+    i, j = np.triu_indices(len(boxes), k=1)
+    iou = pairwise_iou(boxes)[i, j]
+    keep = iou > min_iou
+    return i[keep], j[keep], iou[keep]
+
+
+def test_grid_candidates_cover_every_overlapping_pair():
+    boxes = random_boxes(500)
+    i, j = grid_candidate_pairs(boxes)
+    candidates = set(zip(i.tolist(), j.tolist()))
+    di, dj, _ = dense_pairs(boxes, 0.0)
+    assert len(di) > 0
+    assert set(zip(di.tolist(), dj.tolist())) <= candidates
+    assert (i < j).all() and len(candidates) == len(i)
+
+
+def test_grid_path_matches_dense_matrix():
+    for n, min_iou in [(DENSE_GRID_THRESHOLD + 1, 0.0), (800, 0.0), (800, 0.3)]:
+        boxes = random_boxes(n, seed=n)
+        i, j, iou = overlapping_pairs(boxes, min_iou)
+        di, dj, diou = dense_pairs(boxes, min_iou)
+        grid = {(a, b): v for a, b, v in zip(i.tolist(), j.tolist(), iou.tolist())}
+        dense = {(a, b): v for a, b, v in zip(di.tolist(), dj.tolist(), diou.tolist())}
+        assert grid.keys() == dense.keys()
+        np.testing.assert_allclose([grid[k] for k in dense], list(dense.values()), rtol=1e-5)
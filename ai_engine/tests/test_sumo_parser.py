@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from sumo_parser import MAX_CYCLE, MIN_CYCLE, MIN_GREEN, webster_plan, webster_sweep
+
+
+def test_webster_textbook_cycle_and_split():
+    # Two phases, s = 1800 veh/h, 4 s lost per phase: y = (0.5, 0.35), Y = 0.85, L = 8 s
+    # C0 = (1.5 L + 5) / (1 - Y) = 17 / 0.15 = 113.3 s; g = (C0 - L) * y / Y = 61.96 s and 43.37 s
+    plan = webster_plan([900, 630], 1800, 4)
+    assert plan["cycle"] == pytest.approx(113.333, abs=1e-3)
+    np.testing.assert_allclose(plan["green"], [61.961, 43.373], atol=1e-3)
+    assert plan["total_flow_ratio"] == pytest.approx(0.85)
+    # Webster's split gives every phase the same degree of saturation, Y C / (C - L)
+    np.testing.assert_allclose(plan["saturation_degree"], [0.9146] * 2, atol=1e-4)
+
+
+def test_cycle_limits_and_zero_demand():
+    plans = webster_plan([[0, 0], [300, 150], [1000, 800]], 1800, 4)
+    # No demand: minimum cycle, effective green split equally
+    assert plans["cycle"][0] == MIN_CYCLE
+    np.testing.assert_allclose(plans["green"][0], [16, 16])
+    # Light demand: C0 = 17 / 0.75 = 22.7 s is raised to 40 s; the 32 s of green split 2:1
+    # gives the minor phase 10.7 s, which MIN_GREEN lifts to 15 s and so stretches the cycle
+    np.testing.assert_allclose(plans["green"][1], [21.333, MIN_GREEN], atol=1e-3)
+    assert plans["cycle"][1] == pytest.approx(44.333, abs=1e-3)
+    # Y >= 0.95 is oversaturated: maximum cycle, phases still above saturation
+    assert plans["cycle"][2] == MAX_CYCLE
+    assert (plans["saturation_degree"][2] > 1).all()
+
+
+def test_sweep_matches_single_plans():
+    flows = np.array([[900, 630], [300, 150]])
+    sweep = webster_sweep(flows, [0.5, 1.0, 1.2], 1800, 4)
+    assert [s["demand_factor"] for s in sweep] == [0.5, 1.0, 1.2]
+    for scenario in sweep:
+        single = webster_plan(flows * scenario["demand_factor"], 1800, 4)
+        assert scenario["mean_cycle_secs"] == round(float(single["cycle"].mean()), 1)
+        assert scenario["max_cycle_secs"] == round(float(single["cycle"].max()), 1)
+    # At 1.2 x demand the first junction is at Y = 1.02
+    assert [s["oversaturated_junctions"] for s in sweep] == [0, 0, 1]
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from track_table import COUNT_AFTER_HITS, SPEED_FRAMES, TrackTable
+
+
+class DictTracks:
+    """
+    The per-id dict logic VehicleDetector used before TrackTable (no eviction),
+    with speeds scaled to SPEED_FRAMES and no acceleration against the new-track speed.
+    """
+
+    def __init__(self):
+        self.centroids, self.prev_speeds, self.accelerations = {}, {}, {}
+        self.id_history, self.unique_vehicle_ids = {}, set()
+
+    def update(self, track_ids, cx, cy, frame_skip):
+        speeds, newly_counted = [], []
+        for tid, x, y in zip(track_ids.tolist(), cx.tolist(), cy.tolist()):
+            measured = self.id_history.get(tid, 0) >= 2
+            self.id_history[tid] = self.id_history.get(tid, 0) + 1
+            new_count = self.id_history[tid] > COUNT_AFTER_HITS and tid not in self.unique_vehicle_ids
+            if new_count:
+                self.unique_vehicle_ids.add(tid)
+            if tid in self.centroids:
+                px, py = self.centroids[tid]
+                speed = np.sqrt((x - px) ** 2 + (y - py) ** 2) * SPEED_FRAMES / frame_skip
+            else:
+                speed = 10.0
+            accel = (speed - (self.prev_speeds[tid] if measured else speed)) / frame_skip
+            if abs(accel) > 50:
+                accel = 0
+            self.prev_speeds[tid] = speed
+            self.centroids[tid] = (x, y)
+            self.accelerations[tid] = accel
+            speeds.append(speed)
+            newly_counted.append(new_count)
+        return np.array(speeds), np.array(newly_counted)
+
+
+def replay(frames=60, ids=400, seed=0):
+    """Fixed sequence of (track_ids, cx, cy, frame_skip); ids are unique within a frame."""
+    rng = np.random.default_rng(seed)
+    pos = rng.integers(0, 1000, (ids, 2))
+    for _ in range(frames):
+        visible = np.flatnonzero(rng.random(ids) < 0.6)
+        rng.shuffle(visible)
+        # Mostly small moves, some big jumps so the > 50 acceleration clamp is hit
+        pos[visible] += rng.integers(-6, 7, (len(visible), 2)) * np.where(rng.random((len(visible), 1)) < 0.05, 60, 1)
+        yield visible.astype(np.int64), pos[visible, 0].copy(), pos[visible, 1].copy(), int(rng.integers(1, 4))
+
+
+def test_matches_dict_logic_and_grows():
+    table, reference = TrackTable(capacity=64, ttl=10_000), DictTracks()
+    for frame_index, (tids, cx, cy, skip) in enumerate(replay(), start=1):
+        speed, counted = table.update(tids, cx, cy, frame_index, skip)
+        ref_speed, ref_counted = reference.update(tids, cx, cy, skip)
+        np.testing.assert_allclose(speed, ref_speed)
+        np.testing.assert_array_equal(counted, ref_counted)
+        for tid in tids.tolist():
+            assert table.acceleration(tid) == pytest.approx(reference.accelerations[tid])
+
+    # 400 ids through a 64-row table: it must have doubled (64 -> 128 -> 256 -> 512)
+    assert table.capacity == 512
+    assert len(table) == len(reference.centroids)
+    rows, is_new = table.slots_for(np.array(sorted(reference.id_history)))
+    assert not is_new.any()
+    np.testing.assert_array_equal(table.hits[rows], [reference.id_history[t] for t in sorted(reference.id_history)])
+    np.testing.assert_array_equal(table.counted[rows],
+                                  [t in reference.unique_vehicle_ids for t in sorted(reference.id_history)])
+
+
+def test_ttl_eviction_recycles_rows():
+    table = TrackTable(capacity=4, ttl=5)
+    one = lambda tid: (np.array([tid]), np.array([100]), np.array([100]))
+
+    table.update(*one(1), frame_index=1, frame_skip=1)
+    table.update(*one(2), frame_index=2, frame_skip=1)
+    row_of_1 = table.slots_for(np.array([1]))[0][0]
+    assert table.stats() == {"live_tracks": 2, "capacity": 4, "evicted": 0}
+
+    # Track 1 was last seen 6 frames ago (> ttl); track 2 only 5 frames ago
+    table.update(*one(3), frame_index=7, frame_skip=1)
+    table.evict(7)
+    assert table.stats() == {"live_tracks": 2, "capacity": 4, "evicted": 1}
+    assert table.acceleration(1) == 0
+
+    # The freed row goes to the next new id, which starts from scratch
+    speed, _ = table.update(*one(4), frame_index=8, frame_skip=1)
+    rows, _ = table.slots_for(np.array([4]))
+    assert rows[0] == row_of_1
+    assert speed[0] == 10.0 and table.hits[row_of_1] == 1 and not table.counted[row_of_1]
+    assert table.capacity == 4
+
+
+def test_constant_velocity_has_no_acceleration_across_stride_changes():
+    # 2 px per source frame, analysed at stride 12, then 1 (accident evidence), then 3
+    table, frame, x = TrackTable(), 0, 0
+    accels, speeds = [], []
+    for gap in [12, 12, 12, 1, 1, 3, 3, 12]:
+        frame += gap
+        x += 2 * gap
+        speed, _ = table.update(np.array([7]), np.array([x]), np.array([100]), frame, gap)
+        speeds.append(float(speed[0]))
+        accels.append(table.acceleration(7))
+    assert speeds[1:] == [2.0 * SPEED_FRAMES] * 7
+    assert accels == [0] * 8
+
+
+def test_new_track_speed_does_not_read_as_a_stop():
+    # A parked car analysed on every frame: the first measured speed is 0, not a drop from 10
+    table = TrackTable()
+    for frame in range(1, 6):
+        speed, _ = table.update(np.array([3]), np.array([500]), np.array([400]), frame, 1)
+        assert table.acceleration(3) == 0
+    assert speed[0] == 0
+
+
+def test_eviction_runs_without_tracked_boxes():
+    table = TrackTable(ttl=5)
+    table.update(np.array([1, 2]), np.array([10, 20]), np.array([10, 20]), frame_index=1, frame_skip=1)
+    # Empty scene: nothing to update, but the stale rows are still reclaimed
+    for frame in range(2, 8):
+        table.evict(frame)
+    assert table.stats()["live_tracks"] == 0 and table.evicted == 2
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from traffic_logic import TrafficController
+
+
+def scalar_plan(controller, densities, emergency):
+    """One junction through the scalar controller: its approaches compete like junctions do."""
+    approaches = {a: {"density": float(d), "emergency": bool(e)} for a, (d, e) in enumerate(zip(densities, emergency))}
+    updates, mode = controller.calculate_signal_state(approaches)
+    green_approaches = [a for a, state in updates.items() if state == "green"]
+    phase = green_approaches[0] if green_approaches else -1
+    if mode == "EMERGENCY_OVERRIDE":
+        return phase, controller.max_green_time, True
+    return phase, controller.dynamic_green_duration(densities[phase]) if phase >= 0 else 0, False
+
+
+def test_rows_match_scalar_controller():
+    controller = TrafficController()
+    rng = np.random.default_rng(0)
+    densities = rng.poisson(4, (500, 4))
+    densities[:20] = 0                      # no demand at all
+    densities[20:40, 1:] = densities[20:40, :1]  # ties go to the first approach
+    emergency = rng.random((500, 4)) < 0.02
+    emergency[:5, 2] = True                 # emergency without demand
+
+    plan = controller.plan_batch(densities, emergency)
+    for j in range(len(densities)):
+        phase, green, has_emergency = scalar_plan(controller, densities[j], emergency[j])
+        assert (plan.phase[j], plan.green[j], plan.emergency[j]) == (phase, green, has_emergency), j
+
+
+def test_current_phase_is_held_within_threshold():
+    controller = TrafficController()  # base_density_threshold = 5
+    densities = np.array([
+        [6, 10, 0],   # 10 - 6 < 5: current approach 0 keeps green
+        [6, 11, 0],   # 11 - 6 = 5: switch to approach 1
+        [0, 3, 2],    # current approach has no vehicles: switch
+        [4, 7, 1],    # no current phase: busiest approach
+        [4, 7, 1],    # out-of-range current phase is ignored
+    ])
+    plan = controller.plan_batch(densities, current_phase=[0, 0, 0, -1, 9])
+    assert plan.phase.tolist() == [0, 1, 1, 1, 1]
+    assert plan.green.tolist() == [12, 22, 10, 14, 14]
+
+
+def test_emergency_overrides_hold_and_demand():
+    controller = TrafficController()
+    densities = np.array([[8, 2, 0], [8, 2, 0], [0, 0, 0], [3, 9, 0]])
+    per_approach = np.array([[0, 0, 1], [0, 0, 0], [0, 0, 0], [0, 0, 0]], dtype=bool)
+    plan = controller.plan_batch(densities, per_approach, current_phase=[0, 0, -1, 0])
+    assert plan.phase.tolist() == [2, 0, -1, 1]
+    assert plan.green.tolist() == [60, 16, 0, 18]
+    assert plan.emergency.tolist() == [True, False, False, False]
+
+    # Per-junction flags keep the chosen approach (approach 0 when there is no demand)
+    plan = controller.plan_batch(densities, [False, True, True, False])
+    assert plan.phase.tolist() == [0, 0, 0, 1]
+    assert plan.green.tolist() == [16, 60, 60, 18]
+
+
+def test_empty_phase_arrays_are_rejected():
+    controller = TrafficController()
+    with pytest.raises(ValueError):
+        controller.plan_batch(np.zeros((3, 0)))
+    assert controller.plan_batch(np.zeros((0, 4))).phase.shape == (0,)
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+
+# Tracks not seen for this many analysed frames are evicted
+TRACK_TTL = int(os.environ.get("AI_TRACK_TTL", 300))
+
+# Vehicles must be seen on more than this many frames before they are counted
+COUNT_AFTER_HITS = 15
+
+# Speeds are pixels per this many source frames (the original fixed analysis
+# stride), whatever the actual stride, so speed / acceleration thresholds
+# keep their meaning when the sampler changes the gap between frames
+SPEED_FRAMES = 10
+# Speed reported for a track on its first frame, before any displacement is known
+NEW_TRACK_SPEED = 10.0
+
+
+class TrackTable:
+    """
+    Per-stream motion state of every live track in preallocated NumPy columns.
+
+    Replaces the ever-growing per-id dicts: rows are recycled once a track has
+    not been seen for `ttl` analysed frames, so memory depends on how many
+    vehicles are in view, not on how long the stream has been running.
+    Speed and acceleration of all tracks in a frame are updated in one step.
+    """
+
+    def __init__(self, capacity=256, ttl=None):
+        self.ttl = ttl or TRACK_TTL
+        self._slots = {}  # track id -> row
+        self._free = []
+        self.evicted = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, "capacity", 0)
+        self.capacity = capacity
+
+        def grow(name, dtype, fill=0):
+            column = np.full(capacity, fill, dtype=dtype)
+            if old:
+                column[:old] = getattr(self, name)
+            setattr(self, name, column)
+
+        grow("ids", np.int64, -1)
+        grow("cx", np.int64)
+        grow("cy", np.int64)
+        grow("speed", np.float64)
+        grow("accel", np.float64)
+        grow("hits", np.int32)
+        grow("last_seen", np.int64)
+        grow("counted", bool, False)
+        # Newest rows last so pop() hands out the lowest free row first
+        self._free.extend(range(capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def slots_for(self, track_ids):
+        """Rows of the given ids, creating rows for new ids. Returns (rows, is_new)."""
+        rows = np.empty(len(track_ids), dtype=np.int64)
+        is_new = np.zeros(len(track_ids), dtype=bool)
+        for i, tid in enumerate(track_ids.tolist()):
+            row = self._slots.get(tid)
+            if row is None:
+                if not self._free:
+                    self._allocate(self.capacity * 2)
+                row = self._free.pop()
+                self._slots[tid] = row
+                self.ids[row] = tid
+                self.hits[row] = 0
+                self.counted[row] = False
+                is_new[i] = True
+            rows[i] = row
+        return rows, is_new
+
+    def update(self, track_ids, cx, cy, frame_index, frame_skip):
+        """
+        Records this frame's centroids of `track_ids` and returns
+        (speeds, newly_counted_mask) aligned with the inputs.
+
+        speed = centroid displacement since the track's previous analysed
+        frame, `frame_skip` source frames ago, scaled to SPEED_FRAMES frames
+        (NEW_TRACK_SPEED for a new track); acceleration = speed change per
+        source frame, zeroed when implausible (> 50). Acceleration stays 0
+        until the track has two measured speeds to compare.
+        """
+        rows, is_new = self.slots_for(track_ids)
+        # Rows seen at least twice before hold a measured speed, not the new-track placeholder
+        measured = self.hits[rows] >= 2
+
+        dx, dy = cx - self.cx[rows], cy - self.cy[rows]
+        speed = np.sqrt(dx * dx + dy * dy).astype(np.float64) * (SPEED_FRAMES / frame_skip)
+        speed[is_new] = NEW_TRACK_SPEED
+        prev = np.where(measured, self.speed[rows], speed)
+        accel = (speed - prev) / frame_skip
+        accel[np.abs(accel) > 50] = 0
+
+        self.cx[rows] = cx
+        self.cy[rows] = cy
+        self.speed[rows] = speed
+        self.accel[rows] = accel
+        self.last_seen[rows] = frame_index
+        self.hits[rows] += 1
+
+        newly_counted = (self.hits[rows] > COUNT_AFTER_HITS) & ~self.counted[rows]
+        self.counted[rows[newly_counted]] = True
+        return speed, newly_counted
+
+    def evict(self, frame_index):
+        """
+        Frees every row whose track was last seen more than `ttl` frames ago.
+        Call once per analysed frame, including frames with no tracked boxes.
+        """
+        stale = np.flatnonzero((self.ids >= 0) & (frame_index - self.last_seen > self.ttl))
+        for row in stale.tolist():
+            del self._slots[int(self.ids[row])]
+            self.ids[row] = -1
+            self._free.append(row)
+        self.evicted += len(stale)
+
+    def acceleration(self, track_id):
+        row = self._slots.get(track_id)
+        return float(self.accel[row]) if row is not None else 0
+
+    def clear(self):
+        self._slots.clear()
+        self._free = []
+        self.capacity = 0
+        self._allocate(256)
+
+    def stats(self):
+        return {"live_tracks": len(self._slots), "capacity": self.capacity, "evicted": self.evicted}
@@ -1,3 +1,12 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Per-junction arrays returned by TrafficController.plan_batch:
+# phase (approach given green, -1 = no demand), green seconds, emergency mask
+SignalPlan = namedtuple("SignalPlan", ["phase", "green", "emergency"])
+
+
 class TrafficController:
     def __init__(self):
         # Default timings (seconds)
@@ -45,10 +54,52 @@ class TrafficController:
     def dynamic_green_duration(self, vehicle_count):
         """
         Calculates how long the green light should stay on.
+        Accepts a single count or an array of counts (one duration each).
         """
-        if vehicle_count == 0:
-            return 0
-        
-        # Simple linear scaling: 2 seconds per vehicle, clamped
-        duration = vehicle_count * 2
-        return max(self.min_green_time, min(duration, self.max_green_time))
+        counts = np.asarray(vehicle_count)
+        # Simple linear scaling: 2 seconds per vehicle, clamped; no vehicles, no green
+        duration = np.where(counts == 0, 0, np.clip(counts * 2, self.min_green_time, self.max_green_time))
+        return duration if counts.ndim else duration.item()
+
+    def plan_batch(self, densities, emergency=None, current_phase=None):
+        """
+        Phase and green duration for many junctions in one vectorized pass.
+
+        densities:     (J, A) vehicles per approach (or per phase group) of J junctions
+        emergency:     optional (J, A) flags per approach, or (J,) per junction
+        current_phase: optional (J,) approach that is green now (-1 = none); it
+                       keeps green unless another approach has at least
+                       base_density_threshold more vehicles
+        Unlike calculate_signal_state, every junction gets its own green.
+        """
+        d = np.asarray(densities, dtype=np.float32)
+        if d.ndim == 1:
+            d = d[:, None]
+        if d.ndim != 2 or d.shape[1] == 0:
+            raise ValueError(f"densities must be (junctions, approaches) with at least one approach, got {d.shape}")
+        rows = np.arange(len(d))
+        phase = d.argmax(axis=1)
+
+        if current_phase is not None:
+            current = np.asarray(current_phase, dtype=np.int64)
+            valid = (current >= 0) & (current < d.shape[1])
+            current_density = d[rows, np.where(valid, current, 0)]
+            keep = valid & (current_density > 0) & (d[rows, phase] - current_density < self.base_density_threshold)
+            phase = np.where(keep, current, phase)
+
+        chosen = d[rows, phase]
+        green = self.dynamic_green_duration(chosen).astype(np.float32)
+        phase = np.where(chosen > 0, phase, -1)
+
+        if emergency is None:
+            return SignalPlan(phase, green, np.zeros(len(d), dtype=bool))
+        flags = np.asarray(emergency, dtype=bool)
+        if flags.ndim == 2:
+            # Emergency vehicle's approach goes green for the longest allowed time
+            has_emergency = flags.any(axis=1)
+            phase = np.where(has_emergency, flags.argmax(axis=1), phase)
+        else:
+            has_emergency = flags
+            phase = np.where(has_emergency & (phase < 0), 0, phase)
+        green = np.where(has_emergency, np.float32(self.max_green_time), green)
+        return SignalPlan(phase, green, has_emergency)
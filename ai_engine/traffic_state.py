@@ -0,0 +1,161 @@
+import asyncio
+import copy
+import os
+import threading
+
+# Most state-delta events per second sent to one /traffic/stream client
+STREAM_HZ = float(os.environ.get("AI_TRAFFIC_STREAM_HZ", 4))
+
+
+def _merge(into, delta):
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(into.get(key), dict):
+            _merge(into[key], value)
+        else:
+            into[key] = copy.deepcopy(value)
+
+
+class StateSubscriber:
+    """
+    One /traffic/stream client. Deltas published while the client is busy
+    are merged into one pending delta, so a slow client gets fewer, larger
+    events instead of an ever-growing backlog.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def offer(self, delta):
+        """Called from any thread."""
+        with self._lock:
+            _merge(self._pending, delta)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    async def get(self):
+        await self._ready.wait()
+        self._ready.clear()
+        with self._lock:
+            delta, self._pending = self._pending, {}
+        return delta
+
+
+class TrafficState:
+    """
+    Junction densities, lane counts, emergencies and signal statuses.
+
+    Detection results (ingested cameras, live streams with a camera) are
+    applied as they arrive: each camera's latest reading is kept and its
+    junction is recomputed from all cameras mapped to it. Only fields whose
+    value actually changed are published, as a nested delta (None marks a
+    removed key), to every subscriber.
+    """
+
+    def __init__(self, junctions, mode="AI_OPTIMIZED"):
+        self.version = 0
+        self._state = {"junctions": copy.deepcopy(junctions), "alerts": [], "mode": mode}
+        # camera_id -> (junction, count, {lane: count}, emergency)
+        self._readings = {}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    # ---------- updates ----------
+
+    def _publish(self, delta):
+        """Caller holds the lock."""
+        if not delta:
+            return
+        self.version += 1
+        delta["version"] = self.version
+        for sub in list(self._subscribers):
+            sub.offer(delta)
+
+    def _junction(self, junction_id):
+        return self._state["junctions"].setdefault(
+            junction_id, {"density": 0, "status": "red", "emergency": False})
+
+    def _set_fields(self, junction_id, fields, delta):
+        junction = self._junction(junction_id)
+        changed = {}
+        for key, value in fields.items():
+            old = junction.get(key)
+            if old == value:
+                continue
+            if isinstance(value, dict) and isinstance(old, dict):
+                # Nested dicts (lanes) are diffed too; a removed key is sent as None
+                changed[key] = {k: v for k, v in value.items() if old.get(k) != v}
+                changed[key].update({k: None for k in old if k not in value})
+            else:
+                changed[key] = copy.deepcopy(value)
+            junction[key] = value
+        if changed:
+            delta.setdefault("junctions", {})[junction_id] = changed
+
+    def apply_reading(self, camera_id, junction_id, res):
+        """
+        Records one camera's latest detection result for its junction;
+        res=None means the camera stopped and its reading no longer counts.
+        """
+        with self._lock:
+            previous = self._readings.get(camera_id)
+            if res is None:
+                if previous is None:
+                    return
+                del self._readings[camera_id]
+            else:
+                self._readings[camera_id] = (junction_id, res.get("count", 0),
+                                             dict(res.get("lane_data") or {}), bool(res.get("emergency")))
+            delta = {}
+            for jid in {junction_id, previous[0] if previous else junction_id}:
+                self._recompute(jid, delta)
+            self._publish(delta)
+
+    def _recompute(self, junction_id, delta):
+        readings = [r for r in self._readings.values() if r[0] == junction_id]
+        lanes = {}
+        for _, _, lane_counts, _ in readings:
+            for lane, count in lane_counts.items():
+                lanes[lane] = lanes.get(lane, 0) + count
+        self._set_fields(junction_id, {
+            "density": sum(r[1] for r in readings),
+            "lanes": lanes,
+            "emergency": any(r[3] for r in readings),
+        }, delta)
+
+    def override(self, junction_id, action, mode):
+        """Manual signal override: this junction gets `action`, every other one red."""
+        with self._lock:
+            if junction_id not in self._state["junctions"]:
+                raise KeyError(junction_id)
+            delta = {}
+            if self._state["mode"] != mode:
+                self._state["mode"] = delta["mode"] = mode
+            for jid in self._state["junctions"]:
+                self._set_fields(jid, {"status": action if jid == junction_id else "red"}, delta)
+            self._publish(delta)
+
+    # ---------- reads ----------
+
+    def snapshot(self):
+        with self._lock:
+            return {**copy.deepcopy(self._state), "version": self.version}
+
+    def subscribe(self):
+        """Returns (subscriber, full state at subscription time)."""
+        sub = StateSubscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+            return sub, {**copy.deepcopy(self._state), "version": self.version}
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
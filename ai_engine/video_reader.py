@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from metrics import FRAMES_DROPPED, observe_stage
+
+# slot: ring index to hand back via release(); gap: source frames since the previous packet
+FramePacket = namedtuple("FramePacket", ["slot", "index", "timestamp_ms", "frame", "gap"])
+
+
+class PrefetchReader:
+    """
+    Decodes a video ahead of the detector on a background thread.
+
+    Frames land in a fixed ring of preallocated buffers; consumers get a
+    FramePacket (frame index + timestamp) and must `release()` it once the
+    buffer is no longer needed so the slot can be reused.
+    If a FrameSampler is given, frames it skips are only grabbed, not decoded.
+
+    Counters:
+      - underruns: consumer asked for a frame and had to wait for decode
+      - overruns:  decoder filled the ring and had to wait (or drop, when
+                   drop_when_full=True) for the consumer
+    """
+
+    def __init__(self, source, ring_size=16, sampler=None, drop_when_full=False):
+        self.source = source
+        self.ring_size = ring_size
+        self.sampler = sampler
+        self.drop_when_full = drop_when_full
+
+        self.cap = cv2.VideoCapture(source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # 0 when the container does not report it (live streams, some codecs)
+        self.frame_count = max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0))
+        if sampler is not None:
+            sampler.set_source_fps(self.fps)
+
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width > 0 and height > 0:
+            self._ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(ring_size)]
+        else:
+            self._ring = [None] * ring_size  # allocated by the first read into each slot
+
+        self._free = deque(range(ring_size))
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._stop = False
+        self._thread = None
+
+        self.decoded = 0
+        self.grabbed = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="prefetch-reader")
+            self._thread.start()
+        return self
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    # ---------- producer ----------
+
+    def _acquire_slot(self):
+        with self._cond:
+            if not self._free:
+                self.overruns += 1
+                if self.drop_when_full and self._ready:
+                    oldest = self._ready.popleft()
+                    self.dropped += 1
+                    FRAMES_DROPPED.inc(reason="ring_overrun")
+                    return oldest.slot
+                while not self._free and not self._stop:
+                    self._cond.wait(0.1)
+                if self._stop:
+                    return None
+            return self._free.popleft()
+
+    def _run(self):
+        index = 0
+        try:
+            while not self._stop and self.cap.isOpened():
+                if self.sampler is not None and not self.sampler.should_analyse(index):
+                    if not self.cap.grab():
+                        break
+                    self.grabbed += 1
+                    FRAMES_DROPPED.inc(reason="sampled")
+                    index += 1
+                    continue
+
+                slot = self._acquire_slot()
+                if slot is None:
+                    break
+                start = time.perf_counter()
+                ok, frame = self.cap.read(self._ring[slot])
+                observe_stage("decode", time.perf_counter() - start)
+                if not ok:
+                    with self._cond:
+                        self._free.append(slot)
+                    break
+                # read() only reuses the buffer when the shape matches
+                self._ring[slot] = frame
+                gap = self.sampler.mark(index) if self.sampler is not None else 1
+                packet = FramePacket(slot, index, self.cap.get(cv2.CAP_PROP_POS_MSEC), frame, gap)
+                with self._cond:
+                    self._ready.append(packet)
+                    self.decoded += 1
+                    self._cond.notify_all()
+                index += 1
+        finally:
+            self.cap.release()
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    # ---------- consumer ----------
+
+    def read(self, timeout=None):
+        """Returns the next FramePacket, or None at end of stream / on stop."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._ready and not self._eof:
+                self.underruns += 1
+            while not self._ready and not self._eof and not self._stop:
+                remaining = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if self._ready:
+                return self._ready.popleft()
+            return None
+
+    @property
+    def finished(self):
+        with self._cond:
+            return self._eof and not self._ready
+
+    def release(self, packet):
+        with self._cond:
+            self._free.append(packet.slot)
+            self._cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            packet = self.read()
+            if packet is None:
+                return
+            yield packet
+
+    def stop(self, wait=True):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            if wait:
+                self._thread.join(timeout=1.0)
+        else:
+            self.cap.release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "decoded": self.decoded,
+                "grabbed": self.grabbed,
+                "buffered": len(self._ready),
+                "ring_size": self.ring_size,
+                "underruns": self.underruns,
+                "overruns": self.overruns,
+                "dropped": self.dropped,
+            }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()